@@ -134,6 +134,35 @@ class TurboTextToImageBenchmark(TextToImageBenchmark):
         )
 
 
+class DeepCacheTextToImageBenchmark(TextToImageBenchmark):
+    def __init__(self, args):
+        super().__init__(args)
+        # reference images without DeepCache, to measure the quality of the cached ones
+        self.reference_images = self.generate_images(args)
+        self.pipe.enable_deep_cache(cache_interval=args.cache_interval, cache_block_id=args.cache_block_id)
+
+    def generate_images(self, args):
+        return self.pipe(
+            prompt=PROMPT,
+            num_inference_steps=args.num_inference_steps,
+            num_images_per_prompt=args.batch_size,
+            generator=torch.manual_seed(0),
+            output_type="pt",
+        ).images
+
+    def get_result_filepath(self, args):
+        filepath = super().get_result_filepath(args)
+        return filepath.replace(".csv", f"-deepcache@{args.cache_interval}_{args.cache_block_id}.csv")
+
+    def benchmark(self, args):
+        super().benchmark(args)
+
+        images = self.generate_images(args)
+        mse = ((images.float() - self.reference_images.float()) ** 2).mean()
+        psnr = 10 * torch.log10(1.0 / mse)
+        print(f"PSNR against the images generated without DeepCache: {psnr.item():.2f} dB")
+
+
 class LCMLoRATextToImageBenchmark(TextToImageBenchmark):
     lora_id = "latent-consistency/lcm-lora-sdxl"
 
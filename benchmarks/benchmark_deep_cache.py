@@ -0,0 +1,31 @@
+import argparse
+import sys
+
+
+sys.path.append(".")
+from base_classes import DeepCacheTextToImageBenchmark  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--ckpt",
+        type=str,
+        default="runwayml/stable-diffusion-v1-5",
+        choices=["runwayml/stable-diffusion-v1-5", "stabilityai/stable-diffusion-xl-base-1.0"],
+    )
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--num_inference_steps", type=int, default=50)
+    parser.add_argument("--model_cpu_offload", action="store_true")
+    parser.add_argument("--run_compile", action="store_true")
+    parser.add_argument("--cache_interval", type=int, default=3)
+    parser.add_argument("--cache_block_id", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.run_compile:
+        # full and shallow steps run different parts of the UNet, which can't be captured in a single graph
+        print("DeepCache is not compatible with `fullgraph=True` compilation, running without `torch.compile`.")
+        args.run_compile = False
+
+    benchmark_pipe = DeepCacheTextToImageBenchmark(args)
+    benchmark_pipe.benchmark(args)
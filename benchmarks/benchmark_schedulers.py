@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+
+import torch
+import torch.utils.benchmark as benchmark
+
+from diffusers import (
+    DEISMultistepScheduler,
+    DPMSolverMultistepScheduler,
+    SASolverScheduler,
+    UniPCMultistepScheduler,
+)
+
+
+sys.path.append(".")
+from utils import (  # noqa: E402
+    BASE_PATH,
+    BenchmarkInfo,
+    bytes_to_giga_bytes,
+    flush,
+    generate_csv_dict,
+    write_to_csv,
+)
+
+
+# what `_build_solver_coefficients` returns when no coefficient table is built, in which case `step` falls back to
+# the per-step update methods
+SCHEDULERS_WITHOUT_TABLES = {
+    DPMSolverMultistepScheduler: None,
+    DEISMultistepScheduler: None,
+    UniPCMultistepScheduler: (None, None),
+    SASolverScheduler: (None, None),
+}
+
+
+def run_denoising_loop(scheduler, sample, model_output, num_inference_steps):
+    scheduler.set_timesteps(num_inference_steps, device=sample.device)
+    for t in scheduler.timesteps:
+        sample = scheduler.step(model_output, t, sample).prev_sample
+    return sample
+
+
+def benchmark_scheduler(scheduler_cls, args, use_coefficient_table):
+    scheduler = scheduler_cls.from_pretrained(args.ckpt, subfolder="scheduler")
+    if not use_coefficient_table:
+        no_table = SCHEDULERS_WITHOUT_TABLES[scheduler_cls]
+        scheduler._build_solver_coefficients = lambda: no_table
+
+    is_cuda = torch.device(args.device).type == "cuda"
+    dtype = torch.float16 if is_cuda else torch.float32
+    generator = torch.Generator(args.device).manual_seed(0)
+    shape = (args.batch_size, 4, args.height // 8, args.width // 8)
+    sample = torch.randn(shape, generator=generator, device=args.device, dtype=dtype)
+    model_output = torch.randn(shape, generator=generator, device=args.device, dtype=dtype)
+
+    if is_cuda:
+        flush()
+    timer = benchmark.Timer(
+        stmt="run_denoising_loop(scheduler, sample, model_output, num_inference_steps)",
+        globals={
+            "run_denoising_loop": run_denoising_loop,
+            "scheduler": scheduler,
+            "sample": sample,
+            "model_output": model_output,
+            "num_inference_steps": args.num_inference_steps,
+        },
+        num_threads=torch.get_num_threads(),
+    )
+    # scheduler overhead per denoising step, including `set_timesteps`
+    time = f"{(timer.blocked_autorange().mean / args.num_inference_steps):.6f}"
+    memory = bytes_to_giga_bytes(torch.cuda.max_memory_allocated() if is_cuda else 0)
+    benchmark_info = BenchmarkInfo(time=time, memory=memory)
+
+    variant = "coefficient_table" if use_coefficient_table else "update_methods"
+    print(f"[INFO] {scheduler_cls.__name__} ({variant}) on {args.device}: {time} secs per step")
+
+    csv_dict = generate_csv_dict(
+        pipeline_cls=f"{scheduler_cls.__name__}-{variant}", ckpt=args.ckpt, args=args, benchmark_info=benchmark_info
+    )
+    name = (
+        args.ckpt.replace("/", "_")
+        + "_"
+        + f"{scheduler_cls.__name__}-{variant}-{args.device}-bs@{args.batch_size}-steps@{args.num_inference_steps}.csv"
+    )
+    filepath = os.path.join(BASE_PATH, name)
+    write_to_csv(filepath, csv_dict)
+    print(f"Logs written to: {filepath}")
+    if is_cuda:
+        flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ckpt", type=str, default="runwayml/stable-diffusion-v1-5")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--num_inference_steps", type=int, default=25)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--device", type=str, default="cuda", help="The device to run the schedulers on.")
+    parser.add_argument("--model_cpu_offload", action="store_true")
+    parser.add_argument("--run_compile", action="store_true")
+    args = parser.parse_args()
+
+    if args.run_compile or args.model_cpu_offload:
+        # only the scheduler is benchmarked, there is no model to compile or offload
+        print("Scheduler benchmarks don't run a model, running without `torch.compile` and model CPU offloading.")
+        args.run_compile = False
+        args.model_cpu_offload = False
+
+    for scheduler_cls in SCHEDULERS_WITHOUT_TABLES:
+        for use_coefficient_table in [False, True]:
+            benchmark_scheduler(scheduler_cls, args, use_coefficient_table)
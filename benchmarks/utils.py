@@ -25,7 +25,13 @@ BENCHMARK_FIELDS = [
 
 PROMPT = "ghibli style, a fantasy landscape with castles"
 BASE_PATH = os.getenv("BASE_PATH", ".")
-TOTAL_GPU_MEMORY = float(os.getenv("TOTAL_GPU_MEMORY", torch.cuda.get_device_properties(0).total_memory / (1024**3)))
+# CPU-only benchmarks, like the scheduler ones, report no GPU memory
+TOTAL_GPU_MEMORY = float(
+    os.getenv(
+        "TOTAL_GPU_MEMORY",
+        torch.cuda.get_device_properties(0).total_memory / (1024**3) if torch.cuda.is_available() else 0,
+    )
+)
 
 REPO_ID = "diffusers/benchmarks"
 FINAL_CSV_FILE = "collated_results.csv"
@@ -33,6 +33,7 @@ from accelerate.logging import get_logger
 from accelerate.state import AcceleratorState
 from accelerate.utils import ProjectConfiguration, set_seed
 from datasets import load_dataset
+from datasets.fingerprint import Hasher
 from huggingface_hub import create_repo, upload_folder
 from packaging import version
 from torchvision import transforms
@@ -42,8 +43,9 @@ from transformers.utils import ContextManagers
 
 import diffusers
 from diffusers import AutoencoderKL, DDPMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
 from diffusers.optimization import get_scheduler
-from diffusers.training_utils import EMAModel, compute_snr
+from diffusers.training_utils import EMAModel, build_encoded_dataset_cache, compute_snr
 from diffusers.utils import check_min_version, deprecate, is_wandb_available, make_image_grid
 from diffusers.utils.import_utils import is_xformers_available
 from diffusers.utils.torch_utils import is_compiled_module
@@ -62,6 +64,24 @@ DATASET_NAME_MAPPING = {
     "lambdalabs/pokemon-blip-captions": ("image", "text"),
 }
 
+# arguments the samples of the `--encoded_cache_dir` cache depend on, the cache is rebuilt when one of them changes
+ENCODED_CACHE_ARGS = [
+    "pretrained_model_name_or_path",
+    "revision",
+    "variant",
+    "dataset_name",
+    "dataset_config_name",
+    "train_data_dir",
+    "image_column",
+    "caption_column",
+    "max_train_samples",
+    "seed",
+    "resolution",
+    "center_crop",
+    "random_flip",
+    "mixed_precision",
+]
+
 
 def save_model_card(
     args,
@@ -368,6 +388,14 @@ def parse_args():
         ),
     )
     parser.add_argument("--use_ema", action="store_true", help="Whether to use EMA model.")
+    parser.add_argument(
+        "--foreach_ema", action="store_true", help="Update the EMA model with fused multi-tensor operations."
+    )
+    parser.add_argument(
+        "--offload_ema",
+        action="store_true",
+        help="Keep the EMA model in pinned CPU memory and update it asynchronously to save GPU memory.",
+    )
     parser.add_argument(
         "--non_ema_revision",
         type=str,
@@ -378,6 +406,16 @@ def parse_args():
             " remote repository specified with --pretrained_model_name_or_path."
         ),
     )
+    parser.add_argument(
+        "--encoded_cache_dir",
+        type=str,
+        default=None,
+        help=(
+            "Directory of a memory-mapped cache of the VAE moments and text embeddings of the dataset. The cache is"
+            " built on the first run and reused afterwards, so the image augmentations are only applied once. It is"
+            " rebuilt when the model, dataset or preprocessing arguments change."
+        ),
+    )
     parser.add_argument(
         "--dataloader_num_workers",
         type=int,
@@ -595,7 +633,13 @@ def main():
         ema_unet = UNet2DConditionModel.from_pretrained(
             args.pretrained_model_name_or_path, subfolder="unet", revision=args.revision, variant=args.variant
         )
-        ema_unet = EMAModel(ema_unet.parameters(), model_cls=UNet2DConditionModel, model_config=ema_unet.config)
+        ema_unet = EMAModel(
+            ema_unet.parameters(),
+            model_cls=UNet2DConditionModel,
+            model_config=ema_unet.config,
+            foreach=args.foreach_ema,
+            async_update=args.offload_ema,
+        )
 
     if args.enable_xformers_memory_efficient_attention:
         if is_xformers_available():
@@ -628,7 +672,10 @@ def main():
             if args.use_ema:
                 load_model = EMAModel.from_pretrained(os.path.join(input_dir, "unet_ema"), UNet2DConditionModel)
                 ema_unet.load_state_dict(load_model.state_dict())
-                ema_unet.to(accelerator.device)
+                if args.offload_ema:
+                    ema_unet.pin_memory()
+                else:
+                    ema_unet.to(accelerator.device)
                 del load_model
 
             for i in range(len(models)):
@@ -775,11 +822,38 @@ def main():
         input_ids = torch.stack([example["input_ids"] for example in examples])
         return {"pixel_values": pixel_values, "input_ids": input_ids}
 
+    if args.encoded_cache_dir is not None:
+        # Encode the dataset once, the cached samples are tensors sharing memory with the cache files
+        vae.to(accelerator.device)
+        text_encoder.to(accelerator.device)
+
+        def encode_fn(batch):
+            with torch.no_grad():
+                latent_dist = vae.encode(batch["pixel_values"].to(accelerator.device)).latent_dist
+                encoder_hidden_states = text_encoder(batch["input_ids"].to(accelerator.device), return_dict=False)[0]
+            return {
+                "latent_moments": latent_dist.parameters.cpu(),
+                "encoder_hidden_states": encoder_hidden_states.cpu(),
+            }
+
+        # an existing cache is only reused if it was built from the same models, data and preprocessing
+        fingerprint = Hasher.hash({key: getattr(args, key) for key in ENCODED_CACHE_ARGS})
+        with accelerator.main_process_first():
+            encode_dataloader = torch.utils.data.DataLoader(
+                train_dataset,
+                collate_fn=collate_fn,
+                batch_size=args.train_batch_size,
+                num_workers=args.dataloader_num_workers,
+            )
+            train_dataset = build_encoded_dataset_cache(
+                args.encoded_cache_dir, encode_dataloader, encode_fn, fingerprint=fingerprint
+            )
+
     # DataLoaders creation:
     train_dataloader = torch.utils.data.DataLoader(
         train_dataset,
         shuffle=True,
-        collate_fn=collate_fn,
+        collate_fn=collate_fn if args.encoded_cache_dir is None else None,
         batch_size=args.train_batch_size,
         num_workers=args.dataloader_num_workers,
     )
@@ -804,7 +878,10 @@ def main():
     )
 
     if args.use_ema:
-        ema_unet.to(accelerator.device)
+        if args.offload_ema:
+            ema_unet.pin_memory()
+        else:
+            ema_unet.to(accelerator.device)
 
     # For mixed precision training we cast all non-trainable weigths (vae, non-lora text_encoder and non-lora unet) to half-precision
     # as these weights are only used for inference, keeping weights in full precision is not required.
@@ -894,7 +971,10 @@ def main():
         for step, batch in enumerate(train_dataloader):
             with accelerator.accumulate(unet):
                 # Convert images to latent space
-                latents = vae.encode(batch["pixel_values"].to(weight_dtype)).latent_dist.sample()
+                if "latent_moments" in batch:
+                    latents = DiagonalGaussianDistribution(batch["latent_moments"].to(weight_dtype)).sample()
+                else:
+                    latents = vae.encode(batch["pixel_values"].to(weight_dtype)).latent_dist.sample()
                 latents = latents * vae.config.scaling_factor
 
                 # Sample noise that we'll add to the latents
@@ -919,7 +999,10 @@ def main():
                     noisy_latents = noise_scheduler.add_noise(latents, noise, timesteps)
 
                 # Get the text embedding for conditioning
-                encoder_hidden_states = text_encoder(batch["input_ids"], return_dict=False)[0]
+                if "encoder_hidden_states" in batch:
+                    encoder_hidden_states = batch["encoder_hidden_states"].to(weight_dtype)
+                else:
+                    encoder_hidden_states = text_encoder(batch["input_ids"], return_dict=False)[0]
 
                 # Get the target for loss depending on the prediction type
                 if args.prediction_type is not None:
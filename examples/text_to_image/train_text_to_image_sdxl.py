@@ -45,8 +45,9 @@ from transformers import AutoTokenizer, PretrainedConfig
 
 import diffusers
 from diffusers import AutoencoderKL, DDPMScheduler, StableDiffusionXLPipeline, UNet2DConditionModel
+from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
 from diffusers.optimization import get_scheduler
-from diffusers.training_utils import EMAModel, compute_snr
+from diffusers.training_utils import EMAModel, build_encoded_dataset_cache, compute_snr
 from diffusers.utils import check_min_version, is_wandb_available
 from diffusers.utils.import_utils import is_xformers_available
 from diffusers.utils.torch_utils import is_compiled_module
@@ -62,6 +63,26 @@ DATASET_NAME_MAPPING = {
     "lambdalabs/pokemon-blip-captions": ("image", "text"),
 }
 
+# arguments the samples of the `--encoded_cache_dir` cache depend on, the cache is rebuilt when one of them changes
+ENCODED_CACHE_ARGS = [
+    "pretrained_model_name_or_path",
+    "pretrained_vae_model_name_or_path",
+    "revision",
+    "variant",
+    "dataset_name",
+    "dataset_config_name",
+    "train_data_dir",
+    "image_column",
+    "caption_column",
+    "max_train_samples",
+    "seed",
+    "resolution",
+    "center_crop",
+    "random_flip",
+    "proportion_empty_prompts",
+    "mixed_precision",
+]
+
 
 def save_model_card(
     repo_id: str,
@@ -392,6 +413,16 @@ def parse_args(input_args=None):
             " https://pytorch.org/docs/stable/notes/cuda.html#tensorfloat-32-tf32-on-ampere-devices"
         ),
     )
+    parser.add_argument(
+        "--encoded_cache_dir",
+        type=str,
+        default=None,
+        help=(
+            "Directory of a memory-mapped cache of the VAE moments and prompt embeddings of the dataset. The cache is"
+            " built on the first run and reused afterwards, latents are sampled from the cached moments at every step."
+            " It is rebuilt when the model, dataset or preprocessing arguments change."
+        ),
+    )
     parser.add_argument(
         "--dataloader_num_workers",
         type=int,
@@ -877,26 +908,60 @@ def main(args):
         caption_column=args.caption_column,
     )
     compute_vae_encodings_fn = functools.partial(compute_vae_encodings, vae=vae)
-    with accelerator.main_process_first():
-        from datasets.fingerprint import Hasher
-
-        # fingerprint used by the cache for the other processes to load the result
-        # details: https://github.com/huggingface/diffusers/pull/4038#discussion_r1266078401
-        new_fingerprint = Hasher.hash(args)
-        new_fingerprint_for_vae = Hasher.hash("vae")
-        train_dataset = train_dataset.map(compute_embeddings_fn, batched=True, new_fingerprint=new_fingerprint)
-        train_dataset = train_dataset.map(
-            compute_vae_encodings_fn,
-            batched=True,
-            batch_size=args.train_batch_size * accelerator.num_processes * args.gradient_accumulation_steps,
-            new_fingerprint=new_fingerprint_for_vae,
-        )
+    vae_scaling_factor = vae.config.scaling_factor
+    if args.encoded_cache_dir is not None:
+
+        def encode_fn(batch):
+            encoded = compute_embeddings_fn(batch)
+            pixel_values = torch.stack(batch["pixel_values"]).to(vae.device, dtype=vae.dtype)
+            with torch.no_grad():
+                encoded["latent_moments"] = vae.encode(pixel_values).latent_dist.parameters.cpu()
+            encoded["original_sizes"] = torch.tensor(batch["original_sizes"])
+            encoded["crop_top_lefts"] = torch.tensor(batch["crop_top_lefts"])
+            return encoded
+
+        with accelerator.main_process_first():
+            from datasets.fingerprint import Hasher
+
+            # an existing cache is only reused if it was built from the same models, data and preprocessing
+            fingerprint = Hasher.hash({key: getattr(args, key) for key in ENCODED_CACHE_ARGS})
+            encode_dataloader = torch.utils.data.DataLoader(
+                train_dataset,
+                collate_fn=lambda examples: {k: [example[k] for example in examples] for k in examples[0]},
+                batch_size=args.train_batch_size * accelerator.num_processes * args.gradient_accumulation_steps,
+                num_workers=args.dataloader_num_workers,
+            )
+            train_dataset = build_encoded_dataset_cache(
+                args.encoded_cache_dir, encode_dataloader, encode_fn, fingerprint=fingerprint
+            )
+    else:
+        with accelerator.main_process_first():
+            from datasets.fingerprint import Hasher
+
+            # fingerprint used by the cache for the other processes to load the result
+            # details: https://github.com/huggingface/diffusers/pull/4038#discussion_r1266078401
+            new_fingerprint = Hasher.hash(args)
+            new_fingerprint_for_vae = Hasher.hash("vae")
+            train_dataset = train_dataset.map(compute_embeddings_fn, batched=True, new_fingerprint=new_fingerprint)
+            train_dataset = train_dataset.map(
+                compute_vae_encodings_fn,
+                batched=True,
+                batch_size=args.train_batch_size * accelerator.num_processes * args.gradient_accumulation_steps,
+                new_fingerprint=new_fingerprint_for_vae,
+            )
 
     del text_encoders, tokenizers, vae
     gc.collect()
     torch.cuda.empty_cache()
 
     def collate_fn(examples):
+        if args.encoded_cache_dir is not None:
+            # the cached samples are tensors sharing memory with the cache files
+            batch = torch.utils.data.default_collate(examples)
+            batch["original_sizes"] = [tuple(size) for size in batch["original_sizes"].tolist()]
+            batch["crop_top_lefts"] = [tuple(crop) for crop in batch["crop_top_lefts"].tolist()]
+            return batch
+
         model_input = torch.stack([torch.tensor(example["model_input"]) for example in examples])
         original_sizes = [example["original_sizes"] for example in examples]
         crop_top_lefts = [example["crop_top_lefts"] for example in examples]
@@ -1011,7 +1076,11 @@ def main(args):
         for step, batch in enumerate(train_dataloader):
             with accelerator.accumulate(unet):
                 # Sample noise that we'll add to the latents
-                model_input = batch["model_input"].to(accelerator.device)
+                if "latent_moments" in batch:
+                    latent_dist = DiagonalGaussianDistribution(batch["latent_moments"].to(accelerator.device))
+                    model_input = latent_dist.sample() * vae_scaling_factor
+                else:
+                    model_input = batch["model_input"].to(accelerator.device)
                 noise = torch.randn_like(model_input)
                 if args.noise_offset:
                     # https://www.crosslabs.org//blog/diffusion-with-offset-noise
@@ -11,7 +11,6 @@ from .utils import (
     is_librosa_available,
     is_note_seq_available,
     is_onnx_available,
-    is_scipy_available,
     is_torch_available,
     is_torchsde_available,
     is_transformers_available,
@@ -114,19 +113,23 @@ else:
             "AutoPipelineForImage2Image",
             "AutoPipelineForInpainting",
             "AutoPipelineForText2Image",
+            "CompileManager",
             "ConsistencyModelPipeline",
             "DanceDiffusionPipeline",
             "DDIMPipeline",
             "DDPMPipeline",
             "DiffusionPipeline",
             "DiTPipeline",
+            "GuidancePolicy",
             "ImagePipelineOutput",
             "KarrasVePipeline",
             "LDMPipeline",
             "LDMSuperResolutionPipeline",
             "PNDMPipeline",
+            "PromptEmbedsCache",
             "RePaintPipeline",
             "ScoreSdeVePipeline",
+            "StaticDenoisingLoop",
         ]
     )
     _import_structure["schedulers"].extend(
@@ -151,6 +154,7 @@ else:
             "KDPM2AncestralDiscreteScheduler",
             "KDPM2DiscreteScheduler",
             "LCMScheduler",
+            "LMSDiscreteScheduler",
             "PNDMScheduler",
             "RePaintScheduler",
             "SASolverScheduler",
@@ -163,18 +167,6 @@ else:
     )
     _import_structure["training_utils"] = ["EMAModel"]
 
-try:
-    if not (is_torch_available() and is_scipy_available()):
-        raise OptionalDependencyNotAvailable()
-except OptionalDependencyNotAvailable:
-    from .utils import dummy_torch_and_scipy_objects  # noqa F403
-
-    _import_structure["utils.dummy_torch_and_scipy_objects"] = [
-        name for name in dir(dummy_torch_and_scipy_objects) if not name.startswith("_")
-    ]
-
-else:
-    _import_structure["schedulers"].extend(["LMSDiscreteScheduler"])
 
 try:
     if not (is_torch_available() and is_torchsde_available()):
@@ -495,19 +487,23 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
             BlipDiffusionControlNetPipeline,
             BlipDiffusionPipeline,
             CLIPImageProjection,
+            CompileManager,
             ConsistencyModelPipeline,
             DanceDiffusionPipeline,
             DDIMPipeline,
             DDPMPipeline,
             DiffusionPipeline,
             DiTPipeline,
+            GuidancePolicy,
             ImagePipelineOutput,
             KarrasVePipeline,
             LDMPipeline,
             LDMSuperResolutionPipeline,
             PNDMPipeline,
+            PromptEmbedsCache,
             RePaintPipeline,
             ScoreSdeVePipeline,
+            StaticDenoisingLoop,
         )
         from .schedulers import (
             AmusedScheduler,
@@ -530,6 +526,7 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
             KDPM2AncestralDiscreteScheduler,
             KDPM2DiscreteScheduler,
             LCMScheduler,
+            LMSDiscreteScheduler,
             PNDMScheduler,
             RePaintScheduler,
             SASolverScheduler,
@@ -541,14 +538,6 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
         )
         from .training_utils import EMAModel
 
-    try:
-        if not (is_torch_available() and is_scipy_available()):
-            raise OptionalDependencyNotAvailable()
-    except OptionalDependencyNotAvailable:
-        from .utils.dummy_torch_and_scipy_objects import *  # noqa F403
-    else:
-        from .schedulers import LMSDiscreteScheduler
-
     try:
         if not (is_torch_available() and is_torchsde_available()):
             raise OptionalDependencyNotAvailable()
@@ -1 +1,2 @@
+from .continuous_batching import ContinuousBatchingEngine, ContinuousBatchingOutput
 from .rl import ValueGuidedRLPipeline
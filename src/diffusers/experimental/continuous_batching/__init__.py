@@ -0,0 +1 @@
+from .continuous_batching import ContinuousBatchingEngine, ContinuousBatchingOutput
@@ -0,0 +1,385 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import itertools
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import PIL.Image
+import torch
+
+from ...pipelines import DiffusionPipeline
+from ...pipelines.stable_diffusion.pipeline_stable_diffusion import rescale_noise_cfg, retrieve_timesteps
+from ...utils import BaseOutput, logging
+from ...utils.torch_utils import randn_tensor
+
+
+logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+@dataclass
+class ContinuousBatchingOutput(BaseOutput):
+    """
+    Output class for a request completed by the [`ContinuousBatchingEngine`].
+
+    Args:
+        request_id (`str`):
+            The identifier returned by [`~ContinuousBatchingEngine.add_request`].
+        images (`List[PIL.Image.Image]`, `np.ndarray` or `torch.FloatTensor`):
+            The generated images of the request, in the `output_type` requested.
+        nsfw_content_detected (`List[bool]`, *optional*):
+            List indicating whether the corresponding generated image contains "not-safe-for-work" (nsfw) content or
+            `None` if safety checking could not be performed.
+    """
+
+    request_id: str
+    images: Union[List[PIL.Image.Image], np.ndarray, torch.FloatTensor]
+    nsfw_content_detected: Optional[List[bool]]
+
+
+class _RequestState:
+    """Everything that is private to a single request: its latents, conditioning and its own scheduler copy."""
+
+    def __init__(
+        self,
+        request_id,
+        scheduler,
+        timesteps,
+        latents,
+        prompt_embeds,
+        guidance_scale,
+        guidance_rescale,
+        do_classifier_free_guidance,
+        timestep_cond,
+        extra_step_kwargs,
+        generator,
+        output_type,
+    ):
+        self.request_id = request_id
+        self.scheduler = scheduler
+        self.timesteps = timesteps
+        self.latents = latents
+        self.prompt_embeds = prompt_embeds
+        self.guidance_scale = guidance_scale
+        self.guidance_rescale = guidance_rescale
+        self.do_classifier_free_guidance = do_classifier_free_guidance
+        self.timestep_cond = timestep_cond
+        self.extra_step_kwargs = extra_step_kwargs
+        self.generator = generator
+        self.output_type = output_type
+        self.step_index = 0
+
+    @property
+    def num_rows(self):
+        # number of rows this request contributes to a packed UNet batch
+        return self.latents.shape[0] * (2 if self.do_classifier_free_guidance else 1)
+
+    @property
+    def is_finished(self):
+        return self.step_index >= len(self.timesteps)
+
+
+class ContinuousBatchingEngine:
+    r"""
+    Request-level scheduler that runs many generation requests through a single Stable Diffusion pipeline.
+
+    New requests are admitted between denoising steps. Every request keeps its own latents, timestep index and a
+    private copy of the pipeline's scheduler, so requests with different numbers of inference steps, guidance scales
+    and prompts can share a batch. At every tick all active requests with the same latent shape are packed into a
+    single UNet forward pass, and requests that reach the end of their schedule are decoded and returned right away.
+
+    <Tip warning={true}>
+
+    This API is 🧪 experimental.
+
+    </Tip>
+
+    Args:
+        pipeline ([`DiffusionPipeline`]):
+            A text-to-image pipeline exposing `encode_prompt`, `unet`, `vae`, `scheduler` and `image_processor`, such
+            as [`StableDiffusionPipeline`].
+        max_batch_size (`int`, *optional*, defaults to 8):
+            The maximum number of rows passed to the UNet in a single forward pass. A request using classifier free
+            guidance counts twice per generated image.
+    """
+
+    def __init__(self, pipeline: DiffusionPipeline, max_batch_size: int = 8):
+        for name in ["unet", "vae", "scheduler", "image_processor"]:
+            if getattr(pipeline, name, None) is None:
+                raise ValueError(f"`pipeline` must define `{name}` to be used with {self.__class__.__name__}.")
+
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+
+        self._waiting = deque()
+        self._running: "OrderedDict[str, _RequestState]" = OrderedDict()
+        self._request_counter = itertools.count()
+
+    @property
+    def num_waiting_requests(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def num_running_requests(self) -> int:
+        return len(self._running)
+
+    def has_unfinished_requests(self) -> bool:
+        return len(self._waiting) > 0 or len(self._running) > 0
+
+    @torch.no_grad()
+    def add_request(
+        self,
+        prompt: Union[str, List[str]] = None,
+        height: Optional[int] = None,
+        width: Optional[int] = None,
+        num_inference_steps: int = 50,
+        timesteps: List[int] = None,
+        guidance_scale: float = 7.5,
+        negative_prompt: Optional[Union[str, List[str]]] = None,
+        num_images_per_prompt: int = 1,
+        eta: float = 0.0,
+        generator: Optional[Union[torch.Generator, List[torch.Generator]]] = None,
+        latents: Optional[torch.FloatTensor] = None,
+        prompt_embeds: Optional[torch.FloatTensor] = None,
+        negative_prompt_embeds: Optional[torch.FloatTensor] = None,
+        output_type: Optional[str] = "pil",
+        guidance_rescale: float = 0.0,
+        clip_skip: Optional[int] = None,
+        request_id: Optional[str] = None,
+    ) -> str:
+        r"""
+        Encodes the prompt of a new request, prepares its latents and queues it for admission at the next step.
+
+        The arguments have the same meaning as in [`StableDiffusionPipeline.__call__`].
+
+        Returns:
+            `str`: The identifier of the request, which is reported back in its [`ContinuousBatchingOutput`].
+        """
+        pipe = self.pipeline
+
+        height = height or pipe.unet.config.sample_size * pipe.vae_scale_factor
+        width = width or pipe.unet.config.sample_size * pipe.vae_scale_factor
+        pipe.check_inputs(prompt, height, width, None, negative_prompt, prompt_embeds, negative_prompt_embeds)
+
+        if request_id is None:
+            request_id = str(next(self._request_counter))
+        if request_id in self._running or any(state.request_id == request_id for state in self._waiting):
+            raise ValueError(f"A request with id {request_id} is already queued.")
+
+        if prompt is not None and isinstance(prompt, str):
+            batch_size = 1
+        elif prompt is not None and isinstance(prompt, list):
+            batch_size = len(prompt)
+        else:
+            batch_size = prompt_embeds.shape[0]
+
+        device = pipe._execution_device
+        do_classifier_free_guidance = guidance_scale > 1 and pipe.unet.config.time_cond_proj_dim is None
+
+        encoded = pipe.encode_prompt(
+            prompt,
+            device,
+            num_images_per_prompt,
+            do_classifier_free_guidance,
+            negative_prompt,
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_prompt_embeds,
+            clip_skip=clip_skip,
+        )
+        if len(encoded) != 2:
+            raise ValueError(
+                f"{self.__class__.__name__} only supports pipelines whose `encode_prompt` returns"
+                " `(prompt_embeds, negative_prompt_embeds)`."
+            )
+        prompt_embeds, negative_prompt_embeds = encoded
+        if do_classifier_free_guidance:
+            prompt_embeds = torch.cat([negative_prompt_embeds, prompt_embeds])
+
+        # every request owns its scheduler so that step indices and solver history never leak between requests
+        scheduler = copy.deepcopy(pipe.scheduler)
+        timesteps, num_inference_steps = retrieve_timesteps(scheduler, num_inference_steps, device, timesteps)
+
+        shape = (
+            batch_size * num_images_per_prompt,
+            pipe.unet.config.in_channels,
+            height // pipe.vae_scale_factor,
+            width // pipe.vae_scale_factor,
+        )
+        if isinstance(generator, list) and len(generator) != shape[0]:
+            raise ValueError(
+                f"You have passed a list of generators of length {len(generator)}, but requested an effective batch"
+                f" size of {shape[0]}. Make sure the batch size matches the length of the generators."
+            )
+        if latents is None:
+            latents = randn_tensor(shape, generator=generator, device=device, dtype=prompt_embeds.dtype)
+        else:
+            latents = latents.to(device)
+        latents = latents * scheduler.init_noise_sigma
+
+        timestep_cond = None
+        if pipe.unet.config.time_cond_proj_dim is not None:
+            guidance_scale_tensor = torch.tensor(guidance_scale - 1).repeat(shape[0])
+            timestep_cond = pipe.get_guidance_scale_embedding(
+                guidance_scale_tensor, embedding_dim=pipe.unet.config.time_cond_proj_dim
+            ).to(device=device, dtype=latents.dtype)
+
+        self._waiting.append(
+            _RequestState(
+                request_id=request_id,
+                scheduler=scheduler,
+                timesteps=timesteps,
+                latents=latents,
+                prompt_embeds=prompt_embeds,
+                guidance_scale=guidance_scale,
+                guidance_rescale=guidance_rescale,
+                do_classifier_free_guidance=do_classifier_free_guidance,
+                timestep_cond=timestep_cond,
+                extra_step_kwargs=pipe.prepare_extra_step_kwargs(generator, eta),
+                generator=generator,
+                output_type=output_type,
+            )
+        )
+        return request_id
+
+    def _admit_requests(self):
+        num_rows = sum(state.num_rows for state in self._running.values())
+        while len(self._waiting) > 0:
+            state = self._waiting[0]
+            # always admit a request into an empty batch, even if it is larger than `max_batch_size` on its own
+            if len(self._running) > 0 and num_rows + state.num_rows > self.max_batch_size:
+                break
+            self._waiting.popleft()
+            self._running[state.request_id] = state
+            num_rows += state.num_rows
+
+    def _denoise_group(self, states: List[_RequestState]):
+        unet = self.pipeline.unet
+
+        latent_model_input = []
+        timesteps = []
+        for state in states:
+            t = state.timesteps[state.step_index]
+            model_input = torch.cat([state.latents] * 2) if state.do_classifier_free_guidance else state.latents
+            latent_model_input.append(state.scheduler.scale_model_input(model_input, t))
+            timesteps.append(t.reshape(1).expand(model_input.shape[0]))
+
+        latent_model_input = torch.cat(latent_model_input)
+        timesteps = torch.cat(timesteps)
+        encoder_hidden_states = torch.cat([state.prompt_embeds for state in states])
+        if any(state.timestep_cond is not None for state in states):
+            timestep_cond = torch.cat([state.timestep_cond for state in states])
+        else:
+            timestep_cond = None
+
+        noise_pred = unet(
+            latent_model_input,
+            timesteps,
+            encoder_hidden_states=encoder_hidden_states,
+            timestep_cond=timestep_cond,
+            return_dict=False,
+        )[0]
+
+        for state, model_output in zip(states, noise_pred.split([state.num_rows for state in states])):
+            if state.do_classifier_free_guidance:
+                noise_pred_uncond, noise_pred_text = model_output.chunk(2)
+                model_output = noise_pred_uncond + state.guidance_scale * (noise_pred_text - noise_pred_uncond)
+                if state.guidance_rescale > 0.0:
+                    model_output = rescale_noise_cfg(
+                        model_output, noise_pred_text, guidance_rescale=state.guidance_rescale
+                    )
+
+            t = state.timesteps[state.step_index]
+            state.latents = state.scheduler.step(
+                model_output, t, state.latents, **state.extra_step_kwargs, return_dict=False
+            )[0]
+            state.step_index += 1
+
+    def _decode(self, state: _RequestState) -> ContinuousBatchingOutput:
+        pipe = self.pipeline
+
+        if not state.output_type == "latent":
+            image = pipe.vae.decode(
+                state.latents / pipe.vae.config.scaling_factor, return_dict=False, generator=state.generator
+            )[0]
+            image, has_nsfw_concept = pipe.run_safety_checker(image, image.device, state.prompt_embeds.dtype)
+        else:
+            image = state.latents
+            has_nsfw_concept = None
+
+        if has_nsfw_concept is None:
+            do_denormalize = [True] * image.shape[0]
+        else:
+            do_denormalize = [not has_nsfw for has_nsfw in has_nsfw_concept]
+
+        image = pipe.image_processor.postprocess(image, output_type=state.output_type, do_denormalize=do_denormalize)
+        return ContinuousBatchingOutput(
+            request_id=state.request_id, images=image, nsfw_content_detected=has_nsfw_concept
+        )
+
+    @torch.no_grad()
+    def step(self) -> List[ContinuousBatchingOutput]:
+        r"""
+        Admits waiting requests, advances every running request by one denoising step and decodes the requests that
+        completed their schedule.
+
+        Returns:
+            `List[ContinuousBatchingOutput]`: The requests that finished during this step.
+        """
+        self._admit_requests()
+
+        # requests can only share a UNet forward pass if their latents and text embeddings can be concatenated
+        groups: Dict[Any, List[_RequestState]] = OrderedDict()
+        for state in self._running.values():
+            key = (tuple(state.latents.shape[1:]), tuple(state.prompt_embeds.shape[1:]))
+            groups.setdefault(key, []).append(state)
+
+        for states in groups.values():
+            self._denoise_group(states)
+
+        outputs = []
+        for request_id in [request_id for request_id, state in self._running.items() if state.is_finished]:
+            outputs.append(self._decode(self._running.pop(request_id)))
+
+        return outputs
+
+    def generate(self, requests: List[Dict[str, Any]]) -> List[ContinuousBatchingOutput]:
+        r"""
+        Convenience method that queues `requests` and steps the engine until all of them are done. The engine must
+        not have any other unfinished requests.
+
+        Args:
+            requests (`List[Dict[str, Any]]`):
+                Keyword arguments for [`~ContinuousBatchingEngine.add_request`], one dictionary per request.
+
+        Returns:
+            `List[ContinuousBatchingOutput]`: The outputs in the same order as `requests`.
+        """
+        if self.has_unfinished_requests():
+            raise ValueError(
+                "`generate` can only be called on an idle engine. Use `add_request` and `step` to interleave requests."
+            )
+
+        request_ids = [self.add_request(**kwargs) for kwargs in requests]
+
+        outputs = {}
+        while self.has_unfinished_requests():
+            for output in self.step():
+                outputs[output.request_id] = output
+
+        self.pipeline.maybe_free_model_hooks()
+
+        return [outputs[request_id] for request_id in request_ids]
@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Dict, Optional, Tuple, Union
+from typing import Dict, Iterator, Optional, Tuple, Union
 
 import torch
 import torch.nn as nn
@@ -122,6 +122,8 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
         )
         self.tile_latent_min_size = int(sample_size / (2 ** (len(self.config.block_out_channels) - 1)))
         self.tile_overlap_factor = 0.25
+        # only relevant if batched vae tiling is enabled
+        self.tile_batch_size = None
 
     def _set_gradient_checkpointing(self, module, value=False):
         if isinstance(module, (Encoder, Decoder)):
@@ -142,6 +144,27 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
         """
         self.enable_tiling(False)
 
+    def enable_batched_tiling(self, tile_batch_size: int = 4):
+        r"""
+        Enable tiled VAE decoding and encoding where tiles of the same size are stacked into micro-batches of
+        `tile_batch_size` tiles and processed by a single encoder or decoder call. The output matches the one of
+        [`~AutoencoderKL.enable_tiling`], while peak activation memory grows with `tile_batch_size`.
+
+        Args:
+            tile_batch_size (`int`, *optional*, defaults to 4):
+                The maximum number of tiles processed together.
+        """
+        if tile_batch_size < 1:
+            raise ValueError(f"`tile_batch_size` has to be a positive integer but is {tile_batch_size}.")
+        self.enable_tiling()
+        self.tile_batch_size = tile_batch_size
+
+    def disable_batched_tiling(self):
+        r"""
+        Disable batched tile processing. If tiling is enabled, tiles will be processed one at a time again.
+        """
+        self.tile_batch_size = None
+
     def enable_slicing(self):
         r"""
         Enable sliced VAE decoding. When this option is enabled, the VAE will split the input tensor in slices to
@@ -318,6 +341,70 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
             b[:, :, :, x] = a[:, :, :, -blend_extent + x] * (1 - x / blend_extent) + b[:, :, :, x] * (x / blend_extent)
         return b
 
+    def _blend_ramp(self, a: torch.Tensor, b: torch.Tensor, blend_extent: int, dim: int, ramps: Dict) -> torch.Tensor:
+        # vectorized equivalent of `blend_v` (dim=2) and `blend_h` (dim=3), blending `b` in place
+        blend_extent = min(a.shape[dim], b.shape[dim], blend_extent)
+        if blend_extent == 0:
+            return b
+
+        key = (blend_extent, dim)
+        if key not in ramps:
+            ramp = torch.arange(blend_extent, dtype=torch.float64) / blend_extent
+            ramp = ramp.to(device=b.device, dtype=b.dtype).reshape((-1,) + (1,) * (b.ndim - 1 - dim))
+            ramps[key] = (1 - ramp, ramp)
+        ramp_a, ramp_b = ramps[key]
+
+        b_blend = b.narrow(dim, 0, blend_extent)
+        a_blend = a.narrow(dim, a.shape[dim] - blend_extent, blend_extent)
+        b_blend.copy_(a_blend * ramp_a + b_blend * ramp_b)
+        return b
+
+    def _batched_tiled_forward(
+        self,
+        x: torch.FloatTensor,
+        fn,
+        tile_size: int,
+        overlap_size: int,
+        blend_extent: int,
+        row_limit: int,
+    ) -> torch.FloatTensor:
+        # Split `x` into overlapping tiles and group the tiles by shape, since tiles at the bottom and right borders can
+        # be smaller than `tile_size`. Tiles of the same shape are processed in micro-batches of `tile_batch_size`.
+        row_starts = range(0, x.shape[2], overlap_size)
+        col_starts = range(0, x.shape[3], overlap_size)
+
+        groups = {}
+        for i, row_start in enumerate(row_starts):
+            for j, col_start in enumerate(col_starts):
+                tile = x[:, :, row_start : row_start + tile_size, col_start : col_start + tile_size]
+                groups.setdefault(tuple(tile.shape[2:]), []).append(((i, j), tile))
+
+        tiles = {}
+        for group in groups.values():
+            for k in range(0, len(group), self.tile_batch_size):
+                micro_batch = group[k : k + self.tile_batch_size]
+                processed = fn(torch.cat([tile for _, tile in micro_batch]))
+                for (position, _), tile in zip(micro_batch, processed.split(x.shape[0])):
+                    tiles[position] = tile
+
+        rows = [[tiles[(i, j)] for j in range(len(col_starts))] for i in range(len(row_starts))]
+
+        # blend the above tile and the left tile to the current tile, in the same order as `tiled_encode` and
+        # `tiled_decode` so that the results match, using ramp weights that are computed once per blend extent
+        ramps = {}
+        result_rows = []
+        for i, row in enumerate(rows):
+            result_row = []
+            for j, tile in enumerate(row):
+                if i > 0:
+                    tile = self._blend_ramp(rows[i - 1][j], tile, blend_extent, 2, ramps)
+                if j > 0:
+                    tile = self._blend_ramp(row[j - 1], tile, blend_extent, 3, ramps)
+                result_row.append(tile[:, :, :row_limit, :row_limit])
+            result_rows.append(torch.cat(result_row, dim=3))
+
+        return torch.cat(result_rows, dim=2)
+
     def tiled_encode(self, x: torch.FloatTensor, return_dict: bool = True) -> AutoencoderKLOutput:
         r"""Encode a batch of images using a tiled encoder.
 
@@ -341,6 +428,20 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
         blend_extent = int(self.tile_latent_min_size * self.tile_overlap_factor)
         row_limit = self.tile_latent_min_size - blend_extent
 
+        if self.tile_batch_size is not None:
+            moments = self._batched_tiled_forward(
+                x,
+                lambda tile: self.quant_conv(self.encoder(tile)),
+                self.tile_sample_min_size,
+                overlap_size,
+                blend_extent,
+                row_limit,
+            )
+            posterior = DiagonalGaussianDistribution(moments)
+            if not return_dict:
+                return (posterior,)
+            return AutoencoderKLOutput(latent_dist=posterior)
+
         # Split the image into 512x512 tiles and encode them separately.
         rows = []
         for i in range(0, x.shape[2], overlap_size):
@@ -390,6 +491,19 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
         blend_extent = int(self.tile_sample_min_size * self.tile_overlap_factor)
         row_limit = self.tile_sample_min_size - blend_extent
 
+        if self.tile_batch_size is not None:
+            dec = self._batched_tiled_forward(
+                z,
+                lambda tile: self.decoder(self.post_quant_conv(tile)),
+                self.tile_latent_min_size,
+                overlap_size,
+                blend_extent,
+                row_limit,
+            )
+            if not return_dict:
+                return (dec,)
+            return DecoderOutput(sample=dec)
+
         # Split z into overlapping 64x64 tiles and decode them separately.
         # The tiles have an overlap to avoid seams between tiles.
         rows = []
@@ -420,6 +534,58 @@ class AutoencoderKL(ModelMixin, ConfigMixin, FromOriginalVAEMixin):
 
         return DecoderOutput(sample=dec)
 
+    @torch.no_grad()
+    def tiled_decode_stream(self, z: torch.FloatTensor) -> Iterator[torch.FloatTensor]:
+        r"""
+        Decode a batch of latents with the tiled decoder and yield the result one horizontal band at a time.
+
+        Every band is a finished slice of the output of [`~AutoencoderKL.tiled_decode`]: it is already blended with
+        its neighbours and concatenating all bands along the height dimension gives the same tensor. Only the previous
+        and the current row of tiles are kept in memory, so the peak memory does not grow with the output height and
+        bands can be converted (see [`~image_processor.VaeImageProcessor.postprocess_stream`]) and written to disk
+        (see [`~utils.export_to_png_stream`]) as soon as they are decoded. If batched tiling is enabled, the tiles of a
+        row are decoded in micro-batches of `tile_batch_size`.
+
+        Args:
+            z (`torch.FloatTensor`): Input batch of latent vectors.
+
+        Returns:
+            `Iterator[torch.FloatTensor]`:
+                An iterator over bands of shape `(batch_size, num_channels, band_height, width)`.
+        """
+        overlap_size = int(self.tile_latent_min_size * (1 - self.tile_overlap_factor))
+        blend_extent = int(self.tile_sample_min_size * self.tile_overlap_factor)
+        row_limit = self.tile_sample_min_size - blend_extent
+        tile_batch_size = self.tile_batch_size or 1
+
+        prev_row = None
+        for i in range(0, z.shape[2], overlap_size):
+            tiles = [
+                z[:, :, i : i + self.tile_latent_min_size, j : j + self.tile_latent_min_size]
+                for j in range(0, z.shape[3], overlap_size)
+            ]
+            row = []
+            for k in range(0, len(tiles), tile_batch_size):
+                micro_batch = tiles[k : k + tile_batch_size]
+                # tiles at the right border can be smaller and are decoded on their own
+                if len({tile.shape for tile in micro_batch}) > 1:
+                    row.extend(self.decoder(self.post_quant_conv(tile)) for tile in micro_batch)
+                    continue
+                decoded = self.decoder(self.post_quant_conv(torch.cat(micro_batch)))
+                row.extend(decoded.split(z.shape[0]))
+
+            result_row = []
+            for j, tile in enumerate(row):
+                # blend the above tile and the left tile in the same order as `tiled_decode`
+                if prev_row is not None:
+                    tile = self.blend_v(prev_row[j], tile, blend_extent)
+                if j > 0:
+                    tile = self.blend_h(row[j - 1], tile, blend_extent)
+                result_row.append(tile[:, :, :row_limit, :row_limit])
+            yield torch.cat(result_row, dim=3)
+
+            prev_row = row
+
     def forward(
         self,
         sample: torch.FloatTensor,
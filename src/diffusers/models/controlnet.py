@@ -411,6 +411,12 @@ class ControlNetModel(ModelMixin, ConfigMixin, FromOriginalControlNetMixin):
         controlnet_block = zero_module(controlnet_block)
         self.controlnet_mid_block = controlnet_block
 
+        self.residual_cache_interval = None
+        self.residual_cache_window = None
+        self.residual_cache_extrapolate = False
+        self._residual_cache = {}
+        self._residual_cache_stats = {"hits": 0, "misses": 0}
+
         if mid_block_type == "UNetMidBlock2DCrossAttn":
             self.mid_block = UNetMidBlock2DCrossAttn(
                 transformer_layers_per_block=transformer_layers_per_block[-1],
@@ -660,6 +666,100 @@ class ControlNetModel(ModelMixin, ConfigMixin, FromOriginalControlNetMixin):
         if isinstance(module, (CrossAttnDownBlock2D, DownBlock2D)):
             module.gradient_checkpointing = value
 
+    def enable_residual_cache(
+        self,
+        cache_interval: int = 2,
+        cache_window: Optional[Tuple[int, int]] = None,
+        extrapolate: bool = False,
+    ):
+        r"""
+        Enables caching of the ControlNet residuals across denoising steps.
+
+        The residuals of the ControlNet often change little between consecutive denoising steps. With caching, they
+        are only computed every `cache_interval` steps, and the steps in between reuse the most recent residuals, or
+        extrapolate them linearly from the two most recent ones. The conditioning scale is applied after the cache, so
+        it can still change at every step.
+
+        The first step of every denoising loop, detected like in [`~UNet2DConditionModel.enable_deep_cache`] by a
+        timestep that does not decrease or an input of a different shape, always computes the residuals. Call
+        [`~ControlNetModel.reset_residual_cache`] to force it.
+
+        Args:
+            cache_interval (`int`, *optional*, defaults to 2):
+                Number of steps between two computations of the residuals. `1` computes them at every step.
+            cache_window (`Tuple[int, int]`, *optional*):
+                The steps `(start, end)` in which the residuals are computed, every `cache_interval` steps counted from
+                `start`. Outside of the window, the cached residuals are used.
+            extrapolate (`bool`, *optional*, defaults to `False`):
+                Whether to extrapolate the residuals linearly from the two most recent computations instead of reusing
+                the most recent one.
+        """
+        if cache_interval < 1:
+            raise ValueError(f"`cache_interval` has to be a positive integer but is {cache_interval}.")
+        if cache_window is not None and not 0 <= cache_window[0] < cache_window[1]:
+            raise ValueError(f"`cache_window` has to be a non-empty `(start, end)` range but is {cache_window}.")
+
+        self.residual_cache_interval = cache_interval
+        self.residual_cache_window = cache_window
+        self.residual_cache_extrapolate = extrapolate
+        self.reset_residual_cache()
+
+    def disable_residual_cache(self):
+        """Disables caching of the ControlNet residuals."""
+        self.residual_cache_interval = None
+        self.residual_cache_window = None
+        self.residual_cache_extrapolate = False
+        self.reset_residual_cache()
+
+    def reset_residual_cache(self):
+        """Drops the cached residuals so that the next forward pass computes them, and resets the cache statistics."""
+        self._residual_cache = {}
+        self._residual_cache_stats = {"hits": 0, "misses": 0}
+
+    @property
+    def residual_cache_stats(self) -> Dict[str, int]:
+        r"""
+        Returns:
+            `dict` with the number of forward passes that used cached residuals (`"hits"`) and that computed them
+            (`"misses"`) since the cache was enabled or last reset.
+        """
+        return dict(self._residual_cache_stats)
+
+    def _get_cached_residuals(
+        self, sample: torch.FloatTensor, timestep: Union[torch.Tensor, float, int]
+    ) -> Optional[Tuple[Tuple[torch.FloatTensor, ...], torch.FloatTensor]]:
+        # returns `None` when the residuals have to be computed at this step
+        state = self._residual_cache
+        timestep = timestep.max().item() if torch.is_tensor(timestep) else timestep
+        if not state.get("residuals") or state["sample_shape"] != sample.shape or timestep >= state["timestep"]:
+            state["step"] = 0
+            state["residuals"] = []
+
+        step = state["step"]
+        state["step"] += 1
+        state["timestep"] = timestep
+        state["sample_shape"] = sample.shape
+
+        start, end = self.residual_cache_window or (0, float("inf"))
+        in_window = start <= step < end
+        if not state["residuals"] or (in_window and (step - start) % self.residual_cache_interval == 0):
+            self._residual_cache_stats["misses"] += 1
+            return None
+
+        self._residual_cache_stats["hits"] += 1
+        if not self.residual_cache_extrapolate or len(state["residuals"]) < 2:
+            return state["residuals"][-1][1]
+
+        (prev_step, (prev_down, prev_mid)), (last_step, (last_down, last_mid)) = state["residuals"]
+        weight = (step - prev_step) / (last_step - prev_step)
+        down_block_res_samples = tuple(torch.lerp(prev, last, weight) for prev, last in zip(prev_down, last_down))
+        return down_block_res_samples, torch.lerp(prev_mid, last_mid, weight)
+
+    def _cache_residuals(self, down_block_res_samples: Tuple[torch.FloatTensor, ...], mid_block_res_sample):
+        state = self._residual_cache
+        residuals = (state["step"] - 1, (down_block_res_samples, mid_block_res_sample))
+        state["residuals"] = state["residuals"][-1:] + [residuals]
+
     def forward(
         self,
         sample: torch.FloatTensor,
@@ -714,6 +814,13 @@ class ControlNetModel(ModelMixin, ConfigMixin, FromOriginalControlNetMixin):
                 If `return_dict` is `True`, a [`~models.controlnet.ControlNetOutput`] is returned, otherwise a tuple is
                 returned where the first element is the sample tensor.
         """
+        if self.residual_cache_interval is not None:
+            cached_residuals = self._get_cached_residuals(sample, timestep)
+            if cached_residuals is not None:
+                return self._scale_residuals(
+                    *cached_residuals, conditioning_scale, guess_mode=guess_mode, return_dict=return_dict
+                )
+
         # check channel order
         channel_order = self.config.controlnet_conditioning_channel_order
 
@@ -838,9 +945,30 @@ class ControlNetModel(ModelMixin, ConfigMixin, FromOriginalControlNetMixin):
 
         mid_block_res_sample = self.controlnet_mid_block(sample)
 
+        if self.residual_cache_interval is not None:
+            self._cache_residuals(down_block_res_samples, mid_block_res_sample)
+
+        return self._scale_residuals(
+            down_block_res_samples,
+            mid_block_res_sample,
+            conditioning_scale,
+            guess_mode=guess_mode,
+            return_dict=return_dict,
+        )
+
+    def _scale_residuals(
+        self,
+        down_block_res_samples: Tuple[torch.FloatTensor, ...],
+        mid_block_res_sample: torch.FloatTensor,
+        conditioning_scale: float,
+        guess_mode: bool = False,
+        return_dict: bool = True,
+    ) -> Union[ControlNetOutput, Tuple[Tuple[torch.FloatTensor, ...], torch.FloatTensor]]:
         # 6. scaling
         if guess_mode and not self.config.global_pool_conditions:
-            scales = torch.logspace(-1, 0, len(down_block_res_samples) + 1, device=sample.device)  # 0.1 to 1.0
+            scales = torch.logspace(
+                -1, 0, len(down_block_res_samples) + 1, device=mid_block_res_sample.device
+            )  # 0.1 to 1.0
             scales = scales * conditioning_scale
             down_block_res_samples = [sample * scale for sample, scale in zip(down_block_res_samples, scales)]
             mid_block_res_sample = mid_block_res_sample * scales[-1]  # last one
@@ -16,8 +16,13 @@
 
 import inspect
 import itertools
+import json
+import mmap
 import os
 import re
+import struct
+import sys
+import threading
 from collections import OrderedDict
 from functools import partial
 from typing import Any, Callable, List, Optional, Tuple, Union
@@ -39,6 +44,7 @@ from ..utils import (
     _get_model_file,
     deprecate,
     is_accelerate_available,
+    is_accelerate_version,
     is_torch_version,
     logging,
 )
@@ -53,6 +59,11 @@ if is_torch_version(">=", "1.9.0"):
 else:
     _LOW_CPU_MEM_USAGE_DEFAULT = False
 
+# Instantiating a model can temporarily patch global state, such as `accelerate.init_empty_weights` replacing
+# `nn.Module.register_parameter`. Models loaded concurrently, see `max_loading_workers` in
+# `DiffusionPipeline.from_pretrained`, hold this lock while they are instantiated and load their weights in parallel.
+_MODEL_INIT_LOCK = threading.RLock()
+
 
 if is_accelerate_available():
     import accelerate
@@ -98,14 +109,82 @@ def get_parameter_dtype(parameter: torch.nn.Module) -> torch.dtype:
         return first_tuple[1].dtype
 
 
-def load_state_dict(checkpoint_file: Union[str, os.PathLike], variant: Optional[str] = None):
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+class _MmapStateDict(dict):
+    # A state dict of zero-copy views into a copy-on-write memory map of a safetensors file
+    def __init__(self, mapping: mmap.mmap, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._mapping = mapping
+        self._base_ptr = torch.frombuffer(mapping, dtype=torch.uint8, count=1).data_ptr()
+
+    def release(self, tensor: torch.Tensor):
+        """
+        Drops the pages backing `tensor` from memory once its weights have been copied elsewhere. The mapping is
+        unmodified, so the pages are transparently read from the file again if the view is accessed later.
+        """
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        start = tensor.data_ptr() - self._base_ptr
+        end = start + tensor.numel() * tensor.element_size()
+        start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if 0 <= start < end <= len(self._mapping):
+            self._mapping.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def _load_safetensors_mmap(checkpoint_file: Union[str, os.PathLike]) -> Optional[_MmapStateDict]:
+    # Returns `None` if the file can't be viewed without copying it
+    with open(checkpoint_file, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        header.pop("__metadata__", None)
+
+        if sys.byteorder != "little" or any(info["dtype"] not in _SAFETENSORS_DTYPES for info in header.values()):
+            return None
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    state_dict = _MmapStateDict(mapping)
+    data = torch.frombuffer(mapping, dtype=torch.uint8)
+    for name, info in header.items():
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = (8 + header_size + offset for offset in info["data_offsets"])
+        tensor = data[start:end]
+        if start % torch.empty((), dtype=dtype).element_size() != 0:
+            # safetensors doesn't align the tensors, misaligned ones can't be viewed with their dtype
+            tensor = tensor.clone()
+        state_dict[name] = tensor.view(dtype).view(info["shape"])
+    return state_dict
+
+
+def load_state_dict(checkpoint_file: Union[str, os.PathLike], variant: Optional[str] = None, mmap: bool = False):
     """
     Reads a checkpoint file, returning properly formatted errors if they arise.
+
+    With `mmap=True`, the file is memory-mapped instead of read. The returned tensors are views into the mapping, so
+    the weights are only read from disk when they are accessed and no copy of the checkpoint is made.
     """
     try:
         file_extension = os.path.basename(checkpoint_file).split(".")[-1]
         if file_extension == SAFETENSORS_FILE_EXTENSION:
-            return safetensors.torch.load_file(checkpoint_file, device="cpu")
+            state_dict = _load_safetensors_mmap(checkpoint_file) if mmap else None
+            if state_dict is None:
+                state_dict = safetensors.torch.load_file(checkpoint_file, device="cpu")
+            return state_dict
+        elif mmap and is_torch_version(">=", "2.1.0"):
+            return torch.load(checkpoint_file, map_location="cpu", mmap=True)
         else:
             return torch.load(checkpoint_file, map_location="cpu")
     except Exception as e:
@@ -159,6 +238,13 @@ def load_model_dict_into_meta(
             set_module_tensor_to_device(model, param_name, device, value=param, dtype=dtype)
         else:
             set_module_tensor_to_device(model, param_name, device, value=param)
+
+        # free the memory-mapped pages of weights that were converted or moved, so that only one is held at a time
+        if isinstance(state_dict, _MmapStateDict) and param.numel() > 0:
+            module_name, _, tensor_name = param_name.rpartition(".")
+            new_param = getattr(model.get_submodule(module_name), tensor_name)
+            if new_param.data_ptr() != param.data_ptr():
+                state_dict.release(param)
     return unexpected_keys
 
 
@@ -197,6 +283,8 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
     _automatically_saved_args = ["_diffusers_version", "_class_name", "_name_or_path"]
     _supports_gradient_checkpointing = False
     _keys_to_ignore_on_load_unexpected = None
+    _streaming_blocks = None
+    _timestep_embedding_cache = None
 
     def __init__(self):
         super().__init__()
@@ -302,6 +390,162 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
         """
         self.set_use_memory_efficient_attention_xformers(False)
 
+    def enable_block_streaming(
+        self,
+        device: Union[torch.device, str] = "cuda",
+        window_size: Optional[int] = None,
+        memory_budget: Optional[Union[int, str]] = None,
+    ) -> None:
+        r"""
+        Keeps the weights of the model's blocks, for example the down, mid and up blocks of a UNet, on the CPU and
+        streams them to `device` while the model runs. A window of blocks following the running one is copied to the
+        device asynchronously, so that the copies overlap with the computation. All other weights are moved to
+        `device`.
+
+        Parameters:
+            device (`torch.device` or `str`, *optional*, defaults to `"cuda"`):
+                The device the model runs on.
+            window_size (`int`, *optional*):
+                Number of blocks after the running one that are kept on the device. Larger windows hide more of the
+                copies but use more memory.
+            memory_budget (`int` or `str`, *optional*):
+                Device memory available for the model weights, in bytes or as a string like `"4GB"`. If `window_size`
+                is not passed, the largest window that fits in this budget is used, otherwise it defaults to 1.
+                Activations are not included in the budget.
+
+        Examples:
+
+        ```py
+        >>> import torch
+        >>> from diffusers import UNet2DConditionModel
+
+        >>> unet = UNet2DConditionModel.from_pretrained(
+        ...     "stabilityai/stable-diffusion-xl-base-1.0", subfolder="unet", torch_dtype=torch.float16
+        ... )
+        >>> unet.enable_block_streaming("cuda", memory_budget="2GB")
+        ```
+        """
+        if self._streaming_blocks is None:
+            raise ValueError(f"{self.__class__.__name__} does not support block streaming.")
+
+        if not is_accelerate_available() or is_accelerate_version("<", "0.17.0"):
+            raise ImportError("`enable_block_streaming` requires `accelerate v0.17.0` or higher.")
+
+        from ..utils.offload_utils import enable_block_streaming
+
+        if isinstance(memory_budget, str):
+            memory_budget = accelerate.utils.convert_file_size_to_int(memory_budget)
+
+        blocks = []
+        for name in self._streaming_blocks:
+            module = getattr(self, name, None)
+            if isinstance(module, nn.ModuleList):
+                blocks.extend(module)
+            elif module is not None:
+                blocks.append(module)
+
+        enable_block_streaming(
+            self, blocks, torch.device(device), window_size=window_size, memory_budget=memory_budget
+        )
+
+    def enable_timestep_embedding_cache(self) -> None:
+        r"""
+        Enables caching the timestep embeddings of a denoising schedule.
+
+        Once the scheduler's timesteps are set, the pipelines call [`~ModelMixin.precompute_timestep_embeddings`],
+        which computes the sinusoidal embeddings and the time embedding MLP for the whole schedule in a single batch.
+        During the denoising loop, the embedding of a timestep taken from the schedule is then looked up by its index
+        instead of being recomputed, and embeddings that only depend on inputs which are constant over the loop, like
+        the `time_ids` of SDXL, are computed once. Other timesteps are embedded as usual.
+
+        Examples:
+
+        ```py
+        >>> import torch
+        >>> from diffusers import StableDiffusionXLPipeline
+
+        >>> pipe = StableDiffusionXLPipeline.from_pretrained(
+        ...     "stabilityai/stable-diffusion-xl-base-1.0", torch_dtype=torch.float16
+        ... ).to("cuda")
+        >>> pipe.unet.enable_timestep_embedding_cache()
+        ```
+        """
+        if not hasattr(self, "_embed_timesteps"):
+            raise ValueError(f"{self.__class__.__name__} does not support caching timestep embeddings.")
+        self._timestep_embedding_cache = {}
+
+    def disable_timestep_embedding_cache(self) -> None:
+        r"""
+        Disables caching the timestep embeddings, see [`~ModelMixin.enable_timestep_embedding_cache`].
+        """
+        self._timestep_embedding_cache = None
+
+    def precompute_timestep_embeddings(self, timesteps: torch.Tensor) -> None:
+        r"""
+        Computes the timestep embeddings of a whole schedule if the cache is enabled with
+        [`~ModelMixin.enable_timestep_embedding_cache`], and does nothing otherwise.
+
+        Parameters:
+            timesteps (`torch.Tensor`):
+                The 1D schedule, usually `scheduler.timesteps`. The forward pass recognizes the elements of this very
+                tensor without synchronizing with the device, other tensors are looked up by value.
+        """
+        if self._timestep_embedding_cache is None or self.device.type == "meta":
+            return
+
+        # with model offloading the weights may not be on the device of the timesteps yet
+        with torch.no_grad():
+            embeddings = self._embed_timesteps(timesteps.to(self.device))
+        self._timestep_embedding_cache = {
+            "timesteps": timesteps,
+            "version": timesteps._version,
+            "index": {timestep: i for i, timestep in enumerate(timesteps.tolist())},
+            "embeddings": embeddings,
+        }
+
+    def _get_cached_timestep_embedding(self, timesteps: torch.Tensor) -> Optional[torch.Tensor]:
+        cache = self._timestep_embedding_cache
+        if not cache or "embeddings" not in cache or torch.is_grad_enabled():
+            return None
+
+        schedule = cache["timesteps"]
+        if (
+            timesteps.ndim == 1
+            and (timesteps.shape[0] == 1 or timesteps.stride(0) == 0)
+            and timesteps.untyped_storage().data_ptr() == schedule.untyped_storage().data_ptr()
+            and timesteps.dtype == schedule.dtype
+            and schedule._version == cache["version"]
+        ):
+            # an element of the schedule, broadcast to the batch size, e.g. `t` in `for t in timesteps`
+            index = (timesteps.storage_offset() - schedule.storage_offset()) // schedule.stride(0)
+            rows = [index] * timesteps.shape[0]
+        else:
+            rows = [cache["index"].get(timestep) for timestep in timesteps.tolist()]
+            if None in rows:
+                return None
+
+        embeddings = cache["embeddings"]
+        if isinstance(embeddings, tuple):
+            return tuple(embedding[rows].to(timesteps.device) for embedding in embeddings)
+        return embeddings[rows].to(timesteps.device)
+
+    def _get_cached_condition_embedding(self, name: str, inputs: Tuple[torch.Tensor, ...]) -> Optional[torch.Tensor]:
+        # embeddings of inputs that are passed unchanged at every step of the loop, matched by identity
+        cache = self._timestep_embedding_cache
+        if cache is None or name not in cache or torch.is_grad_enabled():
+            return None
+        cached_inputs, embedding = cache[name]
+        if len(cached_inputs) != len(inputs) or any(
+            x is not cached_x or x._version != version for x, (cached_x, version) in zip(inputs, cached_inputs)
+        ):
+            return None
+        return embedding
+
+    def _set_cached_condition_embedding(self, name: str, inputs: Tuple[torch.Tensor, ...], embedding: torch.Tensor):
+        if self._timestep_embedding_cache is None or torch.is_grad_enabled():
+            return
+        self._timestep_embedding_cache[name] = ([(x, x._version) for x in inputs], embedding)
+
     def save_pretrained(
         self,
         save_directory: Union[str, os.PathLike],
@@ -471,6 +715,12 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
                 If set to `None`, the `safetensors` weights are downloaded if they're available **and** if the
                 `safetensors` library is installed. If set to `True`, the model is forcibly loaded from `safetensors`
                 weights. If set to `False`, `safetensors` weights are not loaded.
+            mmap (`bool`, *optional*, defaults to `False`):
+                Whether to memory-map the checkpoint instead of reading it into memory. Each weight is then converted to
+                `torch_dtype` one at a time, and weights that don't need to be converted stay views into the file
+                that are only read from disk when first used, for example by the first forward pass. The peak CPU
+                memory usage during loading is roughly the size of the largest converted weight instead of the size of
+                the checkpoint. The file must not be modified while the model is in use.
 
         <Tip>
 
@@ -512,6 +762,7 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
         device_map = kwargs.pop("device_map", None)
         max_memory = kwargs.pop("max_memory", None)
         offload_folder = kwargs.pop("offload_folder", None)
+        mmap = kwargs.pop("mmap", False)
         offload_state_dict = kwargs.pop("offload_state_dict", False)
         low_cpu_mem_usage = kwargs.pop("low_cpu_mem_usage", _LOW_CPU_MEM_USAGE_DEFAULT)
         variant = kwargs.pop("variant", None)
@@ -603,7 +854,8 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
                 user_agent=user_agent,
                 commit_hash=commit_hash,
             )
-            model = cls.from_config(config, **unused_kwargs)
+            with _MODEL_INIT_LOCK:
+                model = cls.from_config(config, **unused_kwargs)
 
             # Convert the weights
             from .modeling_pytorch_flax_utils import load_flax_checkpoint_in_pytorch_model
@@ -648,13 +900,13 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
 
             if low_cpu_mem_usage:
                 # Instantiate model with empty weights
-                with accelerate.init_empty_weights():
+                with _MODEL_INIT_LOCK, accelerate.init_empty_weights():
                     model = cls.from_config(config, **unused_kwargs)
 
                 # if device_map is None, load the state dict and move the params from meta device to the cpu
                 if device_map is None:
                     param_device = "cpu"
-                    state_dict = load_state_dict(model_file, variant=variant)
+                    state_dict = load_state_dict(model_file, variant=variant, mmap=mmap)
                     model._convert_deprecated_attention_blocks(state_dict)
                     # move the params from meta device to cpu
                     missing_keys = set(model.state_dict().keys()) - set(state_dict.keys())
@@ -735,9 +987,10 @@ class ModelMixin(torch.nn.Module, PushToHubMixin):
                     "error_msgs": [],
                 }
             else:
-                model = cls.from_config(config, **unused_kwargs)
+                with _MODEL_INIT_LOCK:
+                    model = cls.from_config(config, **unused_kwargs)
 
-                state_dict = load_state_dict(model_file, variant=variant)
+                state_dict = load_state_dict(model_file, variant=variant, mmap=mmap)
                 model._convert_deprecated_attention_blocks(state_dict)
 
                 model, missing_keys, unexpected_keys, mismatched_keys, error_msgs = cls._load_pretrained_model(
@@ -70,6 +70,8 @@ class PriorTransformer(ModelMixin, ConfigMixin, UNet2DConditionLoadersMixin, Pef
             The dimension of the output. If None, will be set to `embedding_dim`.
     """
 
+    _streaming_blocks = ["transformer_blocks"]
+
     @register_to_config
     def __init__(
         self,
@@ -242,6 +244,10 @@ class PriorTransformer(ModelMixin, ConfigMixin, UNet2DConditionLoadersMixin, Pef
 
         self.set_attn_processor(processor)
 
+    def _embed_timesteps(self, timesteps: torch.Tensor) -> torch.FloatTensor:
+        # the time embedding, cached by `precompute_timestep_embeddings`
+        return self.time_embedding(self.time_proj(timesteps).to(dtype=self.dtype))
+
     def forward(
         self,
         hidden_states,
@@ -282,15 +288,18 @@ class PriorTransformer(ModelMixin, ConfigMixin, UNet2DConditionLoadersMixin, Pef
         elif torch.is_tensor(timesteps) and len(timesteps.shape) == 0:
             timesteps = timesteps[None].to(hidden_states.device)
 
-        # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
-        timesteps = timesteps * torch.ones(batch_size, dtype=timesteps.dtype, device=timesteps.device)
+        # elements of the schedule are looked up before the broadcast, which would copy them out of the schedule
+        time_embeddings = self._get_cached_timestep_embedding(timesteps.expand(batch_size))
+        if time_embeddings is None:
+            # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
+            timesteps = timesteps * torch.ones(batch_size, dtype=timesteps.dtype, device=timesteps.device)
 
-        timesteps_projected = self.time_proj(timesteps)
+            timesteps_projected = self.time_proj(timesteps)
 
-        # timesteps does not contain any weights and will always return f32 tensors
-        # but time_embedding might be fp16, so we need to cast here.
-        timesteps_projected = timesteps_projected.to(dtype=self.dtype)
-        time_embeddings = self.time_embedding(timesteps_projected)
+            # timesteps does not contain any weights and will always return f32 tensors
+            # but time_embedding might be fp16, so we need to cast here.
+            timesteps_projected = timesteps_projected.to(dtype=self.dtype)
+            time_embeddings = self.time_embedding(timesteps_projected)
 
         if self.embedding_proj_norm is not None:
             proj_embedding = self.embedding_proj_norm(proj_embedding)
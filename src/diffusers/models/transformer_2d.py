@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -71,6 +71,7 @@ class Transformer2DModel(ModelMixin, ConfigMixin):
     """
 
     _supports_gradient_checkpointing = True
+    _streaming_blocks = ["transformer_blocks"]
 
     @register_to_config
     def __init__(
@@ -243,6 +244,20 @@ class Transformer2DModel(ModelMixin, ConfigMixin):
         if hasattr(module, "gradient_checkpointing"):
             module.gradient_checkpointing = value
 
+    def enable_timestep_embedding_cache(self) -> None:
+        if self.adaln_single is None or self.use_additional_conditions:
+            raise ValueError(
+                "Caching timestep embeddings is only supported for `norm_type='ada_norm_single'` without additional"
+                " resolution and aspect ratio conditions."
+            )
+        super().enable_timestep_embedding_cache()
+
+    def _embed_timesteps(self, timesteps: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        # the outputs of `adaln_single`, cached by `precompute_timestep_embeddings`
+        return self.adaln_single(
+            timesteps, {"resolution": None, "aspect_ratio": None}, batch_size=len(timesteps), hidden_dtype=self.dtype
+        )
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -354,9 +369,13 @@ class Transformer2DModel(ModelMixin, ConfigMixin):
                         "`added_cond_kwargs` cannot be None when using additional conditions for `adaln_single`."
                     )
                 batch_size = hidden_states.shape[0]
-                timestep, embedded_timestep = self.adaln_single(
-                    timestep, added_cond_kwargs, batch_size=batch_size, hidden_dtype=hidden_states.dtype
-                )
+                cached = None if self.use_additional_conditions else self._get_cached_timestep_embedding(timestep)
+                if cached is None:
+                    timestep, embedded_timestep = self.adaln_single(
+                        timestep, added_cond_kwargs, batch_size=batch_size, hidden_dtype=hidden_states.dtype
+                    )
+                else:
+                    timestep, embedded_timestep = (embedding.to(hidden_states.dtype) for embedding in cached)
 
         # 2. Blocks
         if self.caption_projection is not None:
@@ -39,17 +39,21 @@ else:
         "AutoPipelineForInpainting",
         "AutoPipelineForText2Image",
     ]
+    _import_structure["compile_manager"] = ["CompileManager"]
     _import_structure["consistency_models"] = ["ConsistencyModelPipeline"]
     _import_structure["dance_diffusion"] = ["DanceDiffusionPipeline"]
     _import_structure["ddim"] = ["DDIMPipeline"]
     _import_structure["ddpm"] = ["DDPMPipeline"]
     _import_structure["dit"] = ["DiTPipeline"]
+    _import_structure["guidance_policy"] = ["GuidancePolicy"]
     _import_structure["latent_diffusion"].extend(["LDMSuperResolutionPipeline"])
     _import_structure["pipeline_utils"] = [
         "AudioPipelineOutput",
         "DiffusionPipeline",
         "ImagePipelineOutput",
     ]
+    _import_structure["prompt_embeds_cache"] = ["PromptEmbedsCache"]
+    _import_structure["static_denoising_loop"] = ["StaticDenoisingLoop"]
     _import_structure["deprecated"].extend(
         [
             "PNDMPipeline",
@@ -316,18 +320,22 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
             AutoPipelineForInpainting,
             AutoPipelineForText2Image,
         )
+        from .compile_manager import CompileManager
         from .consistency_models import ConsistencyModelPipeline
         from .dance_diffusion import DanceDiffusionPipeline
         from .ddim import DDIMPipeline
         from .ddpm import DDPMPipeline
         from .deprecated import KarrasVePipeline, LDMPipeline, PNDMPipeline, RePaintPipeline, ScoreSdeVePipeline
         from .dit import DiTPipeline
+        from .guidance_policy import GuidancePolicy
         from .latent_diffusion import LDMSuperResolutionPipeline
         from .pipeline_utils import (
             AudioPipelineOutput,
             DiffusionPipeline,
             ImagePipelineOutput,
         )
+        from .prompt_embeds_cache import PromptEmbedsCache
+        from .static_denoising_loop import StaticDenoisingLoop
 
     try:
         if not (is_torch_available() and is_librosa_available()):
@@ -310,22 +310,33 @@ class AnimateDiffPipeline(DiffusionPipeline, TextualInversionLoaderMixin, IPAdap
             else:
                 attention_mask = None
 
-            if clip_skip is None:
-                prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
-                prompt_embeds = prompt_embeds[0]
-            else:
-                prompt_embeds = self.text_encoder(
-                    text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, text_input_ids, attention_mask, clip_skip=clip_skip, lora_scale=lora_scale
                 )
-                # Access the `hidden_states` first, that contains a tuple of
-                # all the hidden states from the encoder layers. Then index into
-                # the tuple to access the hidden states from the desired layer.
-                prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
-                # We also need to apply the final LayerNorm here to not mess with the
-                # representations. The `last_hidden_states` that we typically use for
-                # obtaining the final prompt representations passes through the LayerNorm
-                # layer.
-                prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+                prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if prompt_embeds is None:
+                if clip_skip is None:
+                    prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
+                    prompt_embeds = prompt_embeds[0]
+                else:
+                    prompt_embeds = self.text_encoder(
+                        text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+                    )
+                    # Access the `hidden_states` first, that contains a tuple of
+                    # all the hidden states from the encoder layers. Then index into
+                    # the tuple to access the hidden states from the desired layer.
+                    prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
+                    # We also need to apply the final LayerNorm here to not mess with the
+                    # representations. The `last_hidden_states` that we typically use for
+                    # obtaining the final prompt representations passes through the LayerNorm
+                    # layer.
+                    prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, prompt_embeds)
 
         if self.text_encoder is not None:
             prompt_embeds_dtype = self.text_encoder.dtype
@@ -380,11 +391,22 @@ class AnimateDiffPipeline(DiffusionPipeline, TextualInversionLoaderMixin, IPAdap
             else:
                 attention_mask = None
 
-            negative_prompt_embeds = self.text_encoder(
-                uncond_input.input_ids.to(device),
-                attention_mask=attention_mask,
-            )
-            negative_prompt_embeds = negative_prompt_embeds[0]
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, uncond_input.input_ids, attention_mask, lora_scale=lora_scale
+                )
+                negative_prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if negative_prompt_embeds is None:
+                negative_prompt_embeds = self.text_encoder(
+                    uncond_input.input_ids.to(device),
+                    attention_mask=attention_mask,
+                )
+                negative_prompt_embeds = negative_prompt_embeds[0]
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, negative_prompt_embeds)
 
         if do_classifier_free_guidance:
             # duplicate unconditional embeddings for each generation per prompt, using mps friendly method
@@ -789,6 +811,7 @@ class AnimateDiffPipeline(DiffusionPipeline, TextualInversionLoaderMixin, IPAdap
                     current_num_inference_steps = int(num_inference_steps / self._free_init_num_iters * (i + 1))
                     self.scheduler.set_timesteps(current_num_inference_steps, device=device)
                     timesteps = self.scheduler.timesteps
+                    self.unet.precompute_timestep_embeddings(timesteps)
                     denoise_args.update({"timesteps": timesteps, "num_inference_steps": current_num_inference_steps})
 
                 num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
@@ -1012,6 +1035,7 @@ class AnimateDiffPipeline(DiffusionPipeline, TextualInversionLoaderMixin, IPAdap
         # 4. Prepare timesteps
         self.scheduler.set_timesteps(num_inference_steps, device=device)
         timesteps = self.scheduler.timesteps
+        self.unet.precompute_timestep_embeddings(timesteps)
         self._num_timesteps = len(timesteps)
 
         # 5. Prepare latent variables
@@ -321,22 +321,33 @@ class AnimateDiffVideoToVideoPipeline(DiffusionPipeline, TextualInversionLoaderM
             else:
                 attention_mask = None
 
-            if clip_skip is None:
-                prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
-                prompt_embeds = prompt_embeds[0]
-            else:
-                prompt_embeds = self.text_encoder(
-                    text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, text_input_ids, attention_mask, clip_skip=clip_skip, lora_scale=lora_scale
                 )
-                # Access the `hidden_states` first, that contains a tuple of
-                # all the hidden states from the encoder layers. Then index into
-                # the tuple to access the hidden states from the desired layer.
-                prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
-                # We also need to apply the final LayerNorm here to not mess with the
-                # representations. The `last_hidden_states` that we typically use for
-                # obtaining the final prompt representations passes through the LayerNorm
-                # layer.
-                prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+                prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if prompt_embeds is None:
+                if clip_skip is None:
+                    prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
+                    prompt_embeds = prompt_embeds[0]
+                else:
+                    prompt_embeds = self.text_encoder(
+                        text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+                    )
+                    # Access the `hidden_states` first, that contains a tuple of
+                    # all the hidden states from the encoder layers. Then index into
+                    # the tuple to access the hidden states from the desired layer.
+                    prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
+                    # We also need to apply the final LayerNorm here to not mess with the
+                    # representations. The `last_hidden_states` that we typically use for
+                    # obtaining the final prompt representations passes through the LayerNorm
+                    # layer.
+                    prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, prompt_embeds)
 
         if self.text_encoder is not None:
             prompt_embeds_dtype = self.text_encoder.dtype
@@ -391,11 +402,22 @@ class AnimateDiffVideoToVideoPipeline(DiffusionPipeline, TextualInversionLoaderM
             else:
                 attention_mask = None
 
-            negative_prompt_embeds = self.text_encoder(
-                uncond_input.input_ids.to(device),
-                attention_mask=attention_mask,
-            )
-            negative_prompt_embeds = negative_prompt_embeds[0]
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, uncond_input.input_ids, attention_mask, lora_scale=lora_scale
+                )
+                negative_prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if negative_prompt_embeds is None:
+                negative_prompt_embeds = self.text_encoder(
+                    uncond_input.input_ids.to(device),
+                    attention_mask=attention_mask,
+                )
+                negative_prompt_embeds = negative_prompt_embeds[0]
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, negative_prompt_embeds)
 
         if do_classifier_free_guidance:
             # duplicate unconditional embeddings for each generation per prompt, using mps friendly method
@@ -0,0 +1,320 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+
+from ..utils import BaseOutput, is_torch_version, logging
+
+
+logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
+
+COMPILE_ARTIFACTS_NAME = "compile_artifacts.bin"
+
+
+def _pad_batch(value, batch_size: int, padded_batch_size: int):
+    # repeats the last sample of every batched tensor, the extra outputs are dropped afterwards
+    if isinstance(value, torch.Tensor):
+        if value.ndim == 0 or value.shape[0] != batch_size:
+            return value
+        padding = value[-1:].expand(padded_batch_size - batch_size, *value.shape[1:])
+        return torch.cat([value, padding])
+    if isinstance(value, dict):
+        return {k: _pad_batch(v, batch_size, padded_batch_size) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_pad_batch(v, batch_size, padded_batch_size) for v in value)
+    return value
+
+
+def _crop_batch(value, batch_size: int, padded_batch_size: int):
+    if isinstance(value, torch.Tensor):
+        if value.ndim == 0 or value.shape[0] != padded_batch_size:
+            return value
+        return value[:batch_size]
+    if isinstance(value, BaseOutput):
+        return value.__class__(**{k: _crop_batch(v, batch_size, padded_batch_size) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return type(value)(_crop_batch(v, batch_size, padded_batch_size) for v in value)
+    return value
+
+
+def _num_compiled_graphs() -> int:
+    from torch._dynamo.utils import counters
+
+    return counters["stats"]["unique_graphs"]
+
+
+class _BucketedFunction:
+    # a compiled model function whose inputs are padded to the next batch size bucket
+    def __init__(self, function: Callable, name: str, manager: "CompileManager"):
+        self.function = function
+        self.name = name
+        self.manager = manager
+        self.compiled_function = torch.compile(function, dynamic=False, **manager.compile_kwargs)
+
+    def __call__(self, sample: torch.Tensor, *args, **kwargs):
+        batch_size = sample.shape[0]
+        padded_batch_size = self.manager.get_model_batch_bucket(batch_size)
+        if padded_batch_size != batch_size:
+            sample = _pad_batch(sample, batch_size, padded_batch_size)
+            args = _pad_batch(args, batch_size, padded_batch_size)
+            kwargs = _pad_batch(kwargs, batch_size, padded_batch_size)
+
+        num_graphs = _num_compiled_graphs()
+        start = time.perf_counter()
+        output = self.compiled_function(sample, *args, **kwargs)
+        num_new_graphs = _num_compiled_graphs() - num_graphs
+        if num_new_graphs > 0:
+            self.manager.num_compilations[self.name] += num_new_graphs
+            self.manager.compile_times[self.name] += time.perf_counter() - start
+
+        if padded_batch_size != batch_size:
+            output = _crop_batch(output, batch_size, padded_batch_size)
+        return output
+
+
+class CompileManager:
+    r"""
+    Compiles the models of a pipeline with `torch.compile` for a fixed set of shape buckets, enabled with
+    [`~DiffusionPipeline.enable_compile_manager`].
+
+    `torch.compile` specializes a model to the shapes of its inputs, so every new resolution, batch size or switch of
+    classifier-free guidance, which doubles the batch size of the UNet, triggers a recompilation. With a
+    [`CompileManager`], [`StableDiffusionPipeline`] and [`StableDiffusionXLPipeline`] generate at the smallest bucket
+    resolution that contains the requested one, with the latents padded by additional noise around the center, and
+    crop the center of the output to the requested size. The inputs of the UNet and of the VAE decoder are padded to
+    the next batch size bucket by repeating the last sample. The models are then only compiled once per bucket, which
+    [`~CompileManager.warm_up`] does ahead of time.
+
+    Since a larger image is generated, the padded output isn't identical to the one generated at the requested size.
+    For the same reason, the default `original_size` and `target_size` micro-conditioning of Stable Diffusion XL is the
+    bucket resolution instead of the requested one.
+    Requests that don't fit in any bucket run at their own shape and compile a new graph.
+
+    The compiled kernels are stored in `cache_dir` by inductor, and the cache artifacts collected by
+    `torch.compiler.save_cache_artifacts` are saved there by [`~CompileManager.save_artifacts`] and loaded again when
+    a new [`CompileManager`] is created, so that new workers reach their steady-state latency quickly.
+
+    Args:
+        resolutions (`List[Tuple[int, int]]`, *optional*):
+            The `(height, width)` buckets in pixels. If `None`, requests run at their own resolution.
+        batch_sizes (`List[int]`, *optional*):
+            The batch size buckets, in images per call. The UNet batch size buckets are these and their double for
+            classifier-free guidance. If `None`, the batch size isn't padded.
+        cache_dir (`str` or `os.PathLike`, *optional*):
+            The directory to persist the compiled artifacts to. If `None`, the default cache of inductor is used and
+            no artifacts are saved. Unless `TORCHINDUCTOR_CACHE_DIR` is already set, it is set to the `inductor`
+            subdirectory of `cache_dir` for the whole process.
+        model_names (`List[str]`, *optional*, defaults to `["unet", "vae"]`):
+            The models of the pipeline to compile. For the VAE, only `decode` is compiled.
+        compile_kwargs (`Dict[str, Any]`, *optional*):
+            Additional arguments for `torch.compile`, like `mode="reduce-overhead"` or `fullgraph=True`.
+
+    Examples:
+
+    ```py
+    >>> import torch
+    >>> from diffusers import CompileManager, StableDiffusionPipeline
+
+    >>> pipe = StableDiffusionPipeline.from_pretrained("runwayml/stable-diffusion-v1-5", torch_dtype=torch.float16)
+    >>> pipe = pipe.to("cuda")
+
+    >>> manager = CompileManager(
+    ...     resolutions=[(512, 512), (768, 768)],
+    ...     batch_sizes=[1, 4],
+    ...     cache_dir="./compile_cache",
+    ...     compile_kwargs={"mode": "max-autotune"},
+    ... )
+    >>> pipe.enable_compile_manager(manager)
+    >>> manager.warm_up(pipe)
+    >>> manager.save_artifacts()
+
+    >>> # a 448x512 request runs in the 512x512 bucket without recompiling
+    >>> image = pipe("a photo of a cat", height=448).images[0]
+    >>> manager.num_compilations, manager.warm_up_times
+    ```
+    """
+
+    def __init__(
+        self,
+        resolutions: Optional[List[Tuple[int, int]]] = None,
+        batch_sizes: Optional[List[int]] = None,
+        cache_dir: Optional[str] = None,
+        model_names: Sequence[str] = ("unet", "vae"),
+        compile_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        if is_torch_version("<", "2.0.0"):
+            raise ImportError("`CompileManager` requires PyTorch >= 2.0.0 for `torch.compile`.")
+        if batch_sizes is not None and any(batch_size < 1 for batch_size in batch_sizes):
+            raise ValueError(f"`batch_sizes` have to be positive integers but are {batch_sizes}.")
+
+        # smallest buckets first, so that requests snap to the smallest one that contains them
+        self.resolutions = sorted(resolutions or [], key=lambda size: (size[0] * size[1], size))
+        self.batch_sizes = sorted(set(batch_sizes or []))
+        self.cache_dir = cache_dir
+        self.model_names = list(model_names)
+        self.compile_kwargs = compile_kwargs or {}
+
+        self.num_compilations = defaultdict(int)
+        self.compile_times = defaultdict(float)
+        self.warm_up_times = {}
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # an inductor cache configured by the user takes precedence
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(os.path.join(cache_dir, "inductor")))
+            self.load_artifacts()
+
+    def get_shape_bucket(self, height: int, width: int) -> Tuple[int, int]:
+        r"""Returns the smallest bucket resolution that contains `height` x `width`, or the resolution itself."""
+        for bucket_height, bucket_width in self.resolutions:
+            if bucket_height >= height and bucket_width >= width:
+                return bucket_height, bucket_width
+        if len(self.resolutions) > 0:
+            logger.warning(
+                f"The resolution {height}x{width} doesn't fit in any of the buckets {self.resolutions}, the models are"
+                " compiled for it."
+            )
+        return height, width
+
+    def get_model_batch_bucket(self, batch_size: int) -> int:
+        r"""Returns the smallest bucket batch size of a model that is at least `batch_size`, or `batch_size` itself."""
+        model_batch_sizes = sorted(set(self.batch_sizes) | {2 * batch_size for batch_size in self.batch_sizes})
+        for bucket_batch_size in model_batch_sizes:
+            if bucket_batch_size >= batch_size:
+                return bucket_batch_size
+        return batch_size
+
+    @staticmethod
+    def pad_latents(latents: torch.Tensor, noise: torch.Tensor) -> torch.Tensor:
+        r"""Places `latents` at the center of `noise`, the initial latents of the bucket resolution."""
+        height, width = latents.shape[-2:]
+        top = (noise.shape[-2] - height) // 2
+        left = (noise.shape[-1] - width) // 2
+        noise = noise.clone()
+        noise[..., top : top + height, left : left + width] = latents
+        return noise
+
+    @staticmethod
+    def crop(images: torch.Tensor, height: int, width: int, scale_factor: int = 1) -> torch.Tensor:
+        r"""
+        Crops the `height` x `width` region of the last two dimensions of `images` that was generated from the latents
+        placed by [`~CompileManager.pad_latents`]. `scale_factor` is the ratio between the size of `images` and the
+        size of the latents, so that the offsets of the crop are the ones of the latents scaled up.
+        """
+        top = (images.shape[-2] // scale_factor - height // scale_factor) // 2 * scale_factor
+        left = (images.shape[-1] // scale_factor - width // scale_factor) // 2 * scale_factor
+        return images[..., top : top + height, left : left + width]
+
+    def compile(self, pipeline):
+        r"""Replaces the forward pass of the UNet and the `decode` method of the VAE of `pipeline` by compiled ones."""
+        # one graph per bucket, plus some room for requests that don't fit in any
+        num_buckets = max(len(self.resolutions), 1) * max(2 * len(self.batch_sizes), 1) + 8
+        config = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+        setattr(config, limit_name, max(getattr(config, limit_name), num_buckets))
+
+        for name in self.model_names:
+            model = getattr(pipeline, name, None)
+            if model is None:
+                continue
+            method_name = "decode" if name == "vae" else "forward"
+            if isinstance(model.__dict__.get(method_name), _BucketedFunction):
+                continue
+            setattr(model, method_name, _BucketedFunction(getattr(model, method_name), name, self))
+
+    def uncompile(self, pipeline):
+        r"""Restores the models of `pipeline` compiled by [`~CompileManager.compile`]."""
+        for name in self.model_names:
+            model = getattr(pipeline, name, None)
+            if model is None:
+                continue
+            method_name = "decode" if name == "vae" else "forward"
+            if isinstance(model.__dict__.get(method_name), _BucketedFunction):
+                delattr(model, method_name)
+
+    @torch.no_grad()
+    def warm_up(
+        self,
+        pipeline,
+        prompt: str = "",
+        num_inference_steps: int = 2,
+        classifier_free_guidance: Sequence[bool] = (True, False),
+        **kwargs,
+    ) -> Dict[Tuple[int, int, int, bool], float]:
+        r"""
+        Runs `pipeline` once for every resolution, batch size and classifier-free guidance bucket, which compiles the
+        models for all of them.
+
+        Args:
+            pipeline ([`DiffusionPipeline`]):
+                The pipeline, with the compile manager enabled.
+            prompt (`str`, *optional*, defaults to `""`):
+                The prompt of the warm-up generations.
+            num_inference_steps (`int`, *optional*, defaults to 2):
+                The number of denoising steps of the warm-up generations.
+            classifier_free_guidance (`Sequence[bool]`, *optional*, defaults to `(True, False)`):
+                Whether to warm up with and without classifier-free guidance.
+            kwargs:
+                Additional arguments of the pipeline call.
+
+        Returns:
+            `Dict[Tuple[int, int, int, bool], float]`: The duration of the warm-up generation in seconds for each
+            `(height, width, batch_size, classifier_free_guidance)` bucket, also stored in `warm_up_times`.
+        """
+        resolutions = self.resolutions or [(None, None)]
+        for height, width in resolutions:
+            for batch_size in self.batch_sizes or [1]:
+                for do_classifier_free_guidance in classifier_free_guidance:
+                    start = time.perf_counter()
+                    pipeline(
+                        [prompt] * batch_size,
+                        height=height,
+                        width=width,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=7.5 if do_classifier_free_guidance else 1.0,
+                        output_type="np",
+                        **kwargs,
+                    )
+                    self.warm_up_times[(height, width, batch_size, do_classifier_free_guidance)] = (
+                        time.perf_counter() - start
+                    )
+        return self.warm_up_times
+
+    def save_artifacts(self) -> bool:
+        r"""
+        Saves the cache artifacts of all compilations of this process to `cache_dir`. Returns whether artifacts were
+        saved, which requires a `cache_dir` and `torch.compiler.save_cache_artifacts`.
+        """
+        if self.cache_dir is None or not hasattr(torch.compiler, "save_cache_artifacts"):
+            return False
+        artifacts = torch.compiler.save_cache_artifacts()
+        if artifacts is None:
+            return False
+        with open(os.path.join(self.cache_dir, COMPILE_ARTIFACTS_NAME), "wb") as f:
+            f.write(artifacts[0])
+        return True
+
+    def load_artifacts(self) -> bool:
+        r"""Loads the cache artifacts saved by [`~CompileManager.save_artifacts`] and returns whether there were any."""
+        path = os.path.join(self.cache_dir, COMPILE_ARTIFACTS_NAME)
+        if not os.path.isfile(path) or not hasattr(torch.compiler, "load_cache_artifacts"):
+            return False
+        with open(path, "rb") as f:
+            torch.compiler.load_cache_artifacts(f.read())
+        return True
@@ -1,4 +1,6 @@
+import itertools
 import os
+import warnings
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import torch
@@ -6,12 +8,16 @@ from torch import nn
 
 from ...models.controlnet import ControlNetModel, ControlNetOutput
 from ...models.modeling_utils import ModelMixin
-from ...utils import logging
+from ...utils import is_torch_version, logging
 
 
 logger = logging.get_logger(__name__)
 
 
+if is_torch_version(">=", "2.0.0"):
+    from torch.func import functional_call
+
+
 class MultiControlNetModel(ModelMixin):
     r"""
     Multiple `ControlNetModel` wrapper class for Multi-ControlNet
@@ -28,6 +34,195 @@ class MultiControlNetModel(ModelMixin):
     def __init__(self, controlnets: Union[List[ControlNetModel], Tuple[ControlNetModel]]):
         super().__init__()
         self.nets = nn.ModuleList(controlnets)
+        self._batched_forward = False
+        self._batching_signatures = {}
+        self._stacked_weights = {}
+        self._streams = {}
+
+    def enable_batched_forward(self):
+        r"""
+        Runs ControlNets that share an architecture as a single batched forward pass over their stacked weights,
+        instead of one after the other. ControlNets with different architectures run concurrently on separate CUDA
+        streams. Batching only applies when gradients are disabled.
+
+        The stacked weights are a copy of the weights of the batched ControlNets, so they need as much extra memory.
+        They are created on the first forward pass and reused afterwards; call this method again after modifying the
+        weights of the ControlNets (for example after loading new weights or moving them to another device) to
+        recreate them.
+        """
+        self._batched_forward = True
+        self._batching_signatures = {}
+        self._stacked_weights = {}
+
+    def disable_batched_forward(self):
+        r"""
+        Runs the ControlNets one after the other and frees the stacked weights. This is the default.
+        """
+        self._batched_forward = False
+        self._batching_signatures = {}
+        self._stacked_weights = {}
+
+    def enable_residual_cache(
+        self,
+        cache_interval: int = 2,
+        cache_window: Optional[Tuple[int, int]] = None,
+        extrapolate: bool = False,
+    ):
+        r"""
+        Enables caching of the residuals of every ControlNet across denoising steps. See
+        [`~ControlNetModel.enable_residual_cache`] for the arguments. ControlNets with a residual cache are not batched.
+        """
+        for controlnet in self.nets:
+            controlnet.enable_residual_cache(cache_interval, cache_window=cache_window, extrapolate=extrapolate)
+
+    def disable_residual_cache(self):
+        r"""
+        Disables caching of the residuals of every ControlNet.
+        """
+        for controlnet in self.nets:
+            controlnet.disable_residual_cache()
+
+    def reset_residual_cache(self):
+        r"""
+        Drops the cached residuals and resets the cache statistics of every ControlNet.
+        """
+        for controlnet in self.nets:
+            controlnet.reset_residual_cache()
+
+    @property
+    def residual_cache_stats(self) -> Dict[str, int]:
+        r"""
+        Returns:
+            `dict` with the number of ControlNet forward passes that used cached residuals (`"hits"`) and that computed
+            them (`"misses"`), summed over all ControlNets.
+        """
+        stats = [controlnet.residual_cache_stats for controlnet in self.nets]
+        return {key: sum(stat[key] for stat in stats) for key in ("hits", "misses")}
+
+    def _can_batch(self) -> bool:
+        return self._batched_forward and not torch.is_grad_enabled() and is_torch_version(">=", "2.0.0")
+
+    def _batching_signature(self, controlnet: ControlNetModel, image: torch.Tensor):
+        if controlnet.residual_cache_interval is not None:
+            return None
+
+        # the signature of the weights is computed once per ControlNet, until batching is enabled again
+        if id(controlnet) not in self._batching_signatures:
+            tensors = tuple(
+                (name, tensor.shape, tensor.dtype, tensor.device)
+                for name, tensor in itertools.chain(controlnet.named_parameters(), controlnet.named_buffers())
+            )
+            offloaded = any(hasattr(module, "_hf_hook") for module in controlnet.modules())
+            if offloaded or any(device.type == "meta" for _, _, _, device in tensors):
+                self._batching_signatures[id(controlnet)] = None
+            else:
+                config = repr(
+                    sorted((key, value) for key, value in controlnet.config.items() if not key.startswith("_"))
+                )
+                processors = tuple(type(processor) for processor in controlnet.attn_processors.values())
+                self._batching_signatures[id(controlnet)] = (config, tensors, processors)
+
+        signature = self._batching_signatures[id(controlnet)]
+        return None if signature is None else (signature, image.shape)
+
+    def _get_stacked_weights(self, controlnets: List[ControlNetModel]) -> Dict[str, torch.Tensor]:
+        cache_key = tuple(id(net) for net in controlnets)
+        if cache_key not in self._stacked_weights:
+            states = [dict(itertools.chain(net.named_parameters(), net.named_buffers())) for net in controlnets]
+            # the stacked weights are copies, the weights of the ControlNets themselves are left untouched
+            self._stacked_weights[cache_key] = {
+                name: torch.stack([state[name].detach() for state in states]) for name in states[0]
+            }
+        return self._stacked_weights[cache_key]
+
+    def _batched_group_forward(
+        self,
+        controlnets: List[ControlNetModel],
+        controlnet_cond: List[torch.Tensor],
+        conditioning_scale: List[float],
+        **kwargs,
+    ) -> Tuple[List[torch.Tensor], torch.Tensor]:
+        if len(controlnets) == 1:
+            return controlnets[0](
+                controlnet_cond=controlnet_cond[0],
+                conditioning_scale=conditioning_scale[0],
+                return_dict=False,
+                **kwargs,
+            )
+
+        stacked_weights = self._get_stacked_weights(controlnets)
+        sample = kwargs["sample"]
+        scales = torch.tensor(conditioning_scale, device=sample.device, dtype=sample.dtype)
+
+        def controlnet_forward(weights, image, scale):
+            return functional_call(
+                controlnets[0],
+                weights,
+                (),
+                {**kwargs, "controlnet_cond": image, "conditioning_scale": scale, "return_dict": False},
+            )
+
+        with warnings.catch_warnings():
+            # attention has no batching rule on every backend and runs once per ControlNet
+            warnings.filterwarnings("ignore", message="There is a performance drop")
+            down_samples, mid_sample = torch.vmap(controlnet_forward)(
+                stacked_weights, torch.stack(controlnet_cond), scales
+            )
+
+        return [down_sample.sum(0) for down_sample in down_samples], mid_sample.sum(0)
+
+    def _batched_forward_pass(
+        self, controlnet_cond: List[torch.Tensor], conditioning_scale: List[float], **kwargs
+    ) -> Tuple[List[torch.Tensor], torch.Tensor]:
+        # ControlNets with a conditioning scale of 0 don't contribute to the residuals, unless they have a residual
+        # cache, which has to see every denoising step
+        active = [
+            i
+            for i, scale in enumerate(conditioning_scale)
+            if not (isinstance(scale, float) and scale == 0.0) or self.nets[i].residual_cache_interval is not None
+        ]
+        active = active or [0]
+
+        groups = {}
+        for i in active:
+            signature = self._batching_signature(self.nets[i], controlnet_cond[i])
+            groups.setdefault(signature if signature is not None else i, []).append(i)
+        groups = list(groups.values())
+
+        def run(group):
+            return self._batched_group_forward(
+                [self.nets[i] for i in group],
+                [controlnet_cond[i] for i in group],
+                [conditioning_scale[i] for i in group],
+                **kwargs,
+            )
+
+        sample = kwargs["sample"]
+        if len(groups) > 1 and sample.device.type == "cuda":
+            current_stream = torch.cuda.current_stream(sample.device)
+            streams = self._streams.setdefault(sample.device, [])
+            streams.extend(torch.cuda.Stream(sample.device) for _ in range(len(groups) - len(streams)))
+
+            outputs = []
+            for stream, group in zip(streams, groups):
+                stream.wait_stream(current_stream)
+                with torch.cuda.stream(stream):
+                    outputs.append(run(group))
+            for stream, (down_samples, mid_sample) in zip(streams, outputs):
+                current_stream.wait_stream(stream)
+                for output in [*down_samples, mid_sample]:
+                    output.record_stream(current_stream)
+        else:
+            outputs = [run(group) for group in groups]
+
+        # accumulate the residuals in place into the outputs of the first group
+        down_block_res_samples, mid_block_res_sample = outputs[0]
+        for down_samples, mid_sample in outputs[1:]:
+            for down_block_res_sample, down_sample in zip(down_block_res_samples, down_samples):
+                down_block_res_sample.add_(down_sample)
+            mid_block_res_sample.add_(mid_sample)
+
+        return down_block_res_samples, mid_block_res_sample
 
     def forward(
         self,
@@ -44,6 +239,21 @@ class MultiControlNetModel(ModelMixin):
         guess_mode: bool = False,
         return_dict: bool = True,
     ) -> Union[ControlNetOutput, Tuple]:
+        if self._can_batch():
+            return self._batched_forward_pass(
+                controlnet_cond,
+                conditioning_scale,
+                sample=sample,
+                timestep=timestep,
+                encoder_hidden_states=encoder_hidden_states,
+                class_labels=class_labels,
+                timestep_cond=timestep_cond,
+                attention_mask=attention_mask,
+                added_cond_kwargs=added_cond_kwargs,
+                cross_attention_kwargs=cross_attention_kwargs,
+                guess_mode=guess_mode,
+            )
+
         for i, (image, scale, controlnet) in enumerate(zip(controlnet_cond, conditioning_scale, self.nets)):
             down_samples, mid_sample = controlnet(
                 sample=sample,
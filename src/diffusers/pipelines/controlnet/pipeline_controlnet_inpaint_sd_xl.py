@@ -385,15 +385,28 @@ class StableDiffusionXLControlNetInpaintPipeline(
                         f" {tokenizer.model_max_length} tokens: {removed_text}"
                     )
 
-                prompt_embeds = text_encoder(text_input_ids.to(device), output_hidden_states=True)
+                cache_key, cached = None, None
+                if self.prompt_embeds_cache is not None:
+                    cache_key = self.prompt_embeds_cache.make_key(
+                        text_encoder, text_input_ids, clip_skip=clip_skip, lora_scale=lora_scale
+                    )
+                    cached = self.prompt_embeds_cache.get(cache_key)
 
-                # We are only ALWAYS interested in the pooled output of the final text encoder
-                pooled_prompt_embeds = prompt_embeds[0]
-                if clip_skip is None:
-                    prompt_embeds = prompt_embeds.hidden_states[-2]
+                if cached is not None:
+                    prompt_embeds, pooled_prompt_embeds = cached
                 else:
-                    # "2" because SDXL always indexes from the penultimate layer.
-                    prompt_embeds = prompt_embeds.hidden_states[-(clip_skip + 2)]
+                    prompt_embeds = text_encoder(text_input_ids.to(device), output_hidden_states=True)
+
+                    # We are only ALWAYS interested in the pooled output of the final text encoder
+                    pooled_prompt_embeds = prompt_embeds[0]
+                    if clip_skip is None:
+                        prompt_embeds = prompt_embeds.hidden_states[-2]
+                    else:
+                        # "2" because SDXL always indexes from the penultimate layer.
+                        prompt_embeds = prompt_embeds.hidden_states[-(clip_skip + 2)]
+
+                    if cache_key is not None:
+                        self.prompt_embeds_cache.put(cache_key, (prompt_embeds, pooled_prompt_embeds))
 
                 prompt_embeds_list.append(prompt_embeds)
 
@@ -443,13 +456,28 @@ class StableDiffusionXLControlNetInpaintPipeline(
                     return_tensors="pt",
                 )
 
-                negative_prompt_embeds = text_encoder(
-                    uncond_input.input_ids.to(device),
-                    output_hidden_states=True,
-                )
-                # We are only ALWAYS interested in the pooled output of the final text encoder
-                negative_pooled_prompt_embeds = negative_prompt_embeds[0]
-                negative_prompt_embeds = negative_prompt_embeds.hidden_states[-2]
+                cache_key, cached = None, None
+                if self.prompt_embeds_cache is not None:
+                    cache_key = self.prompt_embeds_cache.make_key(
+                        text_encoder, uncond_input.input_ids, lora_scale=lora_scale
+                    )
+                    cached = self.prompt_embeds_cache.get(cache_key)
+
+                if cached is not None:
+                    negative_prompt_embeds, negative_pooled_prompt_embeds = cached
+                else:
+                    negative_prompt_embeds = text_encoder(
+                        uncond_input.input_ids.to(device),
+                        output_hidden_states=True,
+                    )
+                    # We are only ALWAYS interested in the pooled output of the final text encoder
+                    negative_pooled_prompt_embeds = negative_prompt_embeds[0]
+                    negative_prompt_embeds = negative_prompt_embeds.hidden_states[-2]
+
+                    if cache_key is not None:
+                        self.prompt_embeds_cache.put(
+                            cache_key, (negative_prompt_embeds, negative_pooled_prompt_embeds)
+                        )
 
                 negative_prompt_embeds_list.append(negative_prompt_embeds)
 
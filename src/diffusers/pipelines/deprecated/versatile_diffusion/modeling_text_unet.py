@@ -364,6 +364,7 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
     """
 
     _supports_gradient_checkpointing = True
+    _streaming_blocks = ["down_blocks", "mid_block", "up_blocks"]
 
     @register_to_config
     def __init__(
@@ -825,6 +826,10 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
                 positive_len=positive_len, out_dim=cross_attention_dim, feature_type=feature_type
             )
 
+        self.deep_cache_interval = None
+        self.deep_cache_block_id = None
+        self._deep_cache = {}
+
     @property
     def attn_processors(self) -> Dict[str, AttentionProcessor]:
         r"""
@@ -999,6 +1004,66 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
                 if hasattr(upsample_block, k) or getattr(upsample_block, k, None) is not None:
                     setattr(upsample_block, k, None)
 
+    def enable_deep_cache(self, cache_interval: int = 3, cache_block_id: int = 0):
+        r"""Enables the DeepCache mechanism from https://arxiv.org/abs/2312.00858.
+
+        The high-level features computed by the deep blocks of the UNet change slowly between consecutive denoising
+        steps. With DeepCache, a full forward pass only runs every `cache_interval` steps and caches the input of the
+        up block that mirrors `down_blocks[cache_block_id]`. The steps in between are shallow: only the down blocks up
+        to `cache_block_id` and their matching up blocks are recomputed, and the cached features stand in for the
+        deeper blocks.
+
+        A full step also runs whenever the shape of the input changes or the timestep does not decrease, which is the
+        case at the start of every denoising loop. Call [`~UNetFlatConditionModel.reset_deep_cache`] to force one.
+
+        Args:
+            cache_interval (`int`, *optional*, defaults to 3):
+                Number of steps between two full forward passes. `1` runs a full forward pass at every step.
+            cache_block_id (`int`, *optional*, defaults to 0):
+                Index of the deepest down block that is recomputed on shallow steps. Larger values are slower but
+                closer to the output without caching.
+        """
+        if cache_interval < 1:
+            raise ValueError(f"`cache_interval` has to be a positive integer but is {cache_interval}.")
+        if not 0 <= cache_block_id < len(self.down_blocks):
+            raise ValueError(
+                f"`cache_block_id` has to be between 0 and {len(self.down_blocks) - 1} but is {cache_block_id}."
+            )
+        self.deep_cache_interval = cache_interval
+        self.deep_cache_block_id = cache_block_id
+        self.reset_deep_cache()
+
+    def disable_deep_cache(self):
+        """Disables the DeepCache mechanism."""
+        self.deep_cache_interval = None
+        self.deep_cache_block_id = None
+        self.reset_deep_cache()
+
+    def reset_deep_cache(self):
+        """Drops the cached features so that the next forward pass is a full step."""
+        self._deep_cache = {}
+
+    def _get_deep_cache_block_id(self, sample: torch.FloatTensor, timesteps: torch.Tensor) -> Optional[int]:
+        # returns `None` for a full step and the index of the deepest recomputed down block for a shallow step
+        state = self._deep_cache
+        timestep = timesteps.max().item()
+        if state.get("features") is None or state["sample_shape"] != sample.shape or timestep >= state["timestep"]:
+            state["step"] = 0
+
+        is_full_step = state["step"] % self.deep_cache_interval == 0
+        state["step"] += 1
+        state["timestep"] = timestep
+        state["sample_shape"] = sample.shape
+        if is_full_step:
+            state["features"] = None
+            return None
+        return self.deep_cache_block_id
+
+    def _embed_timesteps(self, timesteps: torch.Tensor) -> torch.FloatTensor:
+        # the part of the time embedding that only depends on the timesteps, cached by `precompute_timestep_embeddings`
+        t_emb = self.time_proj(timesteps).to(dtype=self.dtype)
+        return self.time_embedding(t_emb)
+
     def fuse_qkv_projections(self):
         """
         Enables fused QKV projections. For self-attention modules, all projection matrices (i.e., query,
@@ -1174,14 +1239,22 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
         # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
         timesteps = timesteps.expand(sample.shape[0])
 
-        t_emb = self.time_proj(timesteps)
+        deep_cache_block_id = None
+        if self.deep_cache_interval is not None:
+            deep_cache_block_id = self._get_deep_cache_block_id(sample, timesteps)
+
+        emb = self._get_cached_timestep_embedding(timesteps) if timestep_cond is None else None
+        if emb is None:
+            t_emb = self.time_proj(timesteps)
 
-        # `Timesteps` does not contain any weights and will always return f32 tensors
-        # but time_embedding might actually be running in fp16. so we need to cast here.
-        # there might be better ways to encapsulate this.
-        t_emb = t_emb.to(dtype=sample.dtype)
+            # `Timesteps` does not contain any weights and will always return f32 tensors
+            # but time_embedding might actually be running in fp16. so we need to cast here.
+            # there might be better ways to encapsulate this.
+            t_emb = t_emb.to(dtype=sample.dtype)
 
-        emb = self.time_embedding(t_emb, timestep_cond)
+            emb = self.time_embedding(t_emb, timestep_cond)
+        else:
+            emb = emb.to(dtype=sample.dtype)
         aug_emb = None
 
         if self.class_embedding is not None:
@@ -1226,11 +1299,14 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
                     f"{self.__class__} has the config param `addition_embed_type` set to 'text_time' which requires the keyword argument `time_ids` to be passed in `added_cond_kwargs`"
                 )
             time_ids = added_cond_kwargs.get("time_ids")
-            time_embeds = self.add_time_proj(time_ids.flatten())
-            time_embeds = time_embeds.reshape((text_embeds.shape[0], -1))
-            add_embeds = torch.concat([text_embeds, time_embeds], dim=-1)
-            add_embeds = add_embeds.to(emb.dtype)
-            aug_emb = self.add_embedding(add_embeds)
+            aug_emb = self._get_cached_condition_embedding("text_time", (text_embeds, time_ids))
+            if aug_emb is None:
+                time_embeds = self.add_time_proj(time_ids.flatten())
+                time_embeds = time_embeds.reshape((text_embeds.shape[0], -1))
+                add_embeds = torch.concat([text_embeds, time_embeds], dim=-1)
+                add_embeds = add_embeds.to(emb.dtype)
+                aug_emb = self.add_embedding(add_embeds)
+                self._set_cached_condition_embedding("text_time", (text_embeds, time_ids), aug_emb)
         elif self.config.addition_embed_type == "image":
             # Kandinsky 2.2 - style
             if "image_embeds" not in added_cond_kwargs:
@@ -1316,8 +1392,11 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
             down_intrablock_additional_residuals = down_block_additional_residuals
             is_adapter = True
 
+        # on DeepCache shallow steps only the outer down blocks are recomputed
+        down_blocks = self.down_blocks if deep_cache_block_id is None else self.down_blocks[: deep_cache_block_id + 1]
+
         down_block_res_samples = (sample,)
-        for downsample_block in self.down_blocks:
+        for downsample_block in down_blocks:
             if hasattr(downsample_block, "has_cross_attention") and downsample_block.has_cross_attention:
                 # For t2i-adapter CrossAttnDownBlockFlat
                 additional_residuals = {}
@@ -1352,7 +1431,7 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
             down_block_res_samples = new_down_block_res_samples
 
         # 4. mid
-        if self.mid_block is not None:
+        if self.mid_block is not None and deep_cache_block_id is None:
             if hasattr(self.mid_block, "has_cross_attention") and self.mid_block.has_cross_attention:
                 sample = self.mid_block(
                     sample,
@@ -1373,13 +1452,26 @@ class UNetFlatConditionModel(ModelMixin, ConfigMixin):
             ):
                 sample += down_intrablock_additional_residuals.pop(0)
 
-        if is_controlnet:
+        if is_controlnet and deep_cache_block_id is None:
             sample = sample + mid_block_additional_residual
 
         # 5. up
-        for i, upsample_block in enumerate(self.up_blocks):
+        up_block_start = 0
+        if self.deep_cache_interval is not None:
+            deep_cache_up_block_id = len(self.up_blocks) - 1 - self.deep_cache_block_id
+            if deep_cache_block_id is not None:
+                # DeepCache shallow step: the cached features replace the deeper blocks
+                up_block_start = deep_cache_up_block_id
+                sample = self._deep_cache["features"]
+                num_res_samples = sum(len(block.resnets) for block in self.up_blocks[up_block_start:])
+                down_block_res_samples = down_block_res_samples[:num_res_samples]
+
+        for i, upsample_block in enumerate(self.up_blocks[up_block_start:], start=up_block_start):
             is_final_block = i == len(self.up_blocks) - 1
 
+            if self.deep_cache_interval is not None and i == deep_cache_up_block_id:
+                self._deep_cache["features"] = sample
+
             res_samples = down_block_res_samples[-len(upsample_block.resnets) :]
             down_block_res_samples = down_block_res_samples[: -len(upsample_block.resnets)]
 
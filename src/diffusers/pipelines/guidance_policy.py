@@ -0,0 +1,77 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+from typing import List, Union
+
+import torch
+
+
+class GuidancePolicy:
+    r"""
+    Decides at every denoising step how classifier-free guidance is computed. By default, the unconditional and the
+    conditional noise predictions are computed at every step, which doubles the batch size of the UNet.
+
+    With `guidance_end < 1.0`, guidance is dropped for the last steps, where the image content is already fixed, and
+    only the conditional branch runs. With `uncond_interval > 1`, the unconditional prediction is only computed every
+    `uncond_interval` steps and the most recent one is reused in between.
+
+    Subclass [`GuidancePolicy`] and override [`~GuidancePolicy.do_guidance`] and [`~GuidancePolicy.compute_uncond`]
+    to implement other schedules.
+
+    Args:
+        guidance_end (`float`, *optional*, defaults to 1.0):
+            Fraction of the denoising steps, counted from the start, that use classifier-free guidance.
+        uncond_interval (`int`, *optional*, defaults to 1):
+            Number of steps between two computations of the unconditional noise prediction.
+    """
+
+    def __init__(self, guidance_end: float = 1.0, uncond_interval: int = 1):
+        if not 0.0 <= guidance_end <= 1.0:
+            raise ValueError(f"`guidance_end` has to be between 0 and 1 but is {guidance_end}.")
+        if uncond_interval < 1:
+            raise ValueError(f"`uncond_interval` has to be a positive integer but is {uncond_interval}.")
+
+        self.guidance_end = guidance_end
+        self.uncond_interval = uncond_interval
+
+    def do_guidance(self, step_index: int, num_steps: int) -> bool:
+        r"""Whether classifier-free guidance is applied at step `step_index` out of `num_steps`."""
+        return step_index < math.ceil(self.guidance_end * num_steps)
+
+    def compute_uncond(self, step_index: int, num_steps: int) -> bool:
+        r"""
+        Whether the unconditional noise prediction is computed at step `step_index` out of `num_steps`. It has to be
+        computed at the first guided step, later guided steps reuse the most recent one when this returns `False`.
+        """
+        return self.do_guidance(step_index, num_steps) and step_index % self.uncond_interval == 0
+
+
+def prepare_guidance_scale(
+    guidance_scale: Union[float, List[float], torch.Tensor], batch_size: int, num_images_per_prompt: int
+) -> Union[float, torch.Tensor]:
+    r"""
+    Validates a per-prompt guidance scale and expands it to one value per generated image, so that requests with
+    different guidance scales can share a batch. Scalars are returned unchanged.
+    """
+    if not isinstance(guidance_scale, (list, tuple, torch.Tensor)):
+        return guidance_scale
+
+    guidance_scale = torch.as_tensor(guidance_scale, dtype=torch.float32).flatten()
+    if len(guidance_scale) != batch_size:
+        raise ValueError(
+            f"`guidance_scale` has {len(guidance_scale)} values, but the batch size of `prompt` is {batch_size}."
+            " Please pass one guidance scale per prompt."
+        )
+    return guidance_scale.repeat_interleave(num_images_per_prompt)
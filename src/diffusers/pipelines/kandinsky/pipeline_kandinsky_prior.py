@@ -476,6 +476,7 @@ class KandinskyPriorPipeline(DiffusionPipeline):
         # prior
         self.scheduler.set_timesteps(num_inference_steps, device=device)
         prior_timesteps_tensor = self.scheduler.timesteps
+        self.prior.precompute_timestep_embeddings(prior_timesteps_tensor)
 
         embedding_dim = self.prior.config.embedding_dim
 
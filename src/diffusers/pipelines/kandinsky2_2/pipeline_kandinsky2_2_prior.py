@@ -468,6 +468,7 @@ class KandinskyV22PriorPipeline(DiffusionPipeline):
         # prior
         self.scheduler.set_timesteps(num_inference_steps, device=device)
         timesteps = self.scheduler.timesteps
+        self.prior.precompute_timestep_embeddings(timesteps)
 
         embedding_dim = self.prior.config.embedding_dim
 
@@ -13,13 +13,16 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextlib
 import fnmatch
 import importlib
 import inspect
 import os
 import re
 import sys
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Union
@@ -42,7 +45,7 @@ from tqdm.auto import tqdm
 
 from .. import __version__
 from ..configuration_utils import ConfigMixin
-from ..models.modeling_utils import _LOW_CPU_MEM_USAGE_DEFAULT
+from ..models.modeling_utils import _LOW_CPU_MEM_USAGE_DEFAULT, _MODEL_INIT_LOCK
 from ..schedulers.scheduling_utils import SCHEDULER_CONFIG_NAME
 from ..utils import (
     CONFIG_NAME,
@@ -62,6 +65,8 @@ from ..utils import (
 )
 from ..utils.hub_utils import load_or_create_model_card, populate_model_card
 from ..utils.torch_utils import is_compiled_module
+from .compile_manager import CompileManager
+from .prompt_embeds_cache import PromptEmbedsCache
 
 
 if is_transformers_available():
@@ -437,6 +442,7 @@ def load_sub_model(
     low_cpu_mem_usage: bool,
     cached_folder: Union[str, os.PathLike],
     revision: str = None,
+    mmap: bool = False,
 ):
     """Helper method to load the module `name` from `library_name` and `class_name`"""
     # retrieve class candidates
@@ -526,12 +532,20 @@ def load_sub_model(
         else:
             loading_kwargs["low_cpu_mem_usage"] = False
 
+    if is_diffusers_model and mmap:
+        loading_kwargs["mmap"] = True
+
+    # diffusers models only hold the lock while they are instantiated and load their weights concurrently, other
+    # libraries may patch global state while loading and are therefore loaded one at a time
+    load_lock = contextlib.nullcontext() if is_diffusers_model else _MODEL_INIT_LOCK
+
     # check if the module is in a subdirectory
-    if os.path.isdir(os.path.join(cached_folder, name)):
-        loaded_sub_model = load_method(os.path.join(cached_folder, name), **loading_kwargs)
-    else:
-        # else load from the root directory
-        loaded_sub_model = load_method(cached_folder, **loading_kwargs)
+    with load_lock:
+        if os.path.isdir(os.path.join(cached_folder, name)):
+            loaded_sub_model = load_method(os.path.join(cached_folder, name), **loading_kwargs)
+        else:
+            # else load from the root directory
+            loaded_sub_model = load_method(cached_folder, **loading_kwargs)
 
     return loaded_sub_model
 
@@ -590,6 +604,9 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
     _exclude_from_cpu_offload = []
     _load_connected_pipes = False
     _is_onnx = False
+    prompt_embeds_cache = None
+    compile_manager = None
+    component_load_times = None
 
     def register_modules(self, **kwargs):
         for name, module in kwargs.items():
@@ -1049,6 +1066,14 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             variant (`str`, *optional*):
                 Load weights from a specified variant filename such as `"fp16"` or `"ema"`. This is ignored when
                 loading `from_flax`.
+            mmap (`bool`, *optional*, defaults to `False`):
+                Whether to memory-map the checkpoints of the 🤗 Diffusers models instead of reading them into memory.
+                See [`~ModelMixin.from_pretrained`] for more details.
+            max_loading_workers (`int`, *optional*):
+                The number of threads used to load the pipeline components concurrently. The weights of the 🤗
+                Diffusers models, such as the UNet and the VAE, are read and copied in parallel with each other and
+                with the other components. Defaults to loading the components one after another. The time it took to
+                load each component is logged and stored in `component_load_times`.
 
         <Tip>
 
@@ -1099,6 +1124,8 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
         use_safetensors = kwargs.pop("use_safetensors", None)
         use_onnx = kwargs.pop("use_onnx", None)
         load_connected_pipeline = kwargs.pop("load_connected_pipeline", False)
+        max_loading_workers = kwargs.pop("max_loading_workers", None)
+        mmap = kwargs.pop("mmap", False)
 
         # 1. Download the checkpoints and configs
         # use snapshot download here to get it working from from_pretrained
@@ -1263,14 +1290,46 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
         from diffusers import pipelines
 
         # 6. Load each module in the pipeline
-        for name, (library_name, class_name) in logging.tqdm(init_dict.items(), desc="Loading pipeline components..."):
+        def load_component(name, library_name, class_name, is_pipeline_module):
+            start_time = time.perf_counter()
+            loaded_sub_model = load_sub_model(
+                library_name=library_name,
+                class_name=class_name,
+                importable_classes=ALL_IMPORTABLE_CLASSES,
+                pipelines=pipelines,
+                is_pipeline_module=is_pipeline_module,
+                pipeline_class=pipeline_class,
+                torch_dtype=torch_dtype,
+                provider=provider,
+                sess_options=sess_options,
+                device_map=device_map,
+                max_memory=max_memory,
+                offload_folder=offload_folder,
+                offload_state_dict=offload_state_dict,
+                model_variants=model_variants,
+                name=name,
+                from_flax=from_flax,
+                variant=variant,
+                low_cpu_mem_usage=low_cpu_mem_usage,
+                cached_folder=cached_folder,
+                revision=revision,
+                mmap=mmap,
+            )
+            load_time = time.perf_counter() - start_time
+            logger.info(
+                f"Loaded {name} as {class_name} from `{name}` subfolder of {pretrained_model_name_or_path} in"
+                f" {load_time:.2f}s."
+            )
+            return loaded_sub_model, load_time
+
+        components_to_load = {}
+        for name, (library_name, class_name) in init_dict.items():
             # 6.1 - now that JAX/Flax is an official framework of the library, we might load from Flax names
             class_name = class_name[4:] if class_name.startswith("Flax") else class_name
 
             # 6.2 Define all importable classes
             is_pipeline_module = hasattr(pipelines, library_name)
             importable_classes = ALL_IMPORTABLE_CLASSES
-            loaded_sub_model = None
 
             # 6.3 Use passed sub model or load class_name from library_name
             if name in passed_class_obj:
@@ -1280,36 +1339,33 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
                     library_name, library, class_name, importable_classes, passed_class_obj, name, is_pipeline_module
                 )
 
-                loaded_sub_model = passed_class_obj[name]
+                init_kwargs[name] = passed_class_obj[name]
             else:
-                # load sub model
-                loaded_sub_model = load_sub_model(
-                    library_name=library_name,
-                    class_name=class_name,
-                    importable_classes=importable_classes,
-                    pipelines=pipelines,
-                    is_pipeline_module=is_pipeline_module,
-                    pipeline_class=pipeline_class,
-                    torch_dtype=torch_dtype,
-                    provider=provider,
-                    sess_options=sess_options,
-                    device_map=device_map,
-                    max_memory=max_memory,
-                    offload_folder=offload_folder,
-                    offload_state_dict=offload_state_dict,
-                    model_variants=model_variants,
-                    name=name,
-                    from_flax=from_flax,
-                    variant=variant,
-                    low_cpu_mem_usage=low_cpu_mem_usage,
-                    cached_folder=cached_folder,
-                    revision=revision,
-                )
-                logger.info(
-                    f"Loaded {name} as {class_name} from `{name}` subfolder of {pretrained_model_name_or_path}."
-                )
+                components_to_load[name] = (library_name, class_name, is_pipeline_module)
+
+        # 6.4 Load the remaining sub models, concurrently if `max_loading_workers` is set
+        loaded_components = {}
+        component_load_times = {}
+        progress_bar = logging.tqdm(total=len(components_to_load), desc="Loading pipeline components...")
+        if max_loading_workers is not None and max_loading_workers > 1 and len(components_to_load) > 1:
+            with ThreadPoolExecutor(max_workers=max_loading_workers) as executor:
+                futures = {
+                    executor.submit(load_component, name, *component): name
+                    for name, component in components_to_load.items()
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    loaded_components[name], component_load_times[name] = future.result()
+                    progress_bar.update()
+        else:
+            for name, component in components_to_load.items():
+                loaded_components[name], component_load_times[name] = load_component(name, *component)
+                progress_bar.update()
+        progress_bar.close()
 
-            init_kwargs[name] = loaded_sub_model  # UNet(...), # DiffusionSchedule(...)
+        # keep the order of the pipeline config
+        for name in components_to_load:
+            init_kwargs[name] = loaded_components[name]  # UNet(...), # DiffusionSchedule(...)
 
         if pipeline_class._load_connected_pipes and os.path.isfile(os.path.join(cached_folder, "README.md")):
             modelcard = ModelCard.load(os.path.join(cached_folder, "README.md"))
@@ -1334,6 +1390,8 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
                 "low_cpu_mem_usage": low_cpu_mem_usage,
                 "variant": variant,
                 "use_safetensors": use_safetensors,
+                "max_loading_workers": max_loading_workers,
+                "mmap": mmap,
             }
 
             def get_connected_passed_kwargs(prefix):
@@ -1376,6 +1434,7 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
 
         # 8. Instantiate the pipeline
         model = pipeline_class(**init_kwargs)
+        model.component_load_times = component_load_times
 
         # 9. Save where the model was instantiated from
         model.register_to_config(_name_or_path=pretrained_model_name_or_path)
@@ -1407,7 +1466,9 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
                     return torch.device(module._hf_hook.execution_device)
         return self.device
 
-    def enable_model_cpu_offload(self, gpu_id: Optional[int] = None, device: Union[torch.device, str] = "cuda"):
+    def enable_model_cpu_offload(
+        self, gpu_id: Optional[int] = None, device: Union[torch.device, str] = "cuda", prefetch: bool = False
+    ):
         r"""
         Offloads all models to CPU using accelerate, reducing memory usage with a low impact on performance. Compared
         to `enable_sequential_cpu_offload`, this method moves one whole model at a time to the GPU when its `forward`
@@ -1420,6 +1481,11 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             device (`torch.Device` or `str`, *optional*, defaults to "cuda"):
                 The PyTorch device type of the accelerator that shall be used in inference. If not specified, it will
                 default to "cuda".
+            prefetch (`bool`, *optional*, defaults to `False`):
+                Whether to copy the next model of `model_cpu_offload_seq` to the GPU on a separate CUDA stream while
+                the current model runs. The models are kept in pinned CPU memory and their hooks persist across
+                pipeline calls, which hides most of the offloading overhead. Up to two models of the sequence are on
+                the GPU at the same time.
         """
         if self.model_cpu_offload_seq is None:
             raise ValueError(
@@ -1452,6 +1518,15 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             if hasattr(device_mod, "empty_cache") and device_mod.is_available():
                 device_mod.empty_cache()  # otherwise we don't see the memory savings (but they probably exist)
 
+        if getattr(self, "_offload_chain", None) is not None:
+            self._offload_chain.remove()
+            self._offload_chain = None
+
+        if prefetch:
+            from ..utils.offload_utils import ModelOffloadChain
+
+            self._offload_chain = ModelOffloadChain(device)
+
         all_model_components = {k: v for k, v in self.components.items() if isinstance(v, torch.nn.Module)}
 
         self._all_hooks = []
@@ -1461,7 +1536,10 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             if not isinstance(model, torch.nn.Module):
                 continue
 
-            _, hook = cpu_offload_with_hook(model, device, prev_module_hook=hook)
+            if prefetch:
+                hook = self._offload_chain.add(model)
+            else:
+                _, hook = cpu_offload_with_hook(model, device, prev_module_hook=hook)
             self._all_hooks.append(hook)
 
         # CPU offload models that are not in the seq chain unless they are explicitly excluded
@@ -1473,6 +1551,9 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
 
             if name in self._exclude_from_cpu_offload:
                 model.to(device)
+            elif prefetch:
+                hook = self._offload_chain.add(model, in_sequence=False)
+                self._all_hooks.append(hook)
             else:
                 _, hook = cpu_offload_with_hook(model, device)
                 self._all_hooks.append(hook)
@@ -1488,6 +1569,11 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             # `enable_model_cpu_offload` has not be called, so silently do nothing
             return
 
+        if getattr(self, "_offload_chain", None) is not None:
+            # the hooks of the prefetching offload persist across calls, only the models have to be offloaded
+            self._offload_chain.offload_all()
+            return
+
         for hook in self._all_hooks:
             # offload model and remove hook from model
             hook.offload()
@@ -1496,7 +1582,14 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
         # make sure the model is in the same state as before calling it
         self.enable_model_cpu_offload()
 
-    def enable_sequential_cpu_offload(self, gpu_id: Optional[int] = None, device: Union[torch.device, str] = "cuda"):
+    def enable_sequential_cpu_offload(
+        self,
+        gpu_id: Optional[int] = None,
+        device: Union[torch.device, str] = "cuda",
+        block_streaming: bool = False,
+        window_size: Optional[int] = None,
+        memory_budget: Optional[Union[int, str]] = None,
+    ):
         r"""
         Offloads all models to CPU using 🤗 Accelerate, significantly reducing memory usage. When called, the state
         dicts of all `torch.nn.Module` components (except those in `self._exclude_from_cpu_offload`) are saved to CPU
@@ -1510,6 +1603,15 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
             device (`torch.Device` or `str`, *optional*, defaults to "cuda"):
                 The PyTorch device type of the accelerator that shall be used in inference. If not specified, it will
                 default to "cuda".
+            block_streaming (`bool`, *optional*, defaults to `False`):
+                Whether to offload models that support it, like the UNet and the transformer models, block by block
+                with [`~ModelMixin.enable_block_streaming`] instead of submodule by submodule. A window of blocks is
+                copied to the GPU asynchronously while the current block runs, which is much faster.
+            window_size (`int`, *optional*):
+                Number of blocks after the running one that are kept on the GPU when `block_streaming=True`.
+            memory_budget (`int` or `str`, *optional*):
+                GPU memory available for the weights of each streamed model, in bytes or as a string like `"4GB"`. Used
+                to choose the largest `window_size` that fits when `block_streaming=True`.
         """
         if is_accelerate_available() and is_accelerate_version(">=", "0.14.0"):
             from accelerate import cpu_offload
@@ -1543,6 +1645,8 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
 
             if name in self._exclude_from_cpu_offload:
                 model.to(device)
+            elif block_streaming and getattr(model, "_streaming_blocks", None) is not None:
+                model.enable_block_streaming(device, window_size=window_size, memory_budget=memory_budget)
             else:
                 # make sure to offload buffers if not all high level weights
                 # are of type nn.Module
@@ -2108,6 +2212,65 @@ class DiffusionPipeline(ConfigMixin, PushToHubMixin):
         # set slice_size = `None` to disable `attention slicing`
         self.enable_attention_slicing(None)
 
+    def enable_prompt_embeds_cache(self, cache: Optional[PromptEmbedsCache] = None, max_size: int = 32):
+        r"""
+        Cache the outputs of the text encoders so that `encode_prompt` only runs them for prompts that haven't been seen
+        before. This is useful when many requests share the same prompts or negative prompts. The cache is available
+        as `pipeline.prompt_embeds_cache` and exposes its number of `hits` and `misses`.
+
+        Args:
+            cache ([`PromptEmbedsCache`], *optional*):
+                The cache to use, for example one that is shared between several pipelines. If `None`, a new
+                [`PromptEmbedsCache`] of size `max_size` is created.
+            max_size (`int`, *optional*, defaults to 32):
+                The maximum number of cached text encoder outputs if `cache` is `None`.
+
+        Examples:
+
+        ```py
+        >>> import torch
+        >>> from diffusers import StableDiffusionPipeline
+
+        >>> pipe = StableDiffusionPipeline.from_pretrained("runwayml/stable-diffusion-v1-5", torch_dtype=torch.float16)
+        >>> pipe = pipe.to("cuda")
+        >>> pipe.enable_prompt_embeds_cache(max_size=64)
+
+        >>> for seed in range(4):
+        ...     image = pipe("a photo of a cat", generator=torch.manual_seed(seed)).images[0]
+        >>> pipe.prompt_embeds_cache.hits, pipe.prompt_embeds_cache.misses
+        (6, 2)
+        ```
+        """
+        self.prompt_embeds_cache = cache if cache is not None else PromptEmbedsCache(max_size=max_size)
+
+    def disable_prompt_embeds_cache(self):
+        r"""
+        Disable the text encoder output cache enabled with [`~DiffusionPipeline.enable_prompt_embeds_cache`].
+        """
+        self.prompt_embeds_cache = None
+
+    def enable_compile_manager(self, manager: CompileManager):
+        r"""
+        Compile the UNet and the VAE decoder with `torch.compile` for the shape buckets of a [`CompileManager`]. The
+        manager is available as `pipeline.compile_manager` and exposes the number of compilations and the compile and
+        warm-up times of the models. [`StableDiffusionPipeline`] and [`StableDiffusionXLPipeline`] also snap the
+        requested resolution to the buckets of the manager.
+
+        Args:
+            manager ([`CompileManager`]):
+                The compile manager, see its documentation for an example.
+        """
+        manager.compile(self)
+        self.compile_manager = manager
+
+    def disable_compile_manager(self):
+        r"""
+        Restore the models compiled with [`~DiffusionPipeline.enable_compile_manager`].
+        """
+        if self.compile_manager is not None:
+            self.compile_manager.uncompile(self)
+        self.compile_manager = None
+
     def set_attention_slice(self, slice_size: Optional[int]):
         module_names, _ = self._get_signature_keys(self)
         modules = [getattr(self, n, None) for n in module_names]
@@ -829,6 +829,7 @@ class PixArtAlphaPipeline(DiffusionPipeline):
 
         # 4. Prepare timesteps
         timesteps, num_inference_steps = retrieve_timesteps(self.scheduler, num_inference_steps, device, timesteps)
+        self.transformer.precompute_timestep_embeddings(timesteps)
 
         # 5. Prepare latents.
         latent_channels = self.transformer.config.in_channels
@@ -0,0 +1,138 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import weakref
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import torch
+
+
+def _get_lora_state(text_encoder: torch.nn.Module) -> tuple:
+    # Everything about the LoRA layers of `text_encoder` that changes its output: loaded, active, fused and disabled
+    # adapters as well as their scales, for both the PEFT backend and the legacy patched projections.
+    state = []
+    for name, module in text_encoder.named_modules():
+        if hasattr(module, "active_adapters") and hasattr(module, "scaling"):
+            state.append(
+                (
+                    name,
+                    tuple(module.active_adapters),
+                    tuple(module.merged_adapters),
+                    module.disable_adapters,
+                    tuple(sorted(module.scaling.items())),
+                )
+            )
+        elif hasattr(module, "lora_linear_layer"):
+            state.append(
+                (name, id(module.lora_linear_layer), module.lora_scale, getattr(module, "w_up", None) is not None)
+            )
+    return tuple(state)
+
+
+class PromptEmbedsCache:
+    r"""
+    A size-bounded LRU cache for the outputs of text encoders, used by `encode_prompt` once enabled with
+    [`~DiffusionPipeline.enable_prompt_embeds_cache`].
+
+    Entries are keyed on the token ids passed to the text encoder together with everything else that changes its
+    output: the text encoder itself, the size of its vocabulary (textual inversion), the state of its LoRA layers, the
+    LoRA scale and `clip_skip`. Loading, fusing or switching adapters and swapping the text encoder therefore never
+    return stale embeddings, outdated entries are simply evicted over time. Call [`~PromptEmbedsCache.clear`] after
+    modifying the weights of a text encoder in place by other means.
+
+    To store the embeddings somewhere else, for example on the CPU or in a cache shared between processes, subclass
+    [`PromptEmbedsCache`] and override [`~PromptEmbedsCache.get`], [`~PromptEmbedsCache.put`] and
+    [`~PromptEmbedsCache.clear`].
+
+    Args:
+        max_size (`int`, *optional*, defaults to 32):
+            The maximum number of cached text encoder outputs. The least recently used entry is evicted first.
+    """
+
+    def __init__(self, max_size: int = 32):
+        if max_size < 1:
+            raise ValueError(f"`max_size` has to be a positive integer but is {max_size}.")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(
+        text_encoder: torch.nn.Module,
+        text_input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor] = None,
+        clip_skip: Optional[int] = None,
+        lora_scale: Optional[float] = None,
+    ) -> Hashable:
+        r"""
+        Builds the cache key for encoding `text_input_ids` with `text_encoder`.
+
+        Args:
+            text_encoder (`torch.nn.Module`):
+                The text encoder that produces the embeddings.
+            text_input_ids (`torch.Tensor`):
+                The token ids returned by the tokenizer.
+            attention_mask (`torch.Tensor`, *optional*):
+                The attention mask passed to the text encoder, if any.
+            clip_skip (`int`, *optional*):
+                Number of skipped CLIP layers.
+            lora_scale (`float`, *optional*):
+                The LoRA scale applied to the text encoder.
+        """
+        input_embeddings = (
+            text_encoder.get_input_embeddings() if hasattr(text_encoder, "get_input_embeddings") else None
+        )
+        vocab_size = input_embeddings.num_embeddings if input_embeddings is not None else None
+        if attention_mask is not None:
+            attention_mask = attention_mask.cpu().numpy().tobytes()
+
+        return (
+            # a weak reference compares equal only while the text encoder is alive, so its `id` can't be reused
+            weakref.ref(text_encoder),
+            vocab_size,
+            _get_lora_state(text_encoder),
+            lora_scale,
+            clip_skip,
+            tuple(text_input_ids.shape),
+            text_input_ids.cpu().numpy().tobytes(),
+            attention_mask,
+        )
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        r"""Returns the cached text encoder output for `key`, or `None` if there is none."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        r"""Caches the text encoder output `value` under `key`, evicting the least recently used entries if needed."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        r"""Removes all cached entries. The hit and miss counters are kept."""
+        self._entries.clear()
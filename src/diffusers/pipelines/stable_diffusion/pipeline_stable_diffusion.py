@@ -35,7 +35,9 @@ from ...utils import (
     unscale_lora_layers,
 )
 from ...utils.torch_utils import randn_tensor
+from ..guidance_policy import GuidancePolicy, prepare_guidance_scale
 from ..pipeline_utils import DiffusionPipeline
+from ..static_denoising_loop import StaticDenoisingLoop, StaticSchedule
 from .pipeline_output import StableDiffusionPipelineOutput
 from .safety_checker import StableDiffusionSafetyChecker
 
@@ -155,6 +157,7 @@ class StableDiffusionPipeline(
     _optional_components = ["safety_checker", "feature_extractor", "image_encoder"]
     _exclude_from_cpu_offload = ["safety_checker"]
     _callback_tensor_inputs = ["latents", "prompt_embeds", "negative_prompt_embeds"]
+    static_loop = None
 
     def __init__(
         self,
@@ -399,22 +402,33 @@ class StableDiffusionPipeline(
             else:
                 attention_mask = None
 
-            if clip_skip is None:
-                prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
-                prompt_embeds = prompt_embeds[0]
-            else:
-                prompt_embeds = self.text_encoder(
-                    text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, text_input_ids, attention_mask, clip_skip=clip_skip, lora_scale=lora_scale
                 )
-                # Access the `hidden_states` first, that contains a tuple of
-                # all the hidden states from the encoder layers. Then index into
-                # the tuple to access the hidden states from the desired layer.
-                prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
-                # We also need to apply the final LayerNorm here to not mess with the
-                # representations. The `last_hidden_states` that we typically use for
-                # obtaining the final prompt representations passes through the LayerNorm
-                # layer.
-                prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+                prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if prompt_embeds is None:
+                if clip_skip is None:
+                    prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
+                    prompt_embeds = prompt_embeds[0]
+                else:
+                    prompt_embeds = self.text_encoder(
+                        text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+                    )
+                    # Access the `hidden_states` first, that contains a tuple of
+                    # all the hidden states from the encoder layers. Then index into
+                    # the tuple to access the hidden states from the desired layer.
+                    prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
+                    # We also need to apply the final LayerNorm here to not mess with the
+                    # representations. The `last_hidden_states` that we typically use for
+                    # obtaining the final prompt representations passes through the LayerNorm
+                    # layer.
+                    prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, prompt_embeds)
 
         if self.text_encoder is not None:
             prompt_embeds_dtype = self.text_encoder.dtype
@@ -469,11 +483,22 @@ class StableDiffusionPipeline(
             else:
                 attention_mask = None
 
-            negative_prompt_embeds = self.text_encoder(
-                uncond_input.input_ids.to(device),
-                attention_mask=attention_mask,
-            )
-            negative_prompt_embeds = negative_prompt_embeds[0]
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, uncond_input.input_ids, attention_mask, lora_scale=lora_scale
+                )
+                negative_prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if negative_prompt_embeds is None:
+                negative_prompt_embeds = self.text_encoder(
+                    uncond_input.input_ids.to(device),
+                    attention_mask=attention_mask,
+                )
+                negative_prompt_embeds = negative_prompt_embeds[0]
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, negative_prompt_embeds)
 
         if do_classifier_free_guidance:
             # duplicate unconditional embeddings for each generation per prompt, using mps friendly method
@@ -651,6 +676,69 @@ class StableDiffusionPipeline(
         """Disables the FreeU mechanism if enabled."""
         self.unet.disable_freeu()
 
+    def enable_deep_cache(self, cache_interval: int = 3, cache_block_id: int = 0):
+        r"""Enables the DeepCache mechanism as in https://arxiv.org/abs/2312.00858.
+
+        The UNet only runs a full forward pass every `cache_interval` denoising steps and reuses the features of its
+        deeper blocks in between. See [`~UNet2DConditionModel.enable_deep_cache`] for details.
+
+        Args:
+            cache_interval (`int`, *optional*, defaults to 3):
+                Number of denoising steps between two full forward passes of the UNet.
+            cache_block_id (`int`, *optional*, defaults to 0):
+                Index of the deepest UNet down block that is recomputed at every step.
+        """
+        if not hasattr(self, "unet"):
+            raise ValueError("The pipeline must have `unet` for using DeepCache.")
+        self.unet.enable_deep_cache(cache_interval=cache_interval, cache_block_id=cache_block_id)
+
+    def disable_deep_cache(self):
+        """Disables the DeepCache mechanism if enabled."""
+        self.unet.disable_deep_cache()
+
+    def enable_static_loop(self, loop: Optional[StaticDenoisingLoop] = None, use_cuda_graphs: bool = True):
+        r"""
+        Runs the denoising loop from preallocated buffers, with tensorized scheduler steps that don't synchronize with
+        the host. On CUDA devices, a whole denoising step is captured in a CUDA graph once per resolution and batch
+        size and replayed afterwards, which removes the kernel launch overhead of the UNet, the guidance and the
+        scheduler. See [`StaticDenoisingLoop`] for the supported schedulers.
+
+        The static loop doesn't support a `guidance_policy`, DeepCache or model offloading, and changes to the
+        `prompt_embeds` made by `callback_on_step_end` are ignored.
+
+        Args:
+            loop ([`StaticDenoisingLoop`], *optional*):
+                The loop to use, for example one that is shared between several pipelines. If `None`, a new
+                [`StaticDenoisingLoop`] is created.
+            use_cuda_graphs (`bool`, *optional*, defaults to `True`):
+                Whether a new loop captures the steps in CUDA graphs on CUDA devices.
+        """
+        self.static_loop = loop if loop is not None else StaticDenoisingLoop(use_cuda_graphs=use_cuda_graphs)
+
+    def disable_static_loop(self):
+        r"""Disables the static denoising loop enabled with `enable_static_loop` and drops its captured graphs."""
+        if self.static_loop is not None:
+            self.static_loop.clear()
+        self.static_loop = None
+
+    def check_static_loop_inputs(self, guidance_policy):
+        if guidance_policy is not None:
+            raise ValueError(
+                "`guidance_policy` changes the batch size of the UNet between steps and can't be used with the static"
+                " denoising loop. Please call `disable_static_loop()` first."
+            )
+        if getattr(self.unet, "deep_cache_interval", None) is not None:
+            raise ValueError(
+                "DeepCache decides on the host which blocks of the UNet run at each step and can't be used with the"
+                " static denoising loop. Please call `disable_deep_cache()` first."
+            )
+        if any(hasattr(module, "_hf_hook") for module in self.unet.modules()):
+            # the captured steps would keep reading the device weights after the offloading hooks freed them
+            raise ValueError(
+                "Model offloading moves the weights of the UNet between devices and can't be used with the static"
+                " denoising loop. Please keep the UNet on its device, e.g. with `pipe.to('cuda')`."
+            )
+
     # Copied from diffusers.pipelines.stable_diffusion_xl.pipeline_stable_diffusion_xl.StableDiffusionXLPipeline.fuse_qkv_projections
     def fuse_qkv_projections(self, unet: bool = True, vae: bool = True):
         """
@@ -758,7 +846,11 @@ class StableDiffusionPipeline(
     # corresponds to doing no classifier free guidance.
     @property
     def do_classifier_free_guidance(self):
-        return self._guidance_scale > 1 and self.unet.config.time_cond_proj_dim is None
+        guidance_scale = self._guidance_scale
+        if isinstance(guidance_scale, torch.Tensor):
+            # with per-sample guidance scales, guidance is needed as soon as one of the samples uses it
+            guidance_scale = guidance_scale.max().item()
+        return guidance_scale > 1 and self.unet.config.time_cond_proj_dim is None
 
     @property
     def cross_attention_kwargs(self):
@@ -781,7 +873,7 @@ class StableDiffusionPipeline(
         width: Optional[int] = None,
         num_inference_steps: int = 50,
         timesteps: List[int] = None,
-        guidance_scale: float = 7.5,
+        guidance_scale: Union[float, List[float], torch.FloatTensor] = 7.5,
         negative_prompt: Optional[Union[str, List[str]]] = None,
         num_images_per_prompt: Optional[int] = 1,
         eta: float = 0.0,
@@ -794,6 +886,7 @@ class StableDiffusionPipeline(
         return_dict: bool = True,
         cross_attention_kwargs: Optional[Dict[str, Any]] = None,
         guidance_rescale: float = 0.0,
+        guidance_policy: Optional[GuidancePolicy] = None,
         clip_skip: Optional[int] = None,
         callback_on_step_end: Optional[Callable[[int, int, Dict], None]] = None,
         callback_on_step_end_tensor_inputs: List[str] = ["latents"],
@@ -816,9 +909,11 @@ class StableDiffusionPipeline(
                 Custom timesteps to use for the denoising process with schedulers which support a `timesteps` argument
                 in their `set_timesteps` method. If not defined, the default behavior when `num_inference_steps` is
                 passed will be used. Must be in descending order.
-            guidance_scale (`float`, *optional*, defaults to 7.5):
+            guidance_scale (`float`, `List[float]` or `torch.FloatTensor`, *optional*, defaults to 7.5):
                 A higher guidance scale value encourages the model to generate images closely linked to the text
                 `prompt` at the expense of lower image quality. Guidance scale is enabled when `guidance_scale > 1`.
+                Pass one value per prompt to generate images with different guidance scales in the same batch,
+                prompts with a guidance scale `<= 1` then only use the conditional noise prediction.
             negative_prompt (`str` or `List[str]`, *optional*):
                 The prompt or prompts to guide what to not include in image generation. If not defined, you need to
                 pass `negative_prompt_embeds` instead. Ignored when not using guidance (`guidance_scale < 1`).
@@ -853,6 +948,10 @@ class StableDiffusionPipeline(
                 Guidance rescale factor from [Common Diffusion Noise Schedules and Sample Steps are
                 Flawed](https://arxiv.org/pdf/2305.08891.pdf). Guidance rescale factor should fix overexposure when
                 using zero terminal SNR.
+            guidance_policy ([`GuidancePolicy`], *optional*):
+                Decides at every step whether classifier-free guidance is applied and whether the unconditional noise
+                prediction is computed or reused from a previous step. Skipping the unconditional branch halves the
+                batch size of the UNet for that step. Defaults to computing both branches at every step.
             clip_skip (`int`, *optional*):
                 Number of layers to be skipped from CLIP while computing the prompt embeddings. A value of 1 means that
                 the output of the pre-final layer will be used for computing the prompt embeddings.
@@ -897,6 +996,11 @@ class StableDiffusionPipeline(
         width = width or self.unet.config.sample_size * self.vae_scale_factor
         # to deal with lora scaling and other possible forward hooks
 
+        # 0.1 Snap the resolution to the shape buckets of the compiled models
+        bucket_height, bucket_width = height, width
+        if self.compile_manager is not None:
+            bucket_height, bucket_width = self.compile_manager.get_shape_bucket(height, width)
+
         # 1. Check inputs. Raise error if not correct
         self.check_inputs(
             prompt,
@@ -908,8 +1012,9 @@ class StableDiffusionPipeline(
             negative_prompt_embeds,
             callback_on_step_end_tensor_inputs,
         )
+        if self.static_loop is not None:
+            self.check_static_loop_inputs(guidance_policy)
 
-        self._guidance_scale = guidance_scale
         self._guidance_rescale = guidance_rescale
         self._clip_skip = clip_skip
         self._cross_attention_kwargs = cross_attention_kwargs
@@ -923,6 +1028,8 @@ class StableDiffusionPipeline(
         else:
             batch_size = prompt_embeds.shape[0]
 
+        self._guidance_scale = prepare_guidance_scale(guidance_scale, batch_size, num_images_per_prompt)
+
         device = self._execution_device
 
         # 3. Encode input prompt
@@ -958,6 +1065,7 @@ class StableDiffusionPipeline(
 
         # 4. Prepare timesteps
         timesteps, num_inference_steps = retrieve_timesteps(self.scheduler, num_inference_steps, device, timesteps)
+        self.unet.precompute_timestep_embeddings(timesteps)
 
         # 5. Prepare latent variables
         num_channels_latents = self.unet.config.in_channels
@@ -971,6 +1079,18 @@ class StableDiffusionPipeline(
             generator,
             latents,
         )
+        if (bucket_height, bucket_width) != (height, width):
+            # the requested latents are surrounded by additional noise up to the bucket resolution
+            noise = self.prepare_latents(
+                batch_size * num_images_per_prompt,
+                num_channels_latents,
+                bucket_height,
+                bucket_width,
+                prompt_embeds.dtype,
+                device,
+                generator,
+            )
+            latents = self.compile_manager.pad_latents(latents, noise)
 
         # 6. Prepare extra step kwargs. TODO: Logic should ideally just be moved out of the pipeline
         extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
@@ -981,11 +1101,41 @@ class StableDiffusionPipeline(
         # 6.2 Optionally get Guidance Scale Embedding
         timestep_cond = None
         if self.unet.config.time_cond_proj_dim is not None:
-            guidance_scale_tensor = torch.tensor(self.guidance_scale - 1).repeat(batch_size * num_images_per_prompt)
+            if isinstance(self.guidance_scale, torch.Tensor):
+                guidance_scale_tensor = self.guidance_scale - 1
+            else:
+                guidance_scale_tensor = torch.tensor(self.guidance_scale - 1).repeat(
+                    batch_size * num_images_per_prompt
+                )
             timestep_cond = self.get_guidance_scale_embedding(
                 guidance_scale_tensor, embedding_dim=self.unet.config.time_cond_proj_dim
             ).to(device=device, dtype=latents.dtype)
 
+        # 6.3 Prepare the guidance
+        guidance_policy = guidance_policy or GuidancePolicy()
+        guidance_scale = self.guidance_scale
+        if isinstance(guidance_scale, torch.Tensor):
+            # samples with a guidance scale <= 1 only use the conditional noise prediction
+            guidance_scale = torch.where(guidance_scale > 1, guidance_scale, 1.0)
+            guidance_scale = guidance_scale.to(device=device, dtype=latents.dtype).view(-1, 1, 1, 1)
+
+        # 6.4 Optionally load the inputs into the buffers of a static denoising step
+        static_step = None
+        if self.static_loop is not None:
+            step_kwargs = {k: v for k, v in extra_step_kwargs.items() if k != "generator"}
+            static_step = self.static_loop.prepare(
+                self.unet,
+                latents,
+                StaticSchedule.from_scheduler(self.scheduler, timesteps, **step_kwargs),
+                guidance_scale=guidance_scale,
+                guidance_rescale=self.guidance_rescale,
+                do_classifier_free_guidance=self.do_classifier_free_guidance,
+                encoder_hidden_states=prompt_embeds,
+                timestep_cond=timestep_cond,
+                cross_attention_kwargs=self.cross_attention_kwargs,
+                added_cond_kwargs=added_cond_kwargs,
+            )
+
         # 7. Denoising loop
         num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
         self._num_timesteps = len(timesteps)
@@ -994,32 +1144,53 @@ class StableDiffusionPipeline(
                 if self.interrupt:
                     continue
 
-                # expand the latents if we are doing classifier free guidance
-                latent_model_input = torch.cat([latents] * 2) if self.do_classifier_free_guidance else latents
-                latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
-
-                # predict the noise residual
-                noise_pred = self.unet(
-                    latent_model_input,
-                    t,
-                    encoder_hidden_states=prompt_embeds,
-                    timestep_cond=timestep_cond,
-                    cross_attention_kwargs=self.cross_attention_kwargs,
-                    added_cond_kwargs=added_cond_kwargs,
-                    return_dict=False,
-                )[0]
-
-                # perform guidance
-                if self.do_classifier_free_guidance:
-                    noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
-                    noise_pred = noise_pred_uncond + self.guidance_scale * (noise_pred_text - noise_pred_uncond)
-
-                if self.do_classifier_free_guidance and self.guidance_rescale > 0.0:
-                    # Based on 3.4. in https://arxiv.org/pdf/2305.08891.pdf
-                    noise_pred = rescale_noise_cfg(noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale)
-
-                # compute the previous noisy sample x_t -> x_t-1
-                latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs, return_dict=False)[0]
+                if static_step is not None:
+                    # UNet, guidance and scheduler step from the static buffers, replayed from a CUDA graph on GPUs
+                    latents = static_step()
+                else:
+                    do_guidance = self.do_classifier_free_guidance and guidance_policy.do_guidance(i, len(timesteps))
+                    compute_uncond = self.do_classifier_free_guidance and guidance_policy.compute_uncond(
+                        i, len(timesteps)
+                    )
+
+                    # expand the latents if we are doing classifier free guidance
+                    latent_model_input = torch.cat([latents] * 2) if compute_uncond else latents
+                    latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
+
+                    # only pass the conditional inputs if the unconditional noise prediction is skipped at this step
+                    encoder_hidden_states, unet_added_cond_kwargs = prompt_embeds, added_cond_kwargs
+                    if self.do_classifier_free_guidance and not compute_uncond:
+                        encoder_hidden_states = prompt_embeds.chunk(2)[1]
+                        if added_cond_kwargs is not None:
+                            unet_added_cond_kwargs = {k: v.chunk(2)[1] for k, v in added_cond_kwargs.items()}
+
+                    # predict the noise residual
+                    noise_pred = self.unet(
+                        latent_model_input,
+                        t,
+                        encoder_hidden_states=encoder_hidden_states,
+                        timestep_cond=timestep_cond,
+                        cross_attention_kwargs=self.cross_attention_kwargs,
+                        added_cond_kwargs=unet_added_cond_kwargs,
+                        return_dict=False,
+                    )[0]
+
+                    # perform guidance, reusing the last unconditional noise prediction if it wasn't computed
+                    if compute_uncond:
+                        noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
+                    else:
+                        noise_pred_text = noise_pred
+                    if do_guidance:
+                        noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_text - noise_pred_uncond)
+
+                    if do_guidance and self.guidance_rescale > 0.0:
+                        # Based on 3.4. in https://arxiv.org/pdf/2305.08891.pdf
+                        noise_pred = rescale_noise_cfg(
+                            noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale
+                        )
+
+                    # compute the previous noisy sample x_t -> x_t-1
+                    latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs, return_dict=False)[0]
 
                 if callback_on_step_end is not None:
                     callback_kwargs = {}
@@ -1030,6 +1201,8 @@ class StableDiffusionPipeline(
                     latents = callback_outputs.pop("latents", latents)
                     prompt_embeds = callback_outputs.pop("prompt_embeds", prompt_embeds)
                     negative_prompt_embeds = callback_outputs.pop("negative_prompt_embeds", negative_prompt_embeds)
+                    if static_step is not None and latents is not static_step.latents:
+                        static_step.latents.copy_(latents)
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
@@ -1038,13 +1211,23 @@ class StableDiffusionPipeline(
                         step_idx = i // getattr(self.scheduler, "order", 1)
                         callback(step_idx, t, latents)
 
+        if static_step is not None:
+            # the buffer is overwritten by the next generation with the same shapes
+            latents = latents.clone()
+
         if not output_type == "latent":
             image = self.vae.decode(latents / self.vae.config.scaling_factor, return_dict=False, generator=generator)[
                 0
             ]
+            if (bucket_height, bucket_width) != (height, width):
+                image = self.compile_manager.crop(image, height, width, scale_factor=self.vae_scale_factor)
             image, has_nsfw_concept = self.run_safety_checker(image, device, prompt_embeds.dtype)
         else:
             image = latents
+            if (bucket_height, bucket_width) != (height, width):
+                image = self.compile_manager.crop(
+                    image, height // self.vae_scale_factor, width // self.vae_scale_factor
+                )
             has_nsfw_concept = None
 
         if has_nsfw_concept is None:
@@ -11,9 +11,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
 import inspect
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import torch
 from transformers import CLIPImageProcessor, CLIPTextModel, CLIPTokenizer, CLIPVisionModelWithProjection
@@ -59,6 +58,77 @@ EXAMPLE_DOC_STRING = """
 """
 
 
+class MultiDiffusionViews:
+    r"""
+    Gathers the views of a panorama latent with a single indexing op and merges the denoised views back with a
+    scatter-add, weighted by the precomputed number of views that overlap each latent pixel (Eq. 5 in the
+    [MultiDiffusion paper](https://arxiv.org/abs/2302.08113)).
+
+    Args:
+        views (`List[Tuple[int, int, int, int]]`):
+            The `(h_start, h_end, w_start, w_end)` coordinates of the views, see
+            [`~StableDiffusionPanoramaPipeline.get_views`].
+        latent_height (`int`):
+            The height of the panorama latent.
+        latent_width (`int`):
+            The width of the panorama latent.
+        window_size (`int`, defaults to 64):
+            The size of the views. Views are cropped to the latent if it's smaller than a view.
+        circular_padding (`bool`, defaults to `False`):
+            Whether views wrap around the right edge of the panorama to its left edge.
+        device (`torch.device`, *optional*):
+            The device of the latents.
+    """
+
+    def __init__(
+        self,
+        views: List[Tuple[int, int, int, int]],
+        latent_height: int,
+        latent_width: int,
+        window_size: int = 64,
+        circular_padding: bool = False,
+        device: Optional[torch.device] = None,
+    ):
+        self.view_height = min(window_size, latent_height)
+        self.view_width = window_size if circular_padding else min(window_size, latent_width)
+
+        h_start = torch.tensor([view[0] for view in views], device=device)
+        w_start = torch.tensor([view[2] for view in views], device=device)
+        rows = h_start[:, None] + torch.arange(self.view_height, device=device)
+        cols = w_start[:, None] + torch.arange(self.view_width, device=device)
+        if circular_padding:
+            cols = cols % latent_width
+        # (num_views, view_height * view_width) indices into the flattened latent
+        self.index = (rows[:, :, None] * latent_width + cols[:, None, :]).flatten(1)
+
+        count = torch.bincount(self.index.flatten(), minlength=latent_height * latent_width)
+        self.weights = torch.where(count > 0, 1.0 / count.clamp(min=1), 0.0)
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    def gather(self, latents: torch.FloatTensor) -> torch.FloatTensor:
+        r"""
+        Returns the `(num_views * batch_size, channels, view_height, view_width)` views of `latents`, view-major.
+        """
+        batch_size, channels = latents.shape[:2]
+        views = latents.flatten(2)[:, :, self.index]
+        views = views.permute(2, 0, 1, 3)
+        return views.reshape(len(self) * batch_size, channels, self.view_height, self.view_width)
+
+    def scatter(self, views: torch.FloatTensor, latents: torch.FloatTensor) -> torch.FloatTensor:
+        r"""
+        Averages the `views` returned by [`~MultiDiffusionViews.gather`] into a tensor shaped like `latents`. Latent
+        pixels that no view covers are set to zero.
+        """
+        batch_size, channels = latents.shape[:2]
+        views = views.reshape(len(self), batch_size, channels, -1).permute(1, 2, 0, 3).flatten(2)
+        value = torch.zeros_like(latents).flatten(2)
+        value.index_add_(2, self.index.flatten(), views.to(value.dtype))
+        value = value * self.weights.to(value.dtype)
+        return value.reshape(latents.shape)
+
+
 class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderMixin, LoraLoaderMixin, IPAdapterMixin):
     r"""
     Pipeline for text-to-image generation using MultiDiffusion.
@@ -280,22 +350,33 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
             else:
                 attention_mask = None
 
-            if clip_skip is None:
-                prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
-                prompt_embeds = prompt_embeds[0]
-            else:
-                prompt_embeds = self.text_encoder(
-                    text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, text_input_ids, attention_mask, clip_skip=clip_skip, lora_scale=lora_scale
                 )
-                # Access the `hidden_states` first, that contains a tuple of
-                # all the hidden states from the encoder layers. Then index into
-                # the tuple to access the hidden states from the desired layer.
-                prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
-                # We also need to apply the final LayerNorm here to not mess with the
-                # representations. The `last_hidden_states` that we typically use for
-                # obtaining the final prompt representations passes through the LayerNorm
-                # layer.
-                prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+                prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if prompt_embeds is None:
+                if clip_skip is None:
+                    prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=attention_mask)
+                    prompt_embeds = prompt_embeds[0]
+                else:
+                    prompt_embeds = self.text_encoder(
+                        text_input_ids.to(device), attention_mask=attention_mask, output_hidden_states=True
+                    )
+                    # Access the `hidden_states` first, that contains a tuple of
+                    # all the hidden states from the encoder layers. Then index into
+                    # the tuple to access the hidden states from the desired layer.
+                    prompt_embeds = prompt_embeds[-1][-(clip_skip + 1)]
+                    # We also need to apply the final LayerNorm here to not mess with the
+                    # representations. The `last_hidden_states` that we typically use for
+                    # obtaining the final prompt representations passes through the LayerNorm
+                    # layer.
+                    prompt_embeds = self.text_encoder.text_model.final_layer_norm(prompt_embeds)
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, prompt_embeds)
 
         if self.text_encoder is not None:
             prompt_embeds_dtype = self.text_encoder.dtype
@@ -350,11 +431,22 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
             else:
                 attention_mask = None
 
-            negative_prompt_embeds = self.text_encoder(
-                uncond_input.input_ids.to(device),
-                attention_mask=attention_mask,
-            )
-            negative_prompt_embeds = negative_prompt_embeds[0]
+            cache_key = None
+            if self.prompt_embeds_cache is not None:
+                cache_key = self.prompt_embeds_cache.make_key(
+                    self.text_encoder, uncond_input.input_ids, attention_mask, lora_scale=lora_scale
+                )
+                negative_prompt_embeds = self.prompt_embeds_cache.get(cache_key)
+
+            if negative_prompt_embeds is None:
+                negative_prompt_embeds = self.text_encoder(
+                    uncond_input.input_ids.to(device),
+                    attention_mask=attention_mask,
+                )
+                negative_prompt_embeds = negative_prompt_embeds[0]
+
+                if cache_key is not None:
+                    self.prompt_embeds_cache.put(cache_key, negative_prompt_embeds)
 
         if do_classifier_free_guidance:
             # duplicate unconditional embeddings for each generation per prompt, using mps friendly method
@@ -590,7 +682,7 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
                 `prompt` at the expense of lower image quality. Guidance scale is enabled when `guidance_scale > 1`.
             view_batch_size (`int`, *optional*, defaults to 1):
                 The batch size to denoise split views. For some GPUs with high performance, higher view batch size can
-                speedup the generation and increase the VRAM usage.
+                speedup the generation and increase the VRAM usage. The scheduler always steps all the views at once.
             negative_prompt (`str` or `List[str]`, *optional*):
                 The prompt or prompts to guide what to not include in image generation. If not defined, you need to
                 pass `negative_prompt_embeds` instead. Ignored when not using guidance (`guidance_scale < 1`).
@@ -717,13 +809,15 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
         # 6. Define panorama grid and initialize views for synthesis.
         # prepare batch grid
         views = self.get_views(height, width, circular_padding=circular_padding)
-        views_batch = [views[i : i + view_batch_size] for i in range(0, len(views), view_batch_size)]
-        views_scheduler_status = [copy.deepcopy(self.scheduler.__dict__)] * len(views_batch)
-        count = torch.zeros_like(latents)
-        value = torch.zeros_like(latents)
+        views = MultiDiffusionViews(
+            views, latents.shape[2], latents.shape[3], circular_padding=circular_padding, device=device
+        )
 
         # 7. Prepare extra step kwargs. TODO: Logic should ideally just be moved out of the pipeline
         extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
+        if isinstance(extra_step_kwargs.get("generator"), list):
+            # the scheduler steps the views of every image at once, view-major like `MultiDiffusionViews.gather`
+            extra_step_kwargs["generator"] = [g for _ in range(len(views)) for g in generator]
 
         # 7.1 Add image embeds for IP-Adapter
         added_cond_kwargs = {"image_embeds": image_embeds} if ip_adapter_image is not None else None
@@ -734,58 +828,32 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
         num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
-                count.zero_()
-                value.zero_()
-
                 # generate views
-                # Here, we iterate through different spatial crops of the latents and denoise them. These
-                # denoised (latent) crops are then averaged to produce the final latent
+                # Here, we gather all the spatial crops of the latents and denoise them in batches of
+                # `view_batch_size` views. The scheduler steps all the views at once, so its state is batched over
+                # the views. These denoised (latent) crops are then averaged to produce the final latent
                 # for the current timestep via MultiDiffusion. Please see Sec. 4.1 in the
                 # MultiDiffusion paper for more details: https://arxiv.org/abs/2302.08113
-                # Batch views denoise
-                for j, batch_view in enumerate(views_batch):
-                    vb_size = len(batch_view)
-                    # get the latents corresponding to the current view coordinates
-                    if circular_padding:
-                        latents_for_view = []
-                        for h_start, h_end, w_start, w_end in batch_view:
-                            if w_end > latents.shape[3]:
-                                # Add circular horizontal padding
-                                latent_view = torch.cat(
-                                    (
-                                        latents[:, :, h_start:h_end, w_start:],
-                                        latents[:, :, h_start:h_end, : w_end - latents.shape[3]],
-                                    ),
-                                    axis=-1,
-                                )
-                            else:
-                                latent_view = latents[:, :, h_start:h_end, w_start:w_end]
-                            latents_for_view.append(latent_view)
-                        latents_for_view = torch.cat(latents_for_view)
-                    else:
-                        latents_for_view = torch.cat(
-                            [
-                                latents[:, :, h_start:h_end, w_start:w_end]
-                                for h_start, h_end, w_start, w_end in batch_view
-                            ]
-                        )
-
-                    # rematch block's scheduler status
-                    self.scheduler.__dict__.update(views_scheduler_status[j])
-
-                    # expand the latents if we are doing classifier free guidance
-                    latent_model_input = (
-                        latents_for_view.repeat_interleave(2, dim=0)
-                        if do_classifier_free_guidance
-                        else latents_for_view
-                    )
-                    latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
+                latents_for_views = views.gather(latents)
+                latent_views_input = self.scheduler.scale_model_input(latents_for_views, t)
+
+                noise_pred = []
+                for latent_view_input in latent_views_input.split(view_batch_size * latents.shape[0]):
+                    vb_size = latent_view_input.shape[0] // latents.shape[0]
+                    # expand the latents if we are doing classifier free guidance, the unconditional and the text
+                    # predictions of a view are laid out like `prompt_embeds`
+                    latent_model_input = latent_view_input
+                    if do_classifier_free_guidance:
+                        latent_model_input = latent_view_input.unflatten(0, (vb_size, 1, -1)).repeat(1, 2, 1, 1, 1, 1)
+                        latent_model_input = latent_model_input.flatten(0, 2)
 
-                    # repeat prompt_embeds for batch
+                    # repeat prompt_embeds and image embeds for batch
                     prompt_embeds_input = torch.cat([prompt_embeds] * vb_size)
+                    if added_cond_kwargs is not None:
+                        added_cond_kwargs["image_embeds"] = torch.cat([image_embeds] * vb_size)
 
                     # predict the noise residual
-                    noise_pred = self.unet(
+                    noise_pred_batch = self.unet(
                         latent_model_input,
                         t,
                         encoder_hidden_states=prompt_embeds_input,
@@ -795,37 +863,19 @@ class StableDiffusionPanoramaPipeline(DiffusionPipeline, TextualInversionLoaderM
 
                     # perform guidance
                     if do_classifier_free_guidance:
-                        noise_pred_uncond, noise_pred_text = noise_pred[::2], noise_pred[1::2]
-                        noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_text - noise_pred_uncond)
-
-                    # compute the previous noisy sample x_t -> x_t-1
-                    latents_denoised_batch = self.scheduler.step(
-                        noise_pred, t, latents_for_view, **extra_step_kwargs
-                    ).prev_sample
-
-                    # save views scheduler status after sample
-                    views_scheduler_status[j] = copy.deepcopy(self.scheduler.__dict__)
-
-                    # extract value from batch
-                    for latents_view_denoised, (h_start, h_end, w_start, w_end) in zip(
-                        latents_denoised_batch.chunk(vb_size), batch_view
-                    ):
-                        if circular_padding and w_end > latents.shape[3]:
-                            # Case for circular padding
-                            value[:, :, h_start:h_end, w_start:] += latents_view_denoised[
-                                :, :, h_start:h_end, : latents.shape[3] - w_start
-                            ]
-                            value[:, :, h_start:h_end, : w_end - latents.shape[3]] += latents_view_denoised[
-                                :, :, h_start:h_end, latents.shape[3] - w_start :
-                            ]
-                            count[:, :, h_start:h_end, w_start:] += 1
-                            count[:, :, h_start:h_end, : w_end - latents.shape[3]] += 1
-                        else:
-                            value[:, :, h_start:h_end, w_start:w_end] += latents_view_denoised
-                            count[:, :, h_start:h_end, w_start:w_end] += 1
+                        noise_pred_uncond, noise_pred_text = noise_pred_batch.unflatten(0, (vb_size, 2, -1)).unbind(1)
+                        noise_pred_batch = noise_pred_uncond + guidance_scale * (noise_pred_text - noise_pred_uncond)
+                        noise_pred_batch = noise_pred_batch.flatten(0, 1)
+                    noise_pred.append(noise_pred_batch)
+                noise_pred = torch.cat(noise_pred)
+
+                # compute the previous noisy sample x_t -> x_t-1
+                latents_denoised = self.scheduler.step(
+                    noise_pred, t, latents_for_views, **extra_step_kwargs
+                ).prev_sample
 
                 # take the MultiDiffusion step. Eq. 5 in MultiDiffusion paper: https://arxiv.org/abs/2302.08113
-                latents = torch.where(count > 0, value / count, value)
+                latents = views.scatter(latents_denoised, latents)
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
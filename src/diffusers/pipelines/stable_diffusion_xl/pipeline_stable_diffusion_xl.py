@@ -52,7 +52,9 @@ from ...utils import (
     unscale_lora_layers,
 )
 from ...utils.torch_utils import randn_tensor
+from ..guidance_policy import GuidancePolicy, prepare_guidance_scale
 from ..pipeline_utils import DiffusionPipeline
+from ..static_denoising_loop import StaticDenoisingLoop, StaticSchedule
 from .pipeline_output import StableDiffusionXLPipelineOutput
 
 
@@ -216,6 +218,7 @@ class StableDiffusionXLPipeline(
         "negative_pooled_prompt_embeds",
         "negative_add_time_ids",
     ]
+    static_loop = None
 
     def __init__(
         self,
@@ -412,15 +415,28 @@ class StableDiffusionXLPipeline(
                         f" {tokenizer.model_max_length} tokens: {removed_text}"
                     )
 
-                prompt_embeds = text_encoder(text_input_ids.to(device), output_hidden_states=True)
+                cache_key, cached = None, None
+                if self.prompt_embeds_cache is not None:
+                    cache_key = self.prompt_embeds_cache.make_key(
+                        text_encoder, text_input_ids, clip_skip=clip_skip, lora_scale=lora_scale
+                    )
+                    cached = self.prompt_embeds_cache.get(cache_key)
 
-                # We are only ALWAYS interested in the pooled output of the final text encoder
-                pooled_prompt_embeds = prompt_embeds[0]
-                if clip_skip is None:
-                    prompt_embeds = prompt_embeds.hidden_states[-2]
+                if cached is not None:
+                    prompt_embeds, pooled_prompt_embeds = cached
                 else:
-                    # "2" because SDXL always indexes from the penultimate layer.
-                    prompt_embeds = prompt_embeds.hidden_states[-(clip_skip + 2)]
+                    prompt_embeds = text_encoder(text_input_ids.to(device), output_hidden_states=True)
+
+                    # We are only ALWAYS interested in the pooled output of the final text encoder
+                    pooled_prompt_embeds = prompt_embeds[0]
+                    if clip_skip is None:
+                        prompt_embeds = prompt_embeds.hidden_states[-2]
+                    else:
+                        # "2" because SDXL always indexes from the penultimate layer.
+                        prompt_embeds = prompt_embeds.hidden_states[-(clip_skip + 2)]
+
+                    if cache_key is not None:
+                        self.prompt_embeds_cache.put(cache_key, (prompt_embeds, pooled_prompt_embeds))
 
                 prompt_embeds_list.append(prompt_embeds)
 
@@ -470,13 +486,28 @@ class StableDiffusionXLPipeline(
                     return_tensors="pt",
                 )
 
-                negative_prompt_embeds = text_encoder(
-                    uncond_input.input_ids.to(device),
-                    output_hidden_states=True,
-                )
-                # We are only ALWAYS interested in the pooled output of the final text encoder
-                negative_pooled_prompt_embeds = negative_prompt_embeds[0]
-                negative_prompt_embeds = negative_prompt_embeds.hidden_states[-2]
+                cache_key, cached = None, None
+                if self.prompt_embeds_cache is not None:
+                    cache_key = self.prompt_embeds_cache.make_key(
+                        text_encoder, uncond_input.input_ids, lora_scale=lora_scale
+                    )
+                    cached = self.prompt_embeds_cache.get(cache_key)
+
+                if cached is not None:
+                    negative_prompt_embeds, negative_pooled_prompt_embeds = cached
+                else:
+                    negative_prompt_embeds = text_encoder(
+                        uncond_input.input_ids.to(device),
+                        output_hidden_states=True,
+                    )
+                    # We are only ALWAYS interested in the pooled output of the final text encoder
+                    negative_pooled_prompt_embeds = negative_prompt_embeds[0]
+                    negative_prompt_embeds = negative_prompt_embeds.hidden_states[-2]
+
+                    if cache_key is not None:
+                        self.prompt_embeds_cache.put(
+                            cache_key, (negative_prompt_embeds, negative_pooled_prompt_embeds)
+                        )
 
                 negative_prompt_embeds_list.append(negative_prompt_embeds)
 
@@ -730,6 +761,74 @@ class StableDiffusionXLPipeline(
         """Disables the FreeU mechanism if enabled."""
         self.unet.disable_freeu()
 
+    # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.enable_deep_cache
+    def enable_deep_cache(self, cache_interval: int = 3, cache_block_id: int = 0):
+        r"""Enables the DeepCache mechanism as in https://arxiv.org/abs/2312.00858.
+
+        The UNet only runs a full forward pass every `cache_interval` denoising steps and reuses the features of its
+        deeper blocks in between. See [`~UNet2DConditionModel.enable_deep_cache`] for details.
+
+        Args:
+            cache_interval (`int`, *optional*, defaults to 3):
+                Number of denoising steps between two full forward passes of the UNet.
+            cache_block_id (`int`, *optional*, defaults to 0):
+                Index of the deepest UNet down block that is recomputed at every step.
+        """
+        if not hasattr(self, "unet"):
+            raise ValueError("The pipeline must have `unet` for using DeepCache.")
+        self.unet.enable_deep_cache(cache_interval=cache_interval, cache_block_id=cache_block_id)
+
+    # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.disable_deep_cache
+    def disable_deep_cache(self):
+        """Disables the DeepCache mechanism if enabled."""
+        self.unet.disable_deep_cache()
+
+    # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.enable_static_loop
+    def enable_static_loop(self, loop: Optional[StaticDenoisingLoop] = None, use_cuda_graphs: bool = True):
+        r"""
+        Runs the denoising loop from preallocated buffers, with tensorized scheduler steps that don't synchronize with
+        the host. On CUDA devices, a whole denoising step is captured in a CUDA graph once per resolution and batch
+        size and replayed afterwards, which removes the kernel launch overhead of the UNet, the guidance and the
+        scheduler. See [`StaticDenoisingLoop`] for the supported schedulers.
+
+        The static loop doesn't support a `guidance_policy`, DeepCache or model offloading, and changes to the
+        `prompt_embeds` made by `callback_on_step_end` are ignored.
+
+        Args:
+            loop ([`StaticDenoisingLoop`], *optional*):
+                The loop to use, for example one that is shared between several pipelines. If `None`, a new
+                [`StaticDenoisingLoop`] is created.
+            use_cuda_graphs (`bool`, *optional*, defaults to `True`):
+                Whether a new loop captures the steps in CUDA graphs on CUDA devices.
+        """
+        self.static_loop = loop if loop is not None else StaticDenoisingLoop(use_cuda_graphs=use_cuda_graphs)
+
+    # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.disable_static_loop
+    def disable_static_loop(self):
+        r"""Disables the static denoising loop enabled with `enable_static_loop` and drops its captured graphs."""
+        if self.static_loop is not None:
+            self.static_loop.clear()
+        self.static_loop = None
+
+    # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.check_static_loop_inputs
+    def check_static_loop_inputs(self, guidance_policy):
+        if guidance_policy is not None:
+            raise ValueError(
+                "`guidance_policy` changes the batch size of the UNet between steps and can't be used with the static"
+                " denoising loop. Please call `disable_static_loop()` first."
+            )
+        if getattr(self.unet, "deep_cache_interval", None) is not None:
+            raise ValueError(
+                "DeepCache decides on the host which blocks of the UNet run at each step and can't be used with the"
+                " static denoising loop. Please call `disable_deep_cache()` first."
+            )
+        if any(hasattr(module, "_hf_hook") for module in self.unet.modules()):
+            # the captured steps would keep reading the device weights after the offloading hooks freed them
+            raise ValueError(
+                "Model offloading moves the weights of the UNet between devices and can't be used with the static"
+                " denoising loop. Please keep the UNet on its device, e.g. with `pipe.to('cuda')`."
+            )
+
     def fuse_qkv_projections(self, unet: bool = True, vae: bool = True):
         """
         Enables fused QKV projections. For self-attention modules, all projection matrices (i.e., query,
@@ -835,7 +934,11 @@ class StableDiffusionXLPipeline(
     # corresponds to doing no classifier free guidance.
     @property
     def do_classifier_free_guidance(self):
-        return self._guidance_scale > 1 and self.unet.config.time_cond_proj_dim is None
+        guidance_scale = self._guidance_scale
+        if isinstance(guidance_scale, torch.Tensor):
+            # with per-sample guidance scales, guidance is needed as soon as one of the samples uses it
+            guidance_scale = guidance_scale.max().item()
+        return guidance_scale > 1 and self.unet.config.time_cond_proj_dim is None
 
     @property
     def cross_attention_kwargs(self):
@@ -864,7 +967,7 @@ class StableDiffusionXLPipeline(
         num_inference_steps: int = 50,
         timesteps: List[int] = None,
         denoising_end: Optional[float] = None,
-        guidance_scale: float = 5.0,
+        guidance_scale: Union[float, List[float], torch.FloatTensor] = 5.0,
         negative_prompt: Optional[Union[str, List[str]]] = None,
         negative_prompt_2: Optional[Union[str, List[str]]] = None,
         num_images_per_prompt: Optional[int] = 1,
@@ -880,6 +983,7 @@ class StableDiffusionXLPipeline(
         return_dict: bool = True,
         cross_attention_kwargs: Optional[Dict[str, Any]] = None,
         guidance_rescale: float = 0.0,
+        guidance_policy: Optional[GuidancePolicy] = None,
         original_size: Optional[Tuple[int, int]] = None,
         crops_coords_top_left: Tuple[int, int] = (0, 0),
         target_size: Optional[Tuple[int, int]] = None,
@@ -925,12 +1029,14 @@ class StableDiffusionXLPipeline(
                 scheduler. The denoising_end parameter should ideally be utilized when this pipeline forms a part of a
                 "Mixture of Denoisers" multi-pipeline setup, as elaborated in [**Refining the Image
                 Output**](https://huggingface.co/docs/diffusers/api/pipelines/stable_diffusion/stable_diffusion_xl#refining-the-image-output)
-            guidance_scale (`float`, *optional*, defaults to 5.0):
+            guidance_scale (`float`, `List[float]` or `torch.FloatTensor`, *optional*, defaults to 5.0):
                 Guidance scale as defined in [Classifier-Free Diffusion Guidance](https://arxiv.org/abs/2207.12598).
                 `guidance_scale` is defined as `w` of equation 2. of [Imagen
                 Paper](https://arxiv.org/pdf/2205.11487.pdf). Guidance scale is enabled by setting `guidance_scale >
                 1`. Higher guidance scale encourages to generate images that are closely linked to the text `prompt`,
-                usually at the expense of lower image quality.
+                usually at the expense of lower image quality. Pass one value per prompt to generate images with
+                different guidance scales in the same batch, prompts with a guidance scale `<= 1` then only use the
+                conditional noise prediction.
             negative_prompt (`str` or `List[str]`, *optional*):
                 The prompt or prompts not to guide the image generation. If not defined, one has to pass
                 `negative_prompt_embeds` instead. Ignored when not using guidance (i.e., ignored if `guidance_scale` is
@@ -980,6 +1086,10 @@ class StableDiffusionXLPipeline(
                 Flawed](https://arxiv.org/pdf/2305.08891.pdf) `guidance_scale` is defined as `φ` in equation 16. of
                 [Common Diffusion Noise Schedules and Sample Steps are Flawed](https://arxiv.org/pdf/2305.08891.pdf).
                 Guidance rescale factor should fix overexposure when using zero terminal SNR.
+            guidance_policy ([`GuidancePolicy`], *optional*):
+                Decides at every step whether classifier-free guidance is applied and whether the unconditional noise
+                prediction is computed or reused from a previous step. Skipping the unconditional branch halves the
+                batch size of the UNet for that step. Defaults to computing both branches at every step.
             original_size (`Tuple[int]`, *optional*, defaults to (1024, 1024)):
                 If `original_size` is not the same as `target_size` the image will appear to be down- or upsampled.
                 `original_size` defaults to `(height, width)` if not specified. Part of SDXL's micro-conditioning as
@@ -1047,8 +1157,14 @@ class StableDiffusionXLPipeline(
         height = height or self.default_sample_size * self.vae_scale_factor
         width = width or self.default_sample_size * self.vae_scale_factor
 
-        original_size = original_size or (height, width)
-        target_size = target_size or (height, width)
+        # 0.1 Snap the resolution to the shape buckets of the compiled models
+        bucket_height, bucket_width = height, width
+        if self.compile_manager is not None:
+            bucket_height, bucket_width = self.compile_manager.get_shape_bucket(height, width)
+
+        # the micro-conditioning describes the canvas that is denoised, which is the bucket when snapping to one
+        original_size = original_size or (bucket_height, bucket_width)
+        target_size = target_size or (bucket_height, bucket_width)
 
         # 1. Check inputs. Raise error if not correct
         self.check_inputs(
@@ -1065,8 +1181,9 @@ class StableDiffusionXLPipeline(
             negative_pooled_prompt_embeds,
             callback_on_step_end_tensor_inputs,
         )
+        if self.static_loop is not None:
+            self.check_static_loop_inputs(guidance_policy)
 
-        self._guidance_scale = guidance_scale
         self._guidance_rescale = guidance_rescale
         self._clip_skip = clip_skip
         self._cross_attention_kwargs = cross_attention_kwargs
@@ -1081,6 +1198,8 @@ class StableDiffusionXLPipeline(
         else:
             batch_size = prompt_embeds.shape[0]
 
+        self._guidance_scale = prepare_guidance_scale(guidance_scale, batch_size, num_images_per_prompt)
+
         device = self._execution_device
 
         # 3. Encode input prompt
@@ -1111,6 +1230,7 @@ class StableDiffusionXLPipeline(
 
         # 4. Prepare timesteps
         timesteps, num_inference_steps = retrieve_timesteps(self.scheduler, num_inference_steps, device, timesteps)
+        self.unet.precompute_timestep_embeddings(timesteps)
 
         # 5. Prepare latent variables
         num_channels_latents = self.unet.config.in_channels
@@ -1124,6 +1244,18 @@ class StableDiffusionXLPipeline(
             generator,
             latents,
         )
+        if (bucket_height, bucket_width) != (height, width):
+            # the requested latents are surrounded by additional noise up to the bucket resolution
+            noise = self.prepare_latents(
+                batch_size * num_images_per_prompt,
+                num_channels_latents,
+                bucket_height,
+                bucket_width,
+                prompt_embeds.dtype,
+                device,
+                generator,
+            )
+            latents = self.compile_manager.pad_latents(latents, noise)
 
         # 6. Prepare extra step kwargs. TODO: Logic should ideally just be moved out of the pipeline
         extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
@@ -1193,47 +1325,101 @@ class StableDiffusionXLPipeline(
         # 9. Optionally get Guidance Scale Embedding
         timestep_cond = None
         if self.unet.config.time_cond_proj_dim is not None:
-            guidance_scale_tensor = torch.tensor(self.guidance_scale - 1).repeat(batch_size * num_images_per_prompt)
+            if isinstance(self.guidance_scale, torch.Tensor):
+                guidance_scale_tensor = self.guidance_scale - 1
+            else:
+                guidance_scale_tensor = torch.tensor(self.guidance_scale - 1).repeat(
+                    batch_size * num_images_per_prompt
+                )
             timestep_cond = self.get_guidance_scale_embedding(
                 guidance_scale_tensor, embedding_dim=self.unet.config.time_cond_proj_dim
             ).to(device=device, dtype=latents.dtype)
 
+        # 10. Prepare the guidance
+        guidance_policy = guidance_policy or GuidancePolicy()
+        guidance_scale = self.guidance_scale
+        if isinstance(guidance_scale, torch.Tensor):
+            # samples with a guidance scale <= 1 only use the conditional noise prediction
+            guidance_scale = torch.where(guidance_scale > 1, guidance_scale, 1.0)
+            guidance_scale = guidance_scale.to(device=device, dtype=latents.dtype).view(-1, 1, 1, 1)
+
+        # 11. Optionally load the inputs into the buffers of a static denoising step
+        static_step = None
+        if self.static_loop is not None:
+            added_cond_kwargs = {"text_embeds": add_text_embeds, "time_ids": add_time_ids}
+            if ip_adapter_image is not None:
+                added_cond_kwargs["image_embeds"] = image_embeds
+            step_kwargs = {k: v for k, v in extra_step_kwargs.items() if k != "generator"}
+            static_step = self.static_loop.prepare(
+                self.unet,
+                latents,
+                StaticSchedule.from_scheduler(self.scheduler, timesteps, **step_kwargs),
+                guidance_scale=guidance_scale,
+                guidance_rescale=self.guidance_rescale,
+                do_classifier_free_guidance=self.do_classifier_free_guidance,
+                encoder_hidden_states=prompt_embeds,
+                timestep_cond=timestep_cond,
+                cross_attention_kwargs=self.cross_attention_kwargs,
+                added_cond_kwargs=added_cond_kwargs,
+            )
+
         self._num_timesteps = len(timesteps)
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 if self.interrupt:
                     continue
 
-                # expand the latents if we are doing classifier free guidance
-                latent_model_input = torch.cat([latents] * 2) if self.do_classifier_free_guidance else latents
-
-                latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
-
-                # predict the noise residual
-                added_cond_kwargs = {"text_embeds": add_text_embeds, "time_ids": add_time_ids}
-                if ip_adapter_image is not None:
-                    added_cond_kwargs["image_embeds"] = image_embeds
-                noise_pred = self.unet(
-                    latent_model_input,
-                    t,
-                    encoder_hidden_states=prompt_embeds,
-                    timestep_cond=timestep_cond,
-                    cross_attention_kwargs=self.cross_attention_kwargs,
-                    added_cond_kwargs=added_cond_kwargs,
-                    return_dict=False,
-                )[0]
-
-                # perform guidance
-                if self.do_classifier_free_guidance:
-                    noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
-                    noise_pred = noise_pred_uncond + self.guidance_scale * (noise_pred_text - noise_pred_uncond)
-
-                if self.do_classifier_free_guidance and self.guidance_rescale > 0.0:
-                    # Based on 3.4. in https://arxiv.org/pdf/2305.08891.pdf
-                    noise_pred = rescale_noise_cfg(noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale)
-
-                # compute the previous noisy sample x_t -> x_t-1
-                latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs, return_dict=False)[0]
+                if static_step is not None:
+                    # UNet, guidance and scheduler step from the static buffers, replayed from a CUDA graph on GPUs
+                    latents = static_step()
+                else:
+                    do_guidance = self.do_classifier_free_guidance and guidance_policy.do_guidance(i, len(timesteps))
+                    compute_uncond = self.do_classifier_free_guidance and guidance_policy.compute_uncond(
+                        i, len(timesteps)
+                    )
+
+                    # expand the latents if we are doing classifier free guidance
+                    latent_model_input = torch.cat([latents] * 2) if compute_uncond else latents
+
+                    latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
+
+                    # predict the noise residual
+                    added_cond_kwargs = {"text_embeds": add_text_embeds, "time_ids": add_time_ids}
+                    if ip_adapter_image is not None:
+                        added_cond_kwargs["image_embeds"] = image_embeds
+
+                    # only pass the conditional inputs if the unconditional noise prediction is skipped at this step
+                    encoder_hidden_states = prompt_embeds
+                    if self.do_classifier_free_guidance and not compute_uncond:
+                        encoder_hidden_states = prompt_embeds.chunk(2)[1]
+                        added_cond_kwargs = {k: v.chunk(2)[1] for k, v in added_cond_kwargs.items()}
+
+                    noise_pred = self.unet(
+                        latent_model_input,
+                        t,
+                        encoder_hidden_states=encoder_hidden_states,
+                        timestep_cond=timestep_cond,
+                        cross_attention_kwargs=self.cross_attention_kwargs,
+                        added_cond_kwargs=added_cond_kwargs,
+                        return_dict=False,
+                    )[0]
+
+                    # perform guidance, reusing the last unconditional noise prediction if it wasn't computed
+                    if compute_uncond:
+                        noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
+                    else:
+                        noise_pred_text = noise_pred
+                    if do_guidance:
+                        noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_text - noise_pred_uncond)
+
+                    if do_guidance and self.guidance_rescale > 0.0:
+                        # Based on 3.4. in https://arxiv.org/pdf/2305.08891.pdf
+                        noise_pred = rescale_noise_cfg(
+                            noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale
+                        )
+
+                    # compute the previous noisy sample x_t -> x_t-1
+                    latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs, return_dict=False)[0]
 
                 if callback_on_step_end is not None:
                     callback_kwargs = {}
@@ -1250,6 +1436,8 @@ class StableDiffusionXLPipeline(
                     )
                     add_time_ids = callback_outputs.pop("add_time_ids", add_time_ids)
                     negative_add_time_ids = callback_outputs.pop("negative_add_time_ids", negative_add_time_ids)
+                    if static_step is not None and latents is not static_step.latents:
+                        static_step.latents.copy_(latents)
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
@@ -1261,6 +1449,10 @@ class StableDiffusionXLPipeline(
                 if XLA_AVAILABLE:
                     xm.mark_step()
 
+        if static_step is not None:
+            # the buffer is overwritten by the next generation with the same shapes
+            latents = latents.clone()
+
         if not output_type == "latent":
             # make sure the VAE is in float32 mode, as it overflows in float16
             needs_upcasting = self.vae.dtype == torch.float16 and self.vae.config.force_upcast
@@ -1270,12 +1462,18 @@ class StableDiffusionXLPipeline(
                 latents = latents.to(next(iter(self.vae.post_quant_conv.parameters())).dtype)
 
             image = self.vae.decode(latents / self.vae.config.scaling_factor, return_dict=False)[0]
+            if (bucket_height, bucket_width) != (height, width):
+                image = self.compile_manager.crop(image, height, width, scale_factor=self.vae_scale_factor)
 
             # cast back to fp16 if needed
             if needs_upcasting:
                 self.vae.to(dtype=torch.float16)
         else:
             image = latents
+            if (bucket_height, bucket_width) != (height, width):
+                image = self.compile_manager.crop(
+                    image, height // self.vae_scale_factor, width // self.vae_scale_factor
+                )
 
         if not output_type == "latent":
             # apply watermark if available
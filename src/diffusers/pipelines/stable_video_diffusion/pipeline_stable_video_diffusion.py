@@ -14,7 +14,7 @@
 
 import inspect
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Union
 
 import numpy as np
 import PIL.Image
@@ -241,6 +241,47 @@ class StableVideoDiffusionPipeline(DiffusionPipeline):
         frames = frames.float()
         return frames
 
+    def decode_latents_stream(self, latents, decode_chunk_size=14) -> Iterator[torch.FloatTensor]:
+        r"""
+        Decodes the latents `decode_chunk_size` frames at a time and yields every chunk as soon as it is decoded.
+
+        Contrary to [`~StableVideoDiffusionPipeline.decode_latents`], the chunks are neither concatenated nor cast to
+        `float32`, so the decoded video never exists as a whole in memory. The chunks can be converted to `uint8`
+        frames with [`~image_processor.VaeImageProcessor.postprocess_stream`] and written with
+        [`~utils.export_to_video`]:
+
+        ```py
+        frames = pipe.image_processor.postprocess_stream(pipe.decode_latents_stream(latents))
+        export_to_video(frames, "generated.mp4", fps=7)
+        ```
+
+        Args:
+            latents (`torch.FloatTensor`):
+                The latents with shape `(batch_size, num_frames, channels, height, width)`.
+            decode_chunk_size (`int`, *optional*, defaults to 14):
+                The number of frames to decode at a time.
+
+        Yields:
+            `torch.FloatTensor`: The decoded frames with shape `(num_frames_in, channels, height, width)`, in the
+            dtype of the VAE. The frames of all the videos of the batch are yielded one video after the other.
+        """
+        # [batch, frames, channels, height, width] -> [batch*frames, channels, height, width]
+        latents = latents.flatten(0, 1)
+
+        latents = 1 / self.vae.config.scaling_factor * latents
+
+        forward_vae_fn = self.vae._orig_mod.forward if is_compiled_module(self.vae) else self.vae.forward
+        accepts_num_frames = "num_frames" in set(inspect.signature(forward_vae_fn).parameters.keys())
+
+        for i in range(0, latents.shape[0], decode_chunk_size):
+            num_frames_in = latents[i : i + decode_chunk_size].shape[0]
+            decode_kwargs = {}
+            if accepts_num_frames:
+                # we only pass num_frames_in if it's expected
+                decode_kwargs["num_frames"] = num_frames_in
+
+            yield self.vae.decode(latents[i : i + decode_chunk_size], **decode_kwargs).sample
+
     def check_inputs(self, image, height, width):
         if (
             not isinstance(image, torch.Tensor)
@@ -542,8 +583,16 @@ class StableVideoDiffusionPipeline(DiffusionPipeline):
             # cast back to fp16 if needed
             if needs_upcasting:
                 self.vae.to(dtype=torch.float16)
-            frames = self.decode_latents(latents, num_frames, decode_chunk_size)
-            frames = tensor2vid(frames, self.image_processor, output_type=output_type)
+            if output_type == "pil":
+                # convert the frames to uint8 chunk by chunk instead of materializing the float32 video
+                chunks = self.image_processor.postprocess_stream(
+                    self.decode_latents_stream(latents, decode_chunk_size)
+                )
+                frames = [PIL.Image.fromarray(frame) for chunk in chunks for frame in chunk]
+                frames = [frames[i : i + num_frames] for i in range(0, len(frames), num_frames)]
+            else:
+                frames = self.decode_latents(latents, num_frames, decode_chunk_size)
+                frames = tensor2vid(frames, self.image_processor, output_type=output_type)
         else:
             frames = latents
 
@@ -0,0 +1,408 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Union
+
+import torch
+
+from ..schedulers import (
+    DDIMScheduler,
+    DEISMultistepScheduler,
+    DPMSolverMultistepScheduler,
+    EulerDiscreteScheduler,
+)
+
+
+STATIC_SCHEDULERS = (DDIMScheduler, EulerDiscreteScheduler, DPMSolverMultistepScheduler, DEISMultistepScheduler)
+
+
+# Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.rescale_noise_cfg
+def rescale_noise_cfg(noise_cfg, noise_pred_text, guidance_rescale=0.0):
+    """
+    Rescale `noise_cfg` according to `guidance_rescale`. Based on findings of [Common Diffusion Noise Schedules and
+    Sample Steps are Flawed](https://arxiv.org/pdf/2305.08891.pdf). See Section 3.4
+    """
+    std_text = noise_pred_text.std(dim=list(range(1, noise_pred_text.ndim)), keepdim=True)
+    std_cfg = noise_cfg.std(dim=list(range(1, noise_cfg.ndim)), keepdim=True)
+    # rescale the results from guidance (fixes overexposure)
+    noise_pred_rescaled = noise_cfg * (std_text / std_cfg)
+    # mix with the original results from guidance by factor guidance_rescale to avoid "plain looking" images
+    noise_cfg = guidance_rescale * noise_pred_rescaled + (1 - guidance_rescale) * noise_cfg
+    return noise_cfg
+
+
+class StaticSchedule:
+    r"""
+    The denoising schedule of a scheduler in a branch-free, tensorized form.
+
+    The steps of [`DDIMScheduler`] (with `eta=0`), [`EulerDiscreteScheduler`] (with `s_churn=0`) and the
+    deterministic variants of [`DPMSolverMultistepScheduler`] and [`DEISMultistepScheduler`] are linear in the sample,
+    the model output and the converted model outputs of the previous steps that multistep solvers keep. Step `i` is
+    then fully described by a row of each table:
+
+    - the model input is `input_scales[i] * sample`
+    - the converted model output is `output_coefficients[i, 0] * sample + output_coefficients[i, 1] * model_output`,
+      it is prepended to the history of the last `history_size` converted model outputs
+    - the previous sample is the combination of `sample`, `model_output` and the history before the update with the
+      coefficients `step_coefficients[i]`
+
+    Args:
+        timesteps (`torch.Tensor`):
+            The timesteps of the steps, of shape `(num_steps,)`.
+        input_scales (`torch.Tensor`):
+            The factors of `scale_model_input`, of shape `(num_steps,)`.
+        output_coefficients (`torch.Tensor`):
+            The coefficients of the converted model outputs, of shape `(num_steps, 2)`.
+        step_coefficients (`torch.Tensor`):
+            The coefficients of the updates, of shape `(num_steps, 2 + history_size)`.
+    """
+
+    def __init__(
+        self,
+        timesteps: torch.Tensor,
+        input_scales: torch.Tensor,
+        output_coefficients: torch.Tensor,
+        step_coefficients: torch.Tensor,
+    ):
+        self.timesteps = timesteps
+        self.input_scales = input_scales
+        self.output_coefficients = output_coefficients
+        self.step_coefficients = step_coefficients
+
+    @property
+    def num_steps(self) -> int:
+        return self.step_coefficients.shape[0]
+
+    @property
+    def history_size(self) -> int:
+        return self.step_coefficients.shape[1] - 2
+
+    @classmethod
+    def from_scheduler(cls, scheduler, timesteps: Optional[torch.Tensor] = None, **step_kwargs) -> "StaticSchedule":
+        r"""
+        Tabulates the steps of a scheduler whose timesteps are set. The coefficients are read off by running the
+        `scale_model_input` and `step` methods of a copy of the scheduler on unit vectors, so they match the regular
+        denoising loop exactly.
+
+        Args:
+            scheduler ([`SchedulerMixin`]):
+                The scheduler, after `set_timesteps` was called.
+            timesteps (`torch.Tensor`, *optional*):
+                The timesteps that are run, a prefix of `scheduler.timesteps`. Defaults to all of them.
+            step_kwargs:
+                Additional keyword arguments of the `step` method, like `eta` for [`DDIMScheduler`].
+        """
+        if not isinstance(scheduler, STATIC_SCHEDULERS):
+            raise ValueError(
+                f"{scheduler.__class__.__name__} does not support static denoising loops. Please use one of"
+                f" {', '.join(scheduler_cls.__name__ for scheduler_cls in STATIC_SCHEDULERS)}."
+            )
+        if getattr(scheduler.config, "thresholding", False) or getattr(scheduler.config, "clip_sample", False):
+            raise ValueError(
+                "Static denoising loops don't support thresholding or clipping the predicted original sample. Please"
+                " set `thresholding=False` and `clip_sample=False` in the scheduler config."
+            )
+
+        timesteps = scheduler.timesteps if timesteps is None else timesteps
+        scheduler = copy.deepcopy(scheduler)
+        history_size = len(getattr(scheduler, "model_outputs", []))
+
+        # the inputs of a step are the unit vectors [sample, model_output, newest history entry, ...], the last column
+        # is zero in all of them and picks up the noise added by stochastic steps
+        num_inputs = 2 + history_size
+        basis = torch.eye(num_inputs, num_inputs + 1, device=timesteps.device)[:, None]
+        ones = torch.ones(1, device=timesteps.device)
+
+        input_scales, output_coefficients, step_coefficients = [], [], []
+        for t in timesteps:
+            if history_size > 0:
+                scheduler.model_outputs = list(basis[2:].flip(0))
+            input_scales.append(scheduler.scale_model_input(ones, t).to(torch.float32))
+            prev_sample = scheduler.step(basis[1], t, basis[0], **step_kwargs, return_dict=False)[0]
+            step_coefficients.append(prev_sample[0].to(torch.float32))
+            if history_size > 0:
+                output_coefficients.append(scheduler.model_outputs[-1][0].to(torch.float32))
+
+        step_coefficients = torch.stack(step_coefficients)
+        if history_size > 0:
+            output_coefficients = torch.stack(output_coefficients)
+        else:
+            output_coefficients = step_coefficients.new_zeros((len(timesteps), num_inputs + 1))
+
+        if step_coefficients[:, -1].ne(0).any() or output_coefficients[:, 2:].ne(0).any():
+            raise ValueError(
+                f"The steps of {scheduler.__class__.__name__} are not deterministic linear updates with this"
+                " configuration, for example because they add noise, and can't run in a static denoising loop."
+            )
+
+        return cls(
+            timesteps=timesteps.clone(),
+            input_scales=torch.cat(input_scales),
+            output_coefficients=output_coefficients[:, :2].contiguous(),
+            step_coefficients=step_coefficients[:, :-1].contiguous(),
+        )
+
+
+@contextmanager
+def _without_embedding_caches(model):
+    # the cached embeddings are looked up on the host, which would be frozen into a captured graph
+    cache = getattr(model, "_timestep_embedding_cache", None)
+    model._timestep_embedding_cache = None
+    try:
+        yield
+    finally:
+        model._timestep_embedding_cache = cache
+
+
+def _allocate_like(value):
+    if isinstance(value, torch.Tensor):
+        return torch.empty_like(value)
+    if isinstance(value, dict):
+        return {k: _allocate_like(v) for k, v in value.items()}
+    return value
+
+
+def _copy_into(buffer, value):
+    if isinstance(buffer, torch.Tensor):
+        buffer.copy_(value)
+    elif isinstance(buffer, dict):
+        for k, v in buffer.items():
+            _copy_into(v, value[k])
+
+
+def _signature(value):
+    if isinstance(value, torch.Tensor):
+        return (tuple(value.shape), value.dtype, value.device)
+    if isinstance(value, dict):
+        return tuple((k, _signature(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_signature(v) for v in value)
+    return value
+
+
+class StaticDenoisingStep:
+    r"""
+    A denoising step of a [`StaticDenoisingLoop`]: the UNet, the classifier-free guidance and the scheduler update
+    read all their inputs from preallocated buffers, and the index of the step is a device tensor that the step
+    increments, so the step never synchronizes with the host. Calling the step runs the next denoising step in place
+    and returns the `latents` buffer.
+    """
+
+    def __init__(
+        self,
+        unet: torch.nn.Module,
+        latents: torch.Tensor,
+        schedule: StaticSchedule,
+        do_classifier_free_guidance: bool,
+        do_guidance_rescale: bool,
+        unet_kwargs: Dict[str, Any],
+    ):
+        self.unet = unet
+        self.do_classifier_free_guidance = do_classifier_free_guidance
+        self.do_guidance_rescale = do_guidance_rescale
+        self.graph = None
+
+        device = latents.device
+        batch_size = latents.shape[0]
+        self.latents = torch.empty_like(latents)
+        self.history = latents.new_zeros((schedule.history_size, *latents.shape))
+        self.latent_model_input = latents.new_empty(
+            (2 * batch_size if do_classifier_free_guidance else batch_size, *latents.shape[1:])
+        )
+        self.step_index = torch.zeros(1, dtype=torch.long, device=device)
+        self.timesteps = torch.empty_like(schedule.timesteps, device=device)
+        self.input_scales = torch.empty_like(schedule.input_scales, device=device)
+        self.output_coefficients = torch.empty_like(schedule.output_coefficients, device=device)
+        self.step_coefficients = torch.empty_like(schedule.step_coefficients, device=device)
+        self.guidance_scale = latents.new_empty((batch_size, 1, 1, 1))
+        self.guidance_rescale = torch.zeros((), device=device)
+        self.unet_kwargs = _allocate_like(unet_kwargs)
+
+    def load(
+        self,
+        latents: torch.Tensor,
+        schedule: StaticSchedule,
+        guidance_scale: Union[float, torch.Tensor],
+        guidance_rescale: float,
+        unet_kwargs: Dict[str, Any],
+    ):
+        r"""Copies the inputs of a generation into the buffers and rewinds the step index."""
+        self.latents.copy_(latents)
+        self.history.zero_()
+        self.step_index.zero_()
+        self.timesteps.copy_(schedule.timesteps)
+        self.input_scales.copy_(schedule.input_scales)
+        self.output_coefficients.copy_(schedule.output_coefficients)
+        self.step_coefficients.copy_(schedule.step_coefficients)
+        self.guidance_scale.copy_(torch.as_tensor(guidance_scale))
+        self.guidance_rescale.fill_(guidance_rescale)
+        _copy_into(self.unet_kwargs, unet_kwargs)
+
+    def capture(self, pool=None):
+        r"""Captures the step in a CUDA graph, which is then replayed by every call."""
+        # warm up on a side stream as required for capturing, and restore the state the warm-up step advanced
+        state = [buffer.clone() for buffer in (self.latents, self.history, self.step_index)]
+        stream = torch.cuda.Stream(device=self.latents.device)
+        stream.wait_stream(torch.cuda.current_stream(self.latents.device))
+        with torch.cuda.stream(stream):
+            self._step()
+        torch.cuda.current_stream(self.latents.device).wait_stream(stream)
+        for buffer, value in zip((self.latents, self.history, self.step_index), state):
+            buffer.copy_(value)
+
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph, pool=pool):
+            self._step()
+
+    def __call__(self) -> torch.Tensor:
+        if self.graph is not None:
+            self.graph.replay()
+        else:
+            self._step()
+        return self.latents
+
+    def _step(self):
+        with _without_embedding_caches(self.unet):
+            # indexing with a device tensor instead of a Python integer doesn't synchronize
+            t = self.timesteps.index_select(0, self.step_index)
+            input_scale = self.input_scales.index_select(0, self.step_index)[0]
+            output_coefficients = self.output_coefficients.index_select(0, self.step_index)[0]
+            step_coefficients = self.step_coefficients.index_select(0, self.step_index)[0]
+
+            # the unconditional and conditional halves of the batch are written in place instead of concatenated
+            batch_size = self.latents.shape[0]
+            torch.mul(self.latents, input_scale, out=self.latent_model_input[:batch_size])
+            if self.do_classifier_free_guidance:
+                self.latent_model_input[batch_size:].copy_(self.latent_model_input[:batch_size])
+
+            noise_pred = self.unet(self.latent_model_input, t, **self.unet_kwargs, return_dict=False)[0]
+
+            if self.do_classifier_free_guidance:
+                noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
+                noise_pred = noise_pred_uncond + self.guidance_scale * (noise_pred_text - noise_pred_uncond)
+                if self.do_guidance_rescale:
+                    noise_pred = rescale_noise_cfg(noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale)
+
+            prev_sample = step_coefficients[0] * self.latents.float() + step_coefficients[1] * noise_pred.float()
+            for k in range(self.history.shape[0]):
+                prev_sample = prev_sample + step_coefficients[2 + k] * self.history[k].float()
+
+            if self.history.shape[0] > 0:
+                converted_output = output_coefficients[0] * self.latents + output_coefficients[1] * noise_pred
+                self.history.copy_(self.history.roll(1, dims=0))
+                self.history[0].copy_(converted_output)
+
+            self.latents.copy_(prev_sample)
+            self.step_index.add_(1)
+
+
+class StaticDenoisingLoop:
+    r"""
+    Runs the denoising loop of a pipeline as a sequence of [`StaticDenoisingStep`]s, which don't branch on the step
+    and don't synchronize with the host. On CUDA devices, a whole step, UNet, guidance and scheduler update included,
+    is captured in a CUDA graph the first time a shape is seen, and replayed for every step of every later generation
+    with that shape. Graphs are cached by the shapes and dtypes of the latents and the conditioning, the number of
+    steps and the solver history size, so each resolution and batch size bucket is captured once.
+
+    The static loop supports the schedulers in `STATIC_SCHEDULERS` when their steps are deterministic, see
+    [`~pipelines.static_denoising_loop.StaticSchedule`].
+
+    <Tip warning={true}>
+
+    A captured graph reads the weights of the UNet from the memory they had during the capture. Call
+    [`~StaticDenoisingLoop.clear`] after replacing or offloading weights, for example when loading LoRA weights
+    without fusing them.
+
+    </Tip>
+
+    Args:
+        use_cuda_graphs (`bool`, *optional*, defaults to `True`):
+            Whether to capture the steps in CUDA graphs on CUDA devices. Otherwise, and on other devices, the static
+            steps run eagerly.
+    """
+
+    def __init__(self, use_cuda_graphs: bool = True):
+        self.use_cuda_graphs = use_cuda_graphs
+        self.num_captures = 0
+        self._steps = {}
+        self._graph_pool = None
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def prepare(
+        self,
+        unet: torch.nn.Module,
+        latents: torch.Tensor,
+        schedule: StaticSchedule,
+        guidance_scale: Union[float, torch.Tensor] = 1.0,
+        guidance_rescale: float = 0.0,
+        do_classifier_free_guidance: bool = False,
+        **unet_kwargs,
+    ) -> StaticDenoisingStep:
+        r"""
+        Loads the inputs of a generation into the cached step for their shapes, creating and capturing it first if
+        needed.
+
+        Args:
+            unet (`torch.nn.Module`):
+                The denoising model, called as `unet(latent_model_input, t, **unet_kwargs, return_dict=False)`.
+            latents (`torch.Tensor`):
+                The initial latents.
+            schedule ([`~pipelines.static_denoising_loop.StaticSchedule`]):
+                The tabulated denoising schedule.
+            guidance_scale (`float` or `torch.Tensor`, *optional*, defaults to 1.0):
+                The guidance scale, or one per sample of shape `(batch_size, 1, 1, 1)`.
+            guidance_rescale (`float`, *optional*, defaults to 0.0):
+                The guidance rescale factor.
+            do_classifier_free_guidance (`bool`, *optional*, defaults to `False`):
+                Whether the UNet runs on the unconditional and the conditional batch.
+            unet_kwargs:
+                The conditioning of the UNet, for the batch of `2 * batch_size` samples with classifier-free guidance.
+                Tensors are copied into buffers at every generation, other values are frozen into the step.
+        """
+        do_guidance_rescale = do_classifier_free_guidance and guidance_rescale > 0.0
+        key = (
+            id(unet),
+            _signature(latents),
+            schedule.num_steps,
+            schedule.history_size,
+            schedule.timesteps.dtype,
+            do_classifier_free_guidance,
+            do_guidance_rescale,
+            _signature(unet_kwargs),
+        )
+
+        step = self._steps.get(key)
+        if step is None:
+            step = StaticDenoisingStep(
+                unet, latents, schedule, do_classifier_free_guidance, do_guidance_rescale, unet_kwargs
+            )
+            self._steps[key] = step
+
+        step.load(latents, schedule, guidance_scale, guidance_rescale, unet_kwargs)
+        if self.use_cuda_graphs and latents.device.type == "cuda" and step.graph is None:
+            if self._graph_pool is None:
+                self._graph_pool = torch.cuda.graph_pool_handle()
+            step.capture(self._graph_pool)
+            self.num_captures += 1
+
+        return step
+
+    def clear(self):
+        r"""Drops all cached steps and their CUDA graphs."""
+        self._steps.clear()
+        self._graph_pool = None
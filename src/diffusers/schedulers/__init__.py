@@ -20,7 +20,6 @@ from ..utils import (
     _LazyModule,
     get_objects_from_module,
     is_flax_available,
-    is_scipy_available,
     is_torch_available,
     is_torchsde_available,
 )
@@ -59,6 +58,7 @@ else:
     _import_structure["scheduling_k_dpm_2_ancestral_discrete"] = ["KDPM2AncestralDiscreteScheduler"]
     _import_structure["scheduling_k_dpm_2_discrete"] = ["KDPM2DiscreteScheduler"]
     _import_structure["scheduling_lcm"] = ["LCMScheduler"]
+    _import_structure["scheduling_lms_discrete"] = ["LMSDiscreteScheduler"]
     _import_structure["scheduling_pndm"] = ["PNDMScheduler"]
     _import_structure["scheduling_repaint"] = ["RePaintScheduler"]
     _import_structure["scheduling_sasolver"] = ["SASolverScheduler"]
@@ -93,17 +93,6 @@ else:
     ]
 
 
-try:
-    if not (is_torch_available() and is_scipy_available()):
-        raise OptionalDependencyNotAvailable()
-except OptionalDependencyNotAvailable:
-    from ..utils import dummy_torch_and_scipy_objects  # noqa F403
-
-    _dummy_modules.update(get_objects_from_module(dummy_torch_and_scipy_objects))
-
-else:
-    _import_structure["scheduling_lms_discrete"] = ["LMSDiscreteScheduler"]
-
 try:
     if not (is_torch_available() and is_torchsde_available()):
         raise OptionalDependencyNotAvailable()
@@ -119,7 +108,6 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
     from ..utils import (
         OptionalDependencyNotAvailable,
         is_flax_available,
-        is_scipy_available,
         is_torch_available,
         is_torchsde_available,
     )
@@ -151,6 +139,7 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
         from .scheduling_k_dpm_2_ancestral_discrete import KDPM2AncestralDiscreteScheduler
         from .scheduling_k_dpm_2_discrete import KDPM2DiscreteScheduler
         from .scheduling_lcm import LCMScheduler
+        from .scheduling_lms_discrete import LMSDiscreteScheduler
         from .scheduling_pndm import PNDMScheduler
         from .scheduling_repaint import RePaintScheduler
         from .scheduling_sasolver import SASolverScheduler
@@ -181,14 +170,6 @@ if TYPE_CHECKING or DIFFUSERS_SLOW_IMPORT:
             broadcast_to_shape_from_left,
         )
 
-    try:
-        if not (is_torch_available() and is_scipy_available()):
-            raise OptionalDependencyNotAvailable()
-    except OptionalDependencyNotAvailable:
-        from ..utils.dummy_torch_and_scipy_objects import *  # noqa F403
-    else:
-        from .scheduling_lms_discrete import LMSDiscreteScheduler
-
     try:
         if not (is_torch_available() and is_torchsde_available()):
             raise OptionalDependencyNotAvailable()
@@ -16,7 +16,8 @@
 # The codebase is modified based on https://github.com/huggingface/diffusers/blob/main/src/diffusers/schedulers/scheduling_dpmsolver_multistep.py
 
 import math
-from typing import List, Optional, Tuple, Union
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -71,6 +72,61 @@ def betas_for_alpha_bar(
     return torch.tensor(betas, dtype=torch.float32)
 
 
+# Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.linear_update_coefficients
+def linear_update_coefficients(
+    update_fn: Callable[..., torch.FloatTensor],
+    num_inputs: int,
+    num_steps: int = 1,
+    dtype: torch.dtype = torch.float32,
+) -> List[List[float]]:
+    """
+    Extracts the coefficients of a scheduler update that is linear in its `num_inputs` tensor arguments by applying it
+    once to the standard basis. The `k`-th argument is a `(num_inputs, num_steps)` tensor whose `k`-th row is one and
+    the others zero, so that an update whose scalars are `(num_steps,)` tensors is evaluated for all steps at once.
+
+    Args:
+        update_fn (`Callable`):
+            The update, called with `num_inputs` positional tensors.
+        num_inputs (`int`):
+            The number of tensor arguments of `update_fn`.
+        num_steps (`int`, defaults to 1):
+            The number of steps `update_fn` is vectorized over.
+        dtype (`torch.dtype`, defaults to `torch.float32`):
+            The dtype in which the update is evaluated.
+
+    Returns:
+        `List[List[float]]`: for every step, the coefficient of every argument, such that `update_fn(*inputs)` equals
+        `combine_linearly(coefficients, inputs)`.
+    """
+    basis = torch.eye(num_inputs, dtype=dtype).unsqueeze(-1).expand(num_inputs, num_inputs, num_steps)
+    return update_fn(*basis).T.tolist()
+
+
+# Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.combine_linearly
+def combine_linearly(coefficients: List[float], tensors: List[torch.FloatTensor]) -> torch.FloatTensor:
+    """
+    Computes `sum(coefficient * tensor)` with a single output allocation, skipping the terms whose coefficient is zero.
+
+    Args:
+        coefficients (`List[float]`):
+            The coefficient of every tensor.
+        tensors (`List[torch.FloatTensor]`):
+            The tensors to combine, the first one sets the device of the result.
+
+    Returns:
+        `torch.FloatTensor`: the linear combination, in the promoted dtype of `tensors`.
+    """
+    dtype = tensors[0].dtype
+    for tensor in tensors[1:]:
+        dtype = torch.promote_types(dtype, tensor.dtype)
+
+    result = tensors[0].to(dtype) * coefficients[0]
+    for coefficient, tensor in zip(coefficients[1:], tensors[1:]):
+        if coefficient != 0.0:
+            result.add_(tensor, alpha=coefficient)
+    return result
+
+
 class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
     """
     `DEISMultistepScheduler` is a fast high order solver for diffusion ordinary differential equations (ODEs).
@@ -187,6 +243,7 @@ class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.model_outputs = [None] * solver_order
         self.lower_order_nums = 0
         self._step_index = None
+        self._solver_coefficients = None
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     @property
@@ -247,6 +304,8 @@ class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
 
         self.num_inference_steps = len(timesteps)
+        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
+        self._solver_coefficients = self._build_solver_coefficients()
 
         self.model_outputs = [
             None,
@@ -255,7 +314,6 @@ class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
 
         # add an index counter for schedulers that allow duplicated timesteps
         self._step_index = None
-        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     # Copied from diffusers.schedulers.scheduling_ddpm.DDPMScheduler._threshold_sample
     def _threshold_sample(self, sample: torch.FloatTensor) -> torch.FloatTensor:
@@ -620,6 +678,37 @@ class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
         else:
             raise NotImplementedError("only support log-rho multistep deis now")
 
+    def _build_solver_coefficients(self) -> Dict[int, List[Optional[List[float]]]]:
+        """
+        Tabulates, for every order and step of the schedule, the coefficients of the multistep update as a linear
+        combination of the sample and the model output history (newest first), so that
+        [`~DEISMultistepScheduler.step`] no longer recomputes them with scalar tensor ops.
+        """
+        num_steps = len(self.timesteps)
+
+        def update(order, sample, *model_outputs):
+            model_output_list = list(model_outputs[::-1])
+            if order == 1:
+                return self.deis_first_order_update(model_output_list[-1], sample=sample)
+            elif order == 2:
+                return self.multistep_deis_second_order_update(model_output_list, sample=sample)
+            return self.multistep_deis_third_order_update(model_output_list, sample=sample)
+
+        solver_coefficients = {}
+        for order in range(1, self.config.solver_order + 1):
+            solver_coefficients[order] = [None] * num_steps
+            # an update of order `order` needs `order - 1` previous steps
+            if num_steps < order:
+                continue
+            # the updates only use the step index to look up sigmas, so all steps are evaluated at once
+            self._step_index = torch.arange(order - 1, num_steps)
+            solver_coefficients[order][order - 1 :] = linear_update_coefficients(
+                partial(update, order), 1 + order, num_steps - order + 1, dtype=self.sigmas.dtype
+            )
+        self._step_index = None
+
+        return solver_coefficients
+
     def _init_step_index(self, timestep):
         if isinstance(timestep, torch.Tensor):
             timestep = timestep.to(self.timesteps.device)
@@ -687,8 +776,21 @@ class DEISMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.model_outputs[-1] = model_output
 
         if self.config.solver_order == 1 or self.lower_order_nums < 1 or lower_order_final:
-            prev_sample = self.deis_first_order_update(model_output, sample=sample)
+            order = 1
         elif self.config.solver_order == 2 or self.lower_order_nums < 2 or lower_order_second:
+            order = 2
+        else:
+            order = 3
+
+        coefficients = None
+        if self._solver_coefficients is not None and self.step_index < len(self._solver_coefficients[order]):
+            coefficients = self._solver_coefficients[order][self.step_index]
+
+        if coefficients is not None:
+            prev_sample = combine_linearly(coefficients, [sample] + self.model_outputs[::-1][:order])
+        elif order == 1:
+            prev_sample = self.deis_first_order_update(model_output, sample=sample)
+        elif order == 2:
             prev_sample = self.multistep_deis_second_order_update(self.model_outputs, sample=sample)
         else:
             prev_sample = self.multistep_deis_third_order_update(self.model_outputs, sample=sample)
@@ -15,7 +15,9 @@
 # DISCLAIMER: This file is strongly influenced by https://github.com/LuChengTHU/dpm-solver
 
 import math
-from typing import List, Optional, Tuple, Union
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -71,6 +73,106 @@ def betas_for_alpha_bar(
     return torch.tensor(betas, dtype=torch.float32)
 
 
+def linear_update_coefficients(
+    update_fn: Callable[..., torch.FloatTensor],
+    num_inputs: int,
+    num_steps: int = 1,
+    dtype: torch.dtype = torch.float32,
+) -> List[List[float]]:
+    """
+    Extracts the coefficients of a scheduler update that is linear in its `num_inputs` tensor arguments by applying it
+    once to the standard basis. The `k`-th argument is a `(num_inputs, num_steps)` tensor whose `k`-th row is one and
+    the others zero, so that an update whose scalars are `(num_steps,)` tensors is evaluated for all steps at once.
+
+    Args:
+        update_fn (`Callable`):
+            The update, called with `num_inputs` positional tensors.
+        num_inputs (`int`):
+            The number of tensor arguments of `update_fn`.
+        num_steps (`int`, defaults to 1):
+            The number of steps `update_fn` is vectorized over.
+        dtype (`torch.dtype`, defaults to `torch.float32`):
+            The dtype in which the update is evaluated.
+
+    Returns:
+        `List[List[float]]`: for every step, the coefficient of every argument, such that `update_fn(*inputs)` equals
+        `combine_linearly(coefficients, inputs)`.
+    """
+    basis = torch.eye(num_inputs, dtype=dtype).unsqueeze(-1).expand(num_inputs, num_inputs, num_steps)
+    return update_fn(*basis).T.tolist()
+
+
+def combine_linearly(coefficients: List[float], tensors: List[torch.FloatTensor]) -> torch.FloatTensor:
+    """
+    Computes `sum(coefficient * tensor)` with a single output allocation, skipping the terms whose coefficient is zero.
+
+    Args:
+        coefficients (`List[float]`):
+            The coefficient of every tensor.
+        tensors (`List[torch.FloatTensor]`):
+            The tensors to combine, the first one sets the device of the result.
+
+    Returns:
+        `torch.FloatTensor`: the linear combination, in the promoted dtype of `tensors`.
+    """
+    dtype = tensors[0].dtype
+    for tensor in tensors[1:]:
+        dtype = torch.promote_types(dtype, tensor.dtype)
+
+    result = tensors[0].to(dtype) * coefficients[0]
+    for coefficient, tensor in zip(coefficients[1:], tensors[1:]):
+        if coefficient != 0.0:
+            result.add_(tensor, alpha=coefficient)
+    return result
+
+
+@dataclass
+class DPMSolverMultistepSchedulerState:
+    """
+    Explicit solver state used by [`~DPMSolverMultistepScheduler.batched_step`]. Every tensor is stacked along the batch
+    dimension so that the states of several samples can be concatenated or split with regular tensor indexing.
+
+    Args:
+        model_outputs (`torch.FloatTensor` of shape `(batch_size, solver_order, num_channels, height, width)`):
+            The converted model outputs of the previous `solver_order` steps of each sample, oldest first.
+        lower_order_nums (`torch.LongTensor` of shape `(batch_size,)`):
+            The number of valid entries in `model_outputs` for each sample.
+    """
+
+    model_outputs: torch.FloatTensor
+    lower_order_nums: torch.LongTensor
+
+    def __getitem__(self, index) -> "DPMSolverMultistepSchedulerState":
+        """Selects the state of a subset of the batch, e.g. to drop finished samples."""
+        return DPMSolverMultistepSchedulerState(
+            model_outputs=self.model_outputs[index], lower_order_nums=self.lower_order_nums[index]
+        )
+
+    @classmethod
+    def cat(cls, states: List["DPMSolverMultistepSchedulerState"]) -> "DPMSolverMultistepSchedulerState":
+        """Concatenates the states of several (batches of) samples along the batch dimension."""
+        return cls(
+            model_outputs=torch.cat([state.model_outputs for state in states]),
+            lower_order_nums=torch.cat([state.lower_order_nums for state in states]),
+        )
+
+
+@dataclass
+class DPMSolverMultistepSchedulerBatchedOutput(SchedulerOutput):
+    """
+    Output class for [`~DPMSolverMultistepScheduler.batched_step`].
+
+    Args:
+        prev_sample (`torch.FloatTensor` of shape `(batch_size, num_channels, height, width)` for images):
+            Computed sample `(x_{t-1})` of previous timestep. `prev_sample` should be used as next model input in the
+            denoising loop.
+        state (`DPMSolverMultistepSchedulerState`):
+            The updated solver state to pass to the next call of `batched_step`.
+    """
+
+    state: DPMSolverMultistepSchedulerState
+
+
 class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
     """
     `DPMSolverMultistepScheduler` is a fast dedicated high-order solver for diffusion ODEs.
@@ -227,6 +329,7 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.model_outputs = [None] * solver_order
         self.lower_order_nums = 0
         self._step_index = None
+        self._solver_coefficients = None
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     @property
@@ -303,6 +406,8 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
 
         self.num_inference_steps = len(timesteps)
+        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
+        self._solver_coefficients = self._build_solver_coefficients()
 
         self.model_outputs = [
             None,
@@ -311,7 +416,6 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
 
         # add an index counter for schedulers that allow duplicated timesteps
         self._step_index = None
-        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     # Copied from diffusers.schedulers.scheduling_ddpm.DDPMScheduler._threshold_sample
     def _threshold_sample(self, sample: torch.FloatTensor) -> torch.FloatTensor:
@@ -792,6 +896,40 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
             )
         return x_t
 
+    def _build_solver_coefficients(self) -> Dict[int, List[Optional[List[float]]]]:
+        """
+        Tabulates, for every order and step of the schedule, the coefficients of the multistep update as a linear
+        combination of the sample, the model output history (newest first) and the noise. With the table,
+        [`~DPMSolverMultistepScheduler.step`] no longer recomputes the alphas, sigmas and lambdas of every step with
+        scalar tensor ops. Orders that are not tabulated fall back to the update methods.
+        """
+        stochastic = self.config.algorithm_type in ["sde-dpmsolver", "sde-dpmsolver++"]
+        num_steps = len(self.timesteps)
+
+        def update(order, sample, *inputs):
+            model_output_list = list(inputs[:order][::-1])
+            noise = inputs[order] if stochastic else None
+            if order == 1:
+                return self.dpm_solver_first_order_update(model_output_list[-1], sample=sample, noise=noise)
+            elif order == 2:
+                return self.multistep_dpm_solver_second_order_update(model_output_list, sample=sample, noise=noise)
+            return self.multistep_dpm_solver_third_order_update(model_output_list, sample=sample)
+
+        solver_coefficients = {}
+        for order in range(1, self.config.solver_order + 1):
+            solver_coefficients[order] = [None] * num_steps
+            # an update of order `order` needs `order - 1` previous steps, and the third order has no SDE variant
+            if num_steps < order or (order == 3 and stochastic):
+                continue
+            # the updates only use the step index to look up sigmas, so all steps are evaluated at once
+            self._step_index = torch.arange(order - 1, num_steps)
+            solver_coefficients[order][order - 1 :] = linear_update_coefficients(
+                partial(update, order), 1 + order + int(stochastic), num_steps - order + 1, dtype=self.sigmas.dtype
+            )
+        self._step_index = None
+
+        return solver_coefficients
+
     def _init_step_index(self, timestep):
         if isinstance(timestep, torch.Tensor):
             timestep = timestep.to(self.timesteps.device)
@@ -872,8 +1010,24 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
             noise = None
 
         if self.config.solver_order == 1 or self.lower_order_nums < 1 or lower_order_final:
-            prev_sample = self.dpm_solver_first_order_update(model_output, sample=sample, noise=noise)
+            order = 1
         elif self.config.solver_order == 2 or self.lower_order_nums < 2 or lower_order_second:
+            order = 2
+        else:
+            order = 3
+
+        coefficients = None
+        if self._solver_coefficients is not None and self.step_index < len(self._solver_coefficients[order]):
+            coefficients = self._solver_coefficients[order][self.step_index]
+
+        if coefficients is not None:
+            inputs = [sample] + self.model_outputs[::-1][:order]
+            if noise is not None:
+                inputs.append(noise)
+            prev_sample = combine_linearly(coefficients, inputs)
+        elif order == 1:
+            prev_sample = self.dpm_solver_first_order_update(model_output, sample=sample, noise=noise)
+        elif order == 2:
             prev_sample = self.multistep_dpm_solver_second_order_update(self.model_outputs, sample=sample, noise=noise)
         else:
             prev_sample = self.multistep_dpm_solver_third_order_update(self.model_outputs, sample=sample)
@@ -889,6 +1043,247 @@ class DPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
 
         return SchedulerOutput(prev_sample=prev_sample)
 
+    def create_state(self, sample: torch.FloatTensor) -> DPMSolverMultistepSchedulerState:
+        """
+        Creates an empty solver state for [`~DPMSolverMultistepScheduler.batched_step`].
+
+        Args:
+            sample (`torch.FloatTensor`):
+                A batch of samples with the shape, dtype and device of the samples that will be denoised.
+
+        Returns:
+            `DPMSolverMultistepSchedulerState`:
+                A state without any model output history.
+        """
+        return DPMSolverMultistepSchedulerState(
+            model_outputs=sample.new_zeros((sample.shape[0], self.config.solver_order, *sample.shape[1:])),
+            lower_order_nums=torch.zeros(sample.shape[0], dtype=torch.long, device=sample.device),
+        )
+
+    def _batched_convert_model_output(
+        self,
+        model_output: torch.FloatTensor,
+        sample: torch.FloatTensor,
+        alpha_t: torch.FloatTensor,
+        sigma_t: torch.FloatTensor,
+    ) -> torch.FloatTensor:
+        # same as `convert_model_output` but with per-sample `alpha_t` and `sigma_t` broadcastable to `sample`
+        if self.config.algorithm_type in ["dpmsolver++", "sde-dpmsolver++"]:
+            if self.config.prediction_type == "epsilon":
+                if self.config.variance_type in ["learned", "learned_range"]:
+                    model_output = model_output[:, :3]
+                x0_pred = (sample - sigma_t * model_output) / alpha_t
+            elif self.config.prediction_type == "sample":
+                x0_pred = model_output
+            elif self.config.prediction_type == "v_prediction":
+                x0_pred = alpha_t * sample - sigma_t * model_output
+            else:
+                raise ValueError(
+                    f"prediction_type given as {self.config.prediction_type} must be one of `epsilon`, `sample`, or"
+                    " `v_prediction` for the DPMSolverMultistepScheduler."
+                )
+
+            if self.config.thresholding:
+                x0_pred = self._threshold_sample(x0_pred)
+
+            return x0_pred
+
+        if self.config.prediction_type == "epsilon":
+            if self.config.variance_type in ["learned", "learned_range"]:
+                epsilon = model_output[:, :3]
+            else:
+                epsilon = model_output
+        elif self.config.prediction_type == "sample":
+            epsilon = (sample - alpha_t * model_output) / sigma_t
+        elif self.config.prediction_type == "v_prediction":
+            epsilon = alpha_t * model_output + sigma_t * sample
+        else:
+            raise ValueError(
+                f"prediction_type given as {self.config.prediction_type} must be one of `epsilon`, `sample`, or"
+                " `v_prediction` for the DPMSolverMultistepScheduler."
+            )
+
+        if self.config.thresholding:
+            x0_pred = (sample - sigma_t * epsilon) / alpha_t
+            x0_pred = self._threshold_sample(x0_pred)
+            epsilon = (sample - alpha_t * x0_pred) / sigma_t
+
+        return epsilon
+
+    def batched_step(
+        self,
+        model_output: torch.FloatTensor,
+        step_indices: torch.LongTensor,
+        sample: torch.FloatTensor,
+        state: DPMSolverMultistepSchedulerState,
+        generator=None,
+        return_dict: bool = True,
+    ) -> Union[DPMSolverMultistepSchedulerBatchedOutput, Tuple]:
+        """
+        Stateless, vectorized variant of [`~DPMSolverMultistepScheduler.step`] for batches whose samples are at
+        different points of the timestep schedule set with [`~DPMSolverMultistepScheduler.set_timesteps`].
+
+        The scheduler's own step index and model output history are neither read nor updated; the position of each
+        sample is given by `step_indices` and its history is carried by `state`.
+
+        Args:
+            model_output (`torch.FloatTensor`):
+                The direct output from learned diffusion model.
+            step_indices (`torch.LongTensor` of shape `(batch_size,)`):
+                The index into `scheduler.timesteps` of the current timestep of each sample.
+            sample (`torch.FloatTensor`):
+                A current instance of a sample created by the diffusion process.
+            state (`DPMSolverMultistepSchedulerState`):
+                The solver state of the batch, created with [`~DPMSolverMultistepScheduler.create_state`] and
+                returned by the previous call.
+            generator (`torch.Generator` or `List[torch.Generator]`, *optional*):
+                A random number generator.
+            return_dict (`bool`):
+                Whether or not to return a [`DPMSolverMultistepSchedulerBatchedOutput`] or `tuple`.
+
+        Returns:
+            [`DPMSolverMultistepSchedulerBatchedOutput`] or `tuple`:
+                If return_dict is `True`, [`DPMSolverMultistepSchedulerBatchedOutput`] is returned, otherwise a tuple
+                is returned where the first element is the sample tensor and the second element is the new state.
+        """
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler"
+            )
+        if self.config.solver_order == 3 and self.config.algorithm_type in ["sde-dpmsolver", "sde-dpmsolver++"]:
+            raise NotImplementedError(
+                f"`batched_step` does not support third order updates for `algorithm_type` {self.config.algorithm_type}."
+            )
+
+        num_timesteps = len(self.timesteps)
+        step_indices = step_indices.to(device=sample.device, dtype=torch.long)
+        broadcast_shape = (-1,) + (1,) * (sample.ndim - 1)
+
+        sigmas = self.sigmas.to(device=sample.device)
+
+        def alpha_sigma_lambda(offset):
+            sigma = sigmas[(step_indices + offset).clamp(0, len(sigmas) - 1)].reshape(broadcast_shape)
+            alpha, sigma = self._sigma_to_alpha_sigma_t(sigma)
+            return alpha, sigma, torch.log(alpha) - torch.log(sigma)
+
+        alpha_t, sigma_t, lambda_t = alpha_sigma_lambda(1)
+        alpha_s0, sigma_s0, lambda_s0 = alpha_sigma_lambda(0)
+
+        model_output = self._batched_convert_model_output(
+            model_output, sample, alpha_s0.to(sample.dtype), sigma_s0.to(sample.dtype)
+        )
+        model_outputs = torch.cat([state.model_outputs[:, 1:], model_output.unsqueeze(1)], dim=1)
+        lower_order_nums = state.lower_order_nums.to(sample.device)
+
+        # Improve numerical stability for small number of steps
+        lower_order_final = (step_indices == num_timesteps - 1) & (
+            self.config.euler_at_final
+            or (self.config.lower_order_final and num_timesteps < 15)
+            or self.config.final_sigmas_type == "zero"
+        )
+        lower_order_second = (step_indices == num_timesteps - 2) & self.config.lower_order_final & (num_timesteps < 15)
+        use_first_order = (self.config.solver_order == 1) | (lower_order_nums < 1) | lower_order_final
+        use_second_order = ~use_first_order & (
+            (self.config.solver_order == 2) | (lower_order_nums < 2) | lower_order_second
+        )
+
+        if self.config.algorithm_type in ["sde-dpmsolver", "sde-dpmsolver++"]:
+            noise = randn_tensor(
+                model_output.shape, generator=generator, device=model_output.device, dtype=model_output.dtype
+            )
+
+        h = lambda_t - lambda_s0
+        algorithm_type = self.config.algorithm_type
+        solver_type = self.config.solver_type
+
+        # every order is written as `sample_coeff * sample + d0_coeff * D0 + d1_coeff * D1 + d2_coeff * D2 (+ noise)`
+        if algorithm_type == "dpmsolver++":
+            sample_coeff = sigma_t / sigma_s0
+            d0_coeff = -(alpha_t * (torch.exp(-h) - 1.0))
+        elif algorithm_type == "dpmsolver":
+            sample_coeff = alpha_t / alpha_s0
+            d0_coeff = -(sigma_t * (torch.exp(h) - 1.0))
+        elif algorithm_type == "sde-dpmsolver++":
+            sample_coeff = sigma_t / sigma_s0 * torch.exp(-h)
+            d0_coeff = alpha_t * (1 - torch.exp(-2.0 * h))
+            noise_coeff = sigma_t * torch.sqrt(1.0 - torch.exp(-2 * h))
+        elif algorithm_type == "sde-dpmsolver":
+            sample_coeff = alpha_t / alpha_s0
+            d0_coeff = -2.0 * (sigma_t * (torch.exp(h) - 1.0))
+            noise_coeff = sigma_t * torch.sqrt(torch.exp(2 * h) - 1.0)
+
+        def combine(*terms):
+            prev_sample = sample_coeff.to(sample.dtype) * sample
+            for coeff, value in terms:
+                prev_sample = prev_sample + coeff.to(sample.dtype) * value
+            if algorithm_type in ["sde-dpmsolver", "sde-dpmsolver++"]:
+                prev_sample = prev_sample + noise_coeff.to(sample.dtype) * noise
+            return prev_sample
+
+        m0 = model_outputs[:, -1]
+        prev_sample = combine((d0_coeff, m0))
+
+        if self.config.solver_order >= 2:
+            _, _, lambda_s1 = alpha_sigma_lambda(-1)
+            m1 = model_outputs[:, -2]
+            h_0 = lambda_s0 - lambda_s1
+            r0 = h_0 / h
+            D1 = (1.0 / r0).to(sample.dtype) * (m0 - m1)
+
+            if algorithm_type == "dpmsolver++":
+                if solver_type == "midpoint":
+                    d1_coeff = -0.5 * (alpha_t * (torch.exp(-h) - 1.0))
+                else:
+                    d1_coeff = alpha_t * ((torch.exp(-h) - 1.0) / h + 1.0)
+            elif algorithm_type == "dpmsolver":
+                if solver_type == "midpoint":
+                    d1_coeff = -0.5 * (sigma_t * (torch.exp(h) - 1.0))
+                else:
+                    d1_coeff = -(sigma_t * ((torch.exp(h) - 1.0) / h - 1.0))
+            elif algorithm_type == "sde-dpmsolver++":
+                if solver_type == "midpoint":
+                    d1_coeff = 0.5 * (alpha_t * (1 - torch.exp(-2.0 * h)))
+                else:
+                    d1_coeff = alpha_t * ((1.0 - torch.exp(-2.0 * h)) / (-2.0 * h) + 1.0)
+            elif algorithm_type == "sde-dpmsolver":
+                if solver_type == "midpoint":
+                    d1_coeff = -(sigma_t * (torch.exp(h) - 1.0))
+                else:
+                    d1_coeff = -2.0 * (sigma_t * ((torch.exp(h) - 1.0) / h - 1.0))
+
+            second_order_sample = combine((d0_coeff, m0), (d1_coeff, D1))
+            prev_sample = torch.where(use_second_order.reshape(broadcast_shape), second_order_sample, prev_sample)
+
+        if self.config.solver_order >= 3:
+            _, _, lambda_s2 = alpha_sigma_lambda(-2)
+            m2 = model_outputs[:, -3]
+            h_1 = lambda_s1 - lambda_s2
+            r1 = h_1 / h
+            D1_0, D1_1 = D1, (1.0 / r1).to(sample.dtype) * (m1 - m2)
+            D1 = D1_0 + (r0 / (r0 + r1)).to(sample.dtype) * (D1_0 - D1_1)
+            D2 = (1.0 / (r0 + r1)).to(sample.dtype) * (D1_0 - D1_1)
+
+            if algorithm_type == "dpmsolver++":
+                d1_coeff = alpha_t * ((torch.exp(-h) - 1.0) / h + 1.0)
+                d2_coeff = -(alpha_t * ((torch.exp(-h) - 1.0 + h) / h**2 - 0.5))
+            else:
+                d1_coeff = -(sigma_t * ((torch.exp(h) - 1.0) / h - 1.0))
+                d2_coeff = -(sigma_t * ((torch.exp(h) - 1.0 - h) / h**2 - 0.5))
+
+            third_order_sample = combine((d0_coeff, m0), (d1_coeff, D1), (d2_coeff, D2))
+            use_third_order = ~use_first_order & ~use_second_order
+            prev_sample = torch.where(use_third_order.reshape(broadcast_shape), third_order_sample, prev_sample)
+
+        state = DPMSolverMultistepSchedulerState(
+            model_outputs=model_outputs,
+            lower_order_nums=(lower_order_nums + 1).clamp(max=self.config.solver_order),
+        )
+
+        if not return_dict:
+            return (prev_sample, state)
+
+        return DPMSolverMultistepSchedulerBatchedOutput(prev_sample=prev_sample, state=state)
+
     def scale_model_input(self, sample: torch.FloatTensor, *args, **kwargs) -> torch.FloatTensor:
         """
         Ensures interchangeability with schedulers that need to scale the denoising model input depending on the
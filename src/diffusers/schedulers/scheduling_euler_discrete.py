@@ -522,6 +522,128 @@ class EulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
 
         return EulerDiscreteSchedulerOutput(prev_sample=prev_sample, pred_original_sample=pred_original_sample)
 
+    def batched_scale_model_input(
+        self, sample: torch.FloatTensor, step_indices: torch.LongTensor
+    ) -> torch.FloatTensor:
+        """
+        Vectorized variant of [`~EulerDiscreteScheduler.scale_model_input`] for batches whose samples are at different
+        points of the timestep schedule. Does not read or update the scheduler's step index.
+
+        Args:
+            sample (`torch.FloatTensor`):
+                The input sample.
+            step_indices (`torch.LongTensor` of shape `(batch_size,)`):
+                The index into `scheduler.timesteps` of the current timestep of each sample.
+
+        Returns:
+            `torch.FloatTensor`:
+                A scaled input sample.
+        """
+        step_indices = step_indices.to(device=sample.device, dtype=torch.long)
+        sigma = self.sigmas.to(device=sample.device)[step_indices]
+        sigma = sigma.reshape(-1, *([1] * (sample.ndim - 1)))
+        sample = sample / ((sigma**2 + 1) ** 0.5).to(sample.dtype)
+
+        self.is_scale_input_called = True
+        return sample
+
+    def batched_step(
+        self,
+        model_output: torch.FloatTensor,
+        step_indices: torch.LongTensor,
+        sample: torch.FloatTensor,
+        s_churn: float = 0.0,
+        s_tmin: float = 0.0,
+        s_tmax: float = float("inf"),
+        s_noise: float = 1.0,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[EulerDiscreteSchedulerOutput, Tuple]:
+        """
+        Stateless, vectorized variant of [`~EulerDiscreteScheduler.step`] for batches whose samples are at different
+        points of the timestep schedule set with [`~EulerDiscreteScheduler.set_timesteps`]. The Euler method keeps no
+        history, so the per-sample `step_indices` are the only state; the scheduler's own step index is neither read
+        nor updated.
+
+        Args:
+            model_output (`torch.FloatTensor`):
+                The direct output from learned diffusion model.
+            step_indices (`torch.LongTensor` of shape `(batch_size,)`):
+                The index into `scheduler.timesteps` of the current timestep of each sample.
+            sample (`torch.FloatTensor`):
+                A current instance of a sample created by the diffusion process.
+            s_churn (`float`):
+            s_tmin  (`float`):
+            s_tmax  (`float`):
+            s_noise (`float`, defaults to 1.0):
+                Scaling factor for noise added to the sample.
+            generator (`torch.Generator` or `List[torch.Generator]`, *optional*):
+                A random number generator.
+            return_dict (`bool`):
+                Whether or not to return a [`~schedulers.scheduling_euler_discrete.EulerDiscreteSchedulerOutput`] or
+                tuple.
+
+        Returns:
+            [`~schedulers.scheduling_euler_discrete.EulerDiscreteSchedulerOutput`] or `tuple`:
+                If return_dict is `True`, [`~schedulers.scheduling_euler_discrete.EulerDiscreteSchedulerOutput`] is
+                returned, otherwise a tuple is returned where the first element is the sample tensor.
+        """
+        if self.num_inference_steps is None:
+            raise ValueError(
+                "Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler"
+            )
+
+        # Upcast to avoid precision issues when computing prev_sample
+        sample = sample.to(torch.float32)
+
+        step_indices = step_indices.to(device=sample.device, dtype=torch.long)
+        broadcast_shape = (-1,) + (1,) * (sample.ndim - 1)
+        sigmas = self.sigmas.to(device=sample.device)
+        sigma = sigmas[step_indices].reshape(broadcast_shape)
+        sigma_next = sigmas[step_indices + 1].reshape(broadcast_shape)
+
+        gamma = torch.where(
+            (s_tmin <= sigma) & (sigma <= s_tmax),
+            min(s_churn / (len(self.sigmas) - 1), 2**0.5 - 1),
+            0.0,
+        )
+
+        noise = randn_tensor(
+            model_output.shape, dtype=model_output.dtype, device=model_output.device, generator=generator
+        )
+
+        eps = noise * s_noise
+        sigma_hat = sigma * (gamma + 1)
+
+        sample = sample + eps * (sigma_hat**2 - sigma**2) ** 0.5
+
+        # 1. compute predicted original sample (x_0) from sigma-scaled predicted noise
+        if self.config.prediction_type == "original_sample" or self.config.prediction_type == "sample":
+            pred_original_sample = model_output
+        elif self.config.prediction_type == "epsilon":
+            pred_original_sample = sample - sigma_hat * model_output
+        elif self.config.prediction_type == "v_prediction":
+            pred_original_sample = model_output * (-sigma / (sigma**2 + 1) ** 0.5) + (sample / (sigma**2 + 1))
+        else:
+            raise ValueError(
+                f"prediction_type given as {self.config.prediction_type} must be one of `epsilon`, or `v_prediction`"
+            )
+
+        # 2. Convert to an ODE derivative
+        derivative = (sample - pred_original_sample) / sigma_hat
+
+        dt = sigma_next - sigma_hat
+
+        prev_sample = sample + derivative * dt
+
+        # Cast sample back to model compatible dtype
+        prev_sample = prev_sample.to(model_output.dtype)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return EulerDiscreteSchedulerOutput(prev_sample=prev_sample, pred_original_sample=pred_original_sample)
+
     def add_noise(
         self,
         original_samples: torch.FloatTensor,
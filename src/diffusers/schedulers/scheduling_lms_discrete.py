@@ -18,7 +18,6 @@ from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import torch
-from scipy import integrate
 
 from ..configuration_utils import ConfigMixin, register_to_config
 from ..utils import BaseOutput
@@ -89,6 +88,45 @@ def betas_for_alpha_bar(
     return torch.tensor(betas, dtype=torch.float32)
 
 
+def integrate_lagrange_basis(nodes: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Integrates the Lagrange basis polynomials of interpolation nodes exactly.
+
+    Args:
+        nodes (`np.ndarray` of shape `(num_problems, order)`):
+            The interpolation nodes of each problem.
+        lower (`np.ndarray` of shape `(num_problems,)`):
+            The lower bounds of the integrals.
+        upper (`np.ndarray` of shape `(num_problems,)`):
+            The upper bounds of the integrals.
+
+    Returns:
+        `np.ndarray` of shape `(num_problems, order)`: The integral of the `j`-th basis polynomial, which is 1 at the
+        `j`-th node and 0 at the others, from `lower` to `upper`.
+    """
+    num_problems, order = nodes.shape
+    integrals = np.empty((num_problems, order), dtype=np.float64)
+    for j in range(order):
+        # coefficients of prod_{k != j} (tau - x_k) / (x_j - x_k), highest degree first
+        coeffs = np.ones((num_problems, 1), dtype=np.float64)
+        for k in range(order):
+            if k == j:
+                continue
+            shifted = np.pad(coeffs, ((0, 0), (0, 1))) - nodes[:, k : k + 1] * np.pad(coeffs, ((0, 0), (1, 0)))
+            coeffs = shifted / (nodes[:, j : j + 1] - nodes[:, k : k + 1])
+
+        # antiderivative without constant term, evaluated with Horner's method
+        degree = coeffs.shape[1]
+        coeffs = coeffs / np.arange(degree, 0, -1)
+        antiderivative_upper = np.zeros(num_problems, dtype=np.float64)
+        antiderivative_lower = np.zeros(num_problems, dtype=np.float64)
+        for i in range(degree):
+            antiderivative_upper = (antiderivative_upper + coeffs[:, i]) * upper
+            antiderivative_lower = (antiderivative_lower + coeffs[:, i]) * lower
+        integrals[:, j] = antiderivative_upper - antiderivative_lower
+    return integrals
+
+
 class LMSDiscreteScheduler(SchedulerMixin, ConfigMixin):
     """
     A linear multistep scheduler for discrete beta schedules.
@@ -216,22 +254,44 @@ class LMSDiscreteScheduler(SchedulerMixin, ConfigMixin):
         Compute the linear multistep coefficient.
 
         Args:
-            order ():
-            t ():
-            current_order ():
+            order (`int`):
+                The order of the linear multistep method, at most `t + 1`.
+            t (`int`):
+                The index of the current sigma.
+            current_order (`int`):
+                The index of the derivative in the history, 0 being the derivative at the current sigma.
         """
+        return self.get_lms_coefficients(order)[t][current_order]
 
-        def lms_derivative(tau):
-            prod = 1.0
-            for k in range(order):
-                if current_order == k:
-                    continue
-                prod *= (tau - self.sigmas[t - k]) / (self.sigmas[t - current_order] - self.sigmas[t - k])
-            return prod
+    def get_lms_coefficients(self, order: int) -> List[List[float]]:
+        """
+        Returns the linear multistep coefficients of every step for a method of order `order`.
 
-        integrated_coeff = integrate.quad(lms_derivative, self.sigmas[t], self.sigmas[t + 1], epsrel=1e-4)[0]
+        The integrand of the coefficients is a polynomial in sigma, so they are integrated exactly. The table is
+        computed once per order for the sigmas set by [`~LMSDiscreteScheduler.set_timesteps`]; the first steps, which
+        lack a long enough history, use the highest available order.
 
-        return integrated_coeff
+        Args:
+            order (`int`):
+                The order of the linear multistep method.
+
+        Returns:
+            `List[List[float]]`:
+                The coefficients of the derivatives of step `t`, most recent first.
+        """
+        if order not in self._lms_coefficients:
+            sigmas = self.sigmas.numpy().astype(np.float64)
+            num_steps = len(sigmas) - 1
+            table = []
+            for t in range(min(order - 1, num_steps)):
+                nodes = sigmas[t - np.arange(t + 1)][None]
+                table.append(integrate_lagrange_basis(nodes, sigmas[t : t + 1], sigmas[t + 1 : t + 2])[0].tolist())
+            if num_steps >= order:
+                t = np.arange(order - 1, num_steps)
+                nodes = sigmas[t[:, None] - np.arange(order)]
+                table.extend(integrate_lagrange_basis(nodes, sigmas[t], sigmas[t + 1]).tolist())
+            self._lms_coefficients[order] = table
+        return self._lms_coefficients[order]
 
     def set_timesteps(self, num_inference_steps: int, device: Union[str, torch.device] = None):
         """
@@ -283,6 +343,8 @@ class LMSDiscreteScheduler(SchedulerMixin, ConfigMixin):
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
         self.derivatives = []
+        self._lms_coefficients = {}
+        self.get_lms_coefficients(4)
 
     # Copied from diffusers.schedulers.scheduling_euler_discrete.EulerDiscreteScheduler._init_step_index
     def _init_step_index(self, timestep):
@@ -401,13 +463,12 @@ class LMSDiscreteScheduler(SchedulerMixin, ConfigMixin):
             self.derivatives.pop(0)
 
         # 3. Compute linear multistep coefficients
-        order = min(self.step_index + 1, order)
-        lms_coeffs = [self.get_lms_coefficient(order, self.step_index, curr_order) for curr_order in range(order)]
+        lms_coeffs = self.get_lms_coefficients(order)[self.step_index]
 
         # 4. Compute previous sample based on the derivatives path
-        prev_sample = sample + sum(
-            coeff * derivative for coeff, derivative in zip(lms_coeffs, reversed(self.derivatives))
-        )
+        prev_sample = sample.clone()
+        for coeff, derivative in zip(lms_coeffs, reversed(self.derivatives)):
+            prev_sample.add_(derivative, alpha=coeff)
 
         # upon completion increase step index by one
         self._step_index += 1
@@ -16,7 +16,8 @@
 # The codebase is modified based on https://github.com/huggingface/diffusers/blob/main/src/diffusers/schedulers/scheduling_dpmsolver_multistep.py
 
 import math
-from typing import Callable, List, Optional, Tuple, Union
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -72,6 +73,61 @@ def betas_for_alpha_bar(
     return torch.tensor(betas, dtype=torch.float32)
 
 
+# Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.linear_update_coefficients
+def linear_update_coefficients(
+    update_fn: Callable[..., torch.FloatTensor],
+    num_inputs: int,
+    num_steps: int = 1,
+    dtype: torch.dtype = torch.float32,
+) -> List[List[float]]:
+    """
+    Extracts the coefficients of a scheduler update that is linear in its `num_inputs` tensor arguments by applying it
+    once to the standard basis. The `k`-th argument is a `(num_inputs, num_steps)` tensor whose `k`-th row is one and
+    the others zero, so that an update whose scalars are `(num_steps,)` tensors is evaluated for all steps at once.
+
+    Args:
+        update_fn (`Callable`):
+            The update, called with `num_inputs` positional tensors.
+        num_inputs (`int`):
+            The number of tensor arguments of `update_fn`.
+        num_steps (`int`, defaults to 1):
+            The number of steps `update_fn` is vectorized over.
+        dtype (`torch.dtype`, defaults to `torch.float32`):
+            The dtype in which the update is evaluated.
+
+    Returns:
+        `List[List[float]]`: for every step, the coefficient of every argument, such that `update_fn(*inputs)` equals
+        `combine_linearly(coefficients, inputs)`.
+    """
+    basis = torch.eye(num_inputs, dtype=dtype).unsqueeze(-1).expand(num_inputs, num_inputs, num_steps)
+    return update_fn(*basis).T.tolist()
+
+
+# Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.combine_linearly
+def combine_linearly(coefficients: List[float], tensors: List[torch.FloatTensor]) -> torch.FloatTensor:
+    """
+    Computes `sum(coefficient * tensor)` with a single output allocation, skipping the terms whose coefficient is zero.
+
+    Args:
+        coefficients (`List[float]`):
+            The coefficient of every tensor.
+        tensors (`List[torch.FloatTensor]`):
+            The tensors to combine, the first one sets the device of the result.
+
+    Returns:
+        `torch.FloatTensor`: the linear combination, in the promoted dtype of `tensors`.
+    """
+    dtype = tensors[0].dtype
+    for tensor in tensors[1:]:
+        dtype = torch.promote_types(dtype, tensor.dtype)
+
+    result = tensors[0].to(dtype) * coefficients[0]
+    for coefficient, tensor in zip(coefficients[1:], tensors[1:]):
+        if coefficient != 0.0:
+            result.add_(tensor, alpha=coefficient)
+    return result
+
+
 class SASolverScheduler(SchedulerMixin, ConfigMixin):
     """
     `SASolverScheduler` is a fast dedicated high-order solver for diffusion SDEs.
@@ -212,6 +268,8 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
         self.lower_order_nums = 0
         self.last_sample = None
         self._step_index = None
+        self._predictor_coefficients = None
+        self._corrector_coefficients = None
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     @property
@@ -275,6 +333,9 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
         self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
 
         self.num_inference_steps = len(timesteps)
+        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
+        self._predictor_coefficients, self._corrector_coefficients = self._build_solver_coefficients()
+
         self.model_outputs = [
             None,
         ] * max(self.config.predictor_order, self.config.corrector_order - 1)
@@ -283,7 +344,6 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
 
         # add an index counter for schedulers that allow duplicated timesteps
         self._step_index = None
-        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     # Copied from diffusers.schedulers.scheduling_ddpm.DDPMScheduler._threshold_sample
     def _threshold_sample(self, sample: torch.FloatTensor) -> torch.FloatTensor:
@@ -925,6 +985,73 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
         x_t = x_t.to(x.dtype)
         return x_t
 
+    def _build_solver_coefficients(
+        self,
+    ) -> Tuple[Dict[int, List[Optional[List[float]]]], Dict[int, List[Optional[List[float]]]]]:
+        """
+        Tabulates, for every order and step of the schedule, the coefficients of the SA-Predictor as a linear
+        combination of the sample, the model output history (newest first) and the noise, and those of the
+        SA-Corrector as a linear combination of the last sample, the current model output, the model output history
+        and the last noise. `tau_func` is evaluated once per step on `timesteps`, so that [`~SASolverScheduler.step`]
+        no longer recomputes the coefficients with scalar tensor ops.
+        """
+        num_steps = len(self.timesteps)
+        taus = torch.tensor([self.tau_func(t) for t in self.timesteps.tolist()], dtype=self.sigmas.dtype)
+        model_outputs = self.model_outputs
+
+        def predictor_update(order, tau, sample, *inputs):
+            self.model_outputs = list(inputs[:order][::-1])
+            return self.stochastic_adams_bashforth_update(
+                model_output=inputs[0], sample=sample, noise=inputs[order], order=order, tau=tau
+            )
+
+        def corrector_update(order, tau, last_sample, this_model_output, *inputs):
+            self.model_outputs = list(inputs[: order - 1][::-1])
+            return self.stochastic_adams_moulton_update(
+                this_model_output=this_model_output,
+                last_sample=last_sample,
+                last_noise=inputs[order - 1],
+                this_sample=last_sample,
+                order=order,
+                tau=tau,
+            )
+
+        # the updates only use the step index to look up sigmas, so all steps are evaluated at once
+        predictor_coefficients = {}
+        for order in range(1, self.config.predictor_order + 1):
+            predictor_coefficients[order] = [None] * num_steps
+            # a predictor of order `order` needs `order - 1` previous steps
+            if num_steps < order:
+                continue
+            self._step_index = torch.arange(order - 1, num_steps)
+            predictor_coefficients[order][order - 1 :] = linear_update_coefficients(
+                partial(predictor_update, order, taus[self._step_index]),
+                order + 2,
+                num_steps - order + 1,
+                dtype=self.sigmas.dtype,
+            )
+
+        corrector_coefficients = {}
+        for order in range(1, self.config.corrector_order + 1):
+            corrector_coefficients[order] = [None] * num_steps
+            # the corrector runs from the second step on, with `order - 2` previous steps besides the last one
+            first_step = max(order - 1, 1)
+            if num_steps <= first_step:
+                continue
+            # the corrector of a step uses the `tau` of the previous step
+            self._step_index = torch.arange(first_step, num_steps)
+            corrector_coefficients[order][first_step:] = linear_update_coefficients(
+                partial(corrector_update, order, taus[self._step_index - 1]),
+                order + 2,
+                num_steps - first_step,
+                dtype=self.sigmas.dtype,
+            )
+
+        self._step_index = None
+        self.model_outputs = model_outputs
+
+        return predictor_coefficients, corrector_coefficients
+
     def _init_step_index(self, timestep):
         if isinstance(timestep, torch.Tensor):
             timestep = timestep.to(self.timesteps.device)
@@ -987,15 +1114,24 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
         model_output_convert = self.convert_model_output(model_output, sample=sample)
 
         if use_corrector:
-            current_tau = self.tau_func(self.timestep_list[-1])
-            sample = self.stochastic_adams_moulton_update(
-                this_model_output=model_output_convert,
-                last_sample=self.last_sample,
-                last_noise=self.last_noise,
-                this_sample=sample,
-                order=self.this_corrector_order,
-                tau=current_tau,
-            )
+            order = self.this_corrector_order
+            coefficients = None
+            if self._corrector_coefficients is not None and self.step_index < len(self._corrector_coefficients[order]):
+                coefficients = self._corrector_coefficients[order][self.step_index]
+
+            if coefficients is not None:
+                inputs = [self.last_sample, model_output_convert] + self.model_outputs[::-1][: order - 1]
+                sample = combine_linearly(coefficients, inputs + [self.last_noise]).to(self.last_sample.dtype)
+            else:
+                current_tau = self.tau_func(self.timestep_list[-1])
+                sample = self.stochastic_adams_moulton_update(
+                    this_model_output=model_output_convert,
+                    last_sample=self.last_sample,
+                    last_noise=self.last_noise,
+                    this_sample=sample,
+                    order=order,
+                    tau=current_tau,
+                )
 
         for i in range(max(self.config.predictor_order, self.config.corrector_order - 1) - 1):
             self.model_outputs[i] = self.model_outputs[i + 1]
@@ -1026,14 +1162,23 @@ class SASolverScheduler(SchedulerMixin, ConfigMixin):
         self.last_sample = sample
         self.last_noise = noise
 
-        current_tau = self.tau_func(self.timestep_list[-1])
-        prev_sample = self.stochastic_adams_bashforth_update(
-            model_output=model_output_convert,
-            sample=sample,
-            noise=noise,
-            order=self.this_predictor_order,
-            tau=current_tau,
-        )
+        order = self.this_predictor_order
+        coefficients = None
+        if self._predictor_coefficients is not None and self.step_index < len(self._predictor_coefficients[order]):
+            coefficients = self._predictor_coefficients[order][self.step_index]
+
+        if coefficients is not None:
+            inputs = [sample] + self.model_outputs[::-1][:order] + [noise]
+            prev_sample = combine_linearly(coefficients, inputs).to(sample.dtype)
+        else:
+            current_tau = self.tau_func(self.timestep_list[-1])
+            prev_sample = self.stochastic_adams_bashforth_update(
+                model_output=model_output_convert,
+                sample=sample,
+                noise=noise,
+                order=order,
+                tau=current_tau,
+            )
 
         if self.lower_order_nums < max(self.config.predictor_order, self.config.corrector_order - 1):
             self.lower_order_nums += 1
@@ -16,7 +16,7 @@
 # The codebase is modified based on https://github.com/huggingface/diffusers/blob/main/src/diffusers/schedulers/scheduling_dpmsolver_multistep.py
 
 import math
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -71,6 +71,31 @@ def betas_for_alpha_bar(
     return torch.tensor(betas, dtype=torch.float32)
 
 
+# Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.combine_linearly
+def combine_linearly(coefficients: List[float], tensors: List[torch.FloatTensor]) -> torch.FloatTensor:
+    """
+    Computes `sum(coefficient * tensor)` with a single output allocation, skipping the terms whose coefficient is zero.
+
+    Args:
+        coefficients (`List[float]`):
+            The coefficient of every tensor.
+        tensors (`List[torch.FloatTensor]`):
+            The tensors to combine, the first one sets the device of the result.
+
+    Returns:
+        `torch.FloatTensor`: the linear combination, in the promoted dtype of `tensors`.
+    """
+    dtype = tensors[0].dtype
+    for tensor in tensors[1:]:
+        dtype = torch.promote_types(dtype, tensor.dtype)
+
+    result = tensors[0].to(dtype) * coefficients[0]
+    for coefficient, tensor in zip(coefficients[1:], tensors[1:]):
+        if coefficient != 0.0:
+            result.add_(tensor, alpha=coefficient)
+    return result
+
+
 class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
     """
     `UniPCMultistepScheduler` is a training-free framework designed for the fast sampling of diffusion models.
@@ -198,6 +223,8 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.solver_p = solver_p
         self.last_sample = None
         self._step_index = None
+        self._predictor_coefficients = None
+        self._corrector_coefficients = None
         self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     @property
@@ -258,6 +285,8 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         self.timesteps = torch.from_numpy(timesteps).to(device=device, dtype=torch.int64)
 
         self.num_inference_steps = len(timesteps)
+        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
+        self._predictor_coefficients, self._corrector_coefficients = self._build_solver_coefficients()
 
         self.model_outputs = [
             None,
@@ -269,7 +298,6 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
 
         # add an index counter for schedulers that allow duplicated timesteps
         self._step_index = None
-        self.sigmas = self.sigmas.to("cpu")  # to avoid too much CPU/GPU communication
 
     # Copied from diffusers.schedulers.scheduling_ddpm.DDPMScheduler._threshold_sample
     def _threshold_sample(self, sample: torch.FloatTensor) -> torch.FloatTensor:
@@ -698,6 +726,97 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         x_t = x_t.to(x.dtype)
         return x_t
 
+    def _build_solver_coefficients(
+        self,
+    ) -> Tuple[Dict[int, List[Optional[List[float]]]], Dict[int, List[Optional[List[float]]]]]:
+        """
+        Tabulates, for every order and step of the schedule, the coefficients of UniP as a linear combination of the
+        sample and the model output history (newest first), and those of UniC as a linear combination of the last
+        sample, the current model output and the model output history. These are the coefficients of
+        [`~UniPCMultistepScheduler.multistep_uni_p_bh_update`] and
+        [`~UniPCMultistepScheduler.multistep_uni_c_bh_update`], computed for all steps at once so that
+        [`~UniPCMultistepScheduler.step`] no longer recomputes them with scalar tensor ops and linear solves.
+        """
+        num_steps = len(self.timesteps)
+
+        def lambda_of(step_indices):
+            alpha, sigma = self._sigma_to_alpha_sigma_t(self.sigmas[step_indices])
+            return alpha, sigma, torch.log(alpha) - torch.log(sigma)
+
+        def bh_coefficients(t, s0, previous, corrector):
+            # `t` and `s0` are the step indices of the target and the current sigmas of every step, and `previous`
+            # those of the sigmas of the older model outputs, newest first
+            alpha_t, sigma_t, lambda_t = lambda_of(t)
+            alpha_s0, sigma_s0, lambda_s0 = lambda_of(s0)
+            h = lambda_t - lambda_s0
+            rks = [(lambda_of(si)[2] - lambda_s0) / h for si in previous]
+
+            hh = -h if self.predict_x0 else h
+            h_phi_1 = torch.expm1(hh)  # h\phi_1(h) = e^h - 1
+            h_phi_k = h_phi_1 / hh - 1
+            factorial_i = 1
+            B_h = hh if self.config.solver_type == "bh1" else torch.expm1(hh)
+
+            order = len(previous) + 1
+            R_rks = torch.stack(rks + [torch.ones_like(h)], dim=-1)
+            R = []
+            b = []
+            for i in range(1, order + 1):
+                R.append(torch.pow(R_rks, i - 1))
+                b.append(h_phi_k * factorial_i / B_h)
+                factorial_i *= i + 1
+                h_phi_k = h_phi_k / hh - 1 / factorial_i
+            R = torch.stack(R, dim=-2)
+            b = torch.stack(b, dim=-1)
+
+            if corrector:
+                rhos = torch.full_like(b, 0.5) if order == 1 else torch.linalg.solve(R, b)
+            elif order == 2:
+                rhos = torch.full_like(b[..., :1], 0.5)
+            elif order > 2:
+                rhos = torch.linalg.solve(R[..., :-1, :-1], b[..., :-1])
+
+            if self.predict_x0:
+                x_coeff, m_coeff = sigma_t / sigma_s0, alpha_t
+            else:
+                x_coeff, m_coeff = alpha_t / alpha_s0, sigma_t
+
+            # every `D1 = (mi - m0) / rk` contributes `rho / rk` to `mi` and `-rho / rk` to `m0`
+            d1_coeffs = [-m_coeff * B_h * rhos[..., k] / rk for k, rk in enumerate(rks)]
+            if corrector:
+                d1_coeffs.insert(0, -m_coeff * B_h * rhos[..., -1])
+            m0_coeff = -m_coeff * h_phi_1 - sum(d1_coeffs)
+
+            if corrector:
+                coefficients = [x_coeff, d1_coeffs[0], m0_coeff] + d1_coeffs[1:]
+            else:
+                coefficients = [x_coeff, m0_coeff] + d1_coeffs
+            return torch.stack(coefficients, dim=-1).tolist()
+
+        predictor_coefficients = {}
+        corrector_coefficients = {}
+        for order in range(1, self.config.solver_order + 1):
+            predictor_coefficients[order] = [None] * num_steps
+            corrector_coefficients[order] = [None] * num_steps
+
+            # UniP of order `order` needs `order - 1` previous steps, `self.solver_p` is not tabulated
+            if num_steps > order - 1 and not self.solver_p:
+                step_indices = torch.arange(order - 1, num_steps)
+                previous = [step_indices - i for i in range(1, order)]
+                predictor_coefficients[order][order - 1 :] = bh_coefficients(
+                    step_indices + 1, step_indices, previous, corrector=False
+                )
+
+            # UniC of order `order` corrects the previous UniP step, with `order - 1` older model outputs
+            if num_steps > order:
+                step_indices = torch.arange(order, num_steps)
+                previous = [step_indices - (i + 1) for i in range(1, order)]
+                corrector_coefficients[order][order:] = bh_coefficients(
+                    step_indices, step_indices - 1, previous, corrector=True
+                )
+
+        return predictor_coefficients, corrector_coefficients
+
     def _init_step_index(self, timestep):
         if isinstance(timestep, torch.Tensor):
             timestep = timestep.to(self.timesteps.device)
@@ -758,12 +877,21 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
 
         model_output_convert = self.convert_model_output(model_output, sample=sample)
         if use_corrector:
-            sample = self.multistep_uni_c_bh_update(
-                this_model_output=model_output_convert,
-                last_sample=self.last_sample,
-                this_sample=sample,
-                order=self.this_order,
-            )
+            order = self.this_order
+            coefficients = None
+            if self._corrector_coefficients is not None and self.step_index < len(self._corrector_coefficients[order]):
+                coefficients = self._corrector_coefficients[order][self.step_index]
+
+            if coefficients is not None:
+                inputs = [self.last_sample, model_output_convert] + self.model_outputs[::-1][:order]
+                sample = combine_linearly(coefficients, inputs).to(self.last_sample.dtype)
+            else:
+                sample = self.multistep_uni_c_bh_update(
+                    this_model_output=model_output_convert,
+                    last_sample=self.last_sample,
+                    this_sample=sample,
+                    order=order,
+                )
 
         for i in range(self.config.solver_order - 1):
             self.model_outputs[i] = self.model_outputs[i + 1]
@@ -781,11 +909,20 @@ class UniPCMultistepScheduler(SchedulerMixin, ConfigMixin):
         assert self.this_order > 0
 
         self.last_sample = sample
-        prev_sample = self.multistep_uni_p_bh_update(
-            model_output=model_output,  # pass the original non-converted model output, in case solver-p is used
-            sample=sample,
-            order=self.this_order,
-        )
+        order = self.this_order
+        coefficients = None
+        if self._predictor_coefficients is not None and self.step_index < len(self._predictor_coefficients[order]):
+            coefficients = self._predictor_coefficients[order][self.step_index]
+
+        if coefficients is not None:
+            inputs = [sample] + self.model_outputs[::-1][:order]
+            prev_sample = combine_linearly(coefficients, inputs).to(sample.dtype)
+        else:
+            prev_sample = self.multistep_uni_p_bh_update(
+                model_output=model_output,  # pass the original non-converted model output, in case solver-p is used
+                sample=sample,
+                order=order,
+            )
 
         if self.lower_order_nums < self.config.solver_order:
             self.lower_order_nums += 1
@@ -1,7 +1,12 @@
+import bisect
 import contextlib
 import copy
+import json
+import os
 import random
-from typing import Any, Dict, Iterable, List, Optional, Union
+import shutil
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
 
 import numpy as np
 import torch
@@ -14,6 +19,7 @@ from .utils import (
     deprecate,
     is_peft_available,
     is_transformers_available,
+    logging,
 )
 
 
@@ -24,6 +30,9 @@ if is_peft_available():
     from peft import set_peft_model_state_dict
 
 
+logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
 def set_seed(seed: int):
     """
     Args:
@@ -150,6 +159,216 @@ def _set_state_dict_into_text_encoder(
     set_peft_model_state_dict(text_encoder, text_encoder_state_dict, adapter_name="default")
 
 
+def _numpy_dtype(dtype: torch.dtype) -> np.dtype:
+    # NumPy has no bfloat16, its bits are stored as int16 and reinterpreted when read
+    if dtype == torch.bfloat16:
+        return np.dtype(np.int16)
+    return torch.empty(0, dtype=dtype).numpy().dtype
+
+
+class EncodedDatasetCache(torch.utils.data.Dataset):
+    """
+    Random-access view of a dataset encoded once with [`build_encoded_dataset_cache`], e.g. VAE moments and text
+    embeddings, so that training does not need to run the encoders at every step.
+
+    Every field of every shard is a flat binary file that is memory-mapped on first access, so the samples returned by
+    `__getitem__` are tensors sharing memory with the page cache and the cache can be much larger than the RAM. The
+    memory maps are opened lazily in every process, which makes the cache safe to use with `DataLoader` workers.
+
+    Args:
+        cache_dir (`str` or `os.PathLike`):
+            The directory written by [`build_encoded_dataset_cache`].
+    """
+
+    metadata_name = "metadata.json"
+
+    def __init__(self, cache_dir: Union[str, os.PathLike]):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, self.metadata_name)) as f:
+            self.metadata = json.load(f)
+
+        self._offsets = [0]
+        for num_samples in self.metadata["shards"]:
+            self._offsets.append(self._offsets[-1] + num_samples)
+        self._arrays = {}
+
+    @classmethod
+    def exists(cls, cache_dir: Union[str, os.PathLike]) -> bool:
+        """Whether `cache_dir` contains a complete cache, the metadata is only written once all shards are."""
+        return os.path.isfile(os.path.join(cache_dir, cls.metadata_name))
+
+    @property
+    def fields(self) -> Dict[str, Dict[str, Any]]:
+        """The `dtype` and per-sample `shape` of every field."""
+        return self.metadata["fields"]
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def __getstate__(self):
+        # memory maps are reopened by every process instead of being pickled with their content
+        state = self.__dict__.copy()
+        state["_arrays"] = {}
+        return state
+
+    def _array(self, name: str, shard: int) -> np.ndarray:
+        key = (name, shard)
+        if key not in self._arrays:
+            field = self.fields[name]
+            dtype = _numpy_dtype(getattr(torch, field["dtype"]))
+            # copy-on-write, so that tensors can be created without copying and writing to them never alters the cache
+            self._arrays[key] = np.memmap(
+                os.path.join(self.cache_dir, f"{name}-{shard:05d}.bin"),
+                dtype=dtype,
+                mode="c",
+                shape=(self.metadata["shards"][shard], *field["shape"]),
+            )
+        return self._arrays[key]
+
+    def __getitem__(self, index: int) -> Dict[str, torch.Tensor]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} is out of range for a cache of {len(self)} samples.")
+
+        shard = bisect.bisect_right(self._offsets, index) - 1
+        index = index - self._offsets[shard]
+
+        sample = {}
+        for name, field in self.fields.items():
+            tensor = torch.from_numpy(self._array(name, shard)[index])
+            if field["dtype"] == "bfloat16":
+                tensor = tensor.view(torch.bfloat16)
+            sample[name] = tensor
+        return sample
+
+
+def build_encoded_dataset_cache(
+    cache_dir: Union[str, os.PathLike],
+    batches: Iterable[Any],
+    encode_fn: Callable[[Any], Dict[str, torch.Tensor]],
+    shard_size: int = 10000,
+    overwrite: bool = False,
+    fingerprint: Optional[str] = None,
+) -> EncodedDatasetCache:
+    """
+    Encodes a dataset once and writes the result to `cache_dir` as sharded, memory-mappable files, to be read back
+    with [`EncodedDatasetCache`].
+
+    The cache is typically built from the VAE moments, which can be sampled from at every step with
+    [`~models.autoencoders.vae.DiagonalGaussianDistribution`], and the text embeddings of every sample:
+
+    ```py
+    def encode_fn(batch):
+        with torch.no_grad():
+            pixel_values = batch["pixel_values"].to(vae.device, dtype=vae.dtype)
+            input_ids = batch["input_ids"].to(text_encoder.device)
+            return {
+                "latent_moments": vae.encode(pixel_values).latent_dist.parameters,
+                "prompt_embeds": text_encoder(input_ids)[0],
+            }
+
+
+    train_dataset = build_encoded_dataset_cache("cache", dataloader, encode_fn)
+    ```
+
+    Args:
+        cache_dir (`str` or `os.PathLike`):
+            The directory to write the cache to.
+        batches (`Iterable`):
+            The batches to encode, e.g. a `DataLoader` without shuffling.
+        encode_fn (`Callable`):
+            Takes a batch and returns a dictionary of tensors whose first dimension is the batch size. Every sample
+            needs to have the same shape, which is the case for images cropped to a fixed resolution and text padded
+            to a fixed length.
+        shard_size (`int`, *optional*, defaults to 10000):
+            The number of samples per shard.
+        overwrite (`bool`, *optional*, defaults to `False`):
+            Whether to rebuild the cache if `cache_dir` already contains one. If `False`, the existing cache is
+            returned without encoding anything, unless its fingerprint doesn't match `fingerprint`.
+        fingerprint (`str`, *optional*):
+            Identifies everything the encoded samples depend on, e.g. a hash of the models, their revisions, the
+            dataset and the preprocessing arguments. It is stored with the cache, and an existing cache built with a
+            different fingerprint is rebuilt. If `None`, an existing cache is always reused.
+
+    Returns:
+        [`EncodedDatasetCache`]: The cache that was built.
+    """
+    if EncodedDatasetCache.exists(cache_dir):
+        cache = EncodedDatasetCache(cache_dir)
+        if fingerprint is not None and cache.metadata.get("fingerprint") != fingerprint:
+            logger.warning(
+                f"The encoded dataset cache in {cache_dir} was built with different arguments (fingerprint"
+                f" {cache.metadata.get('fingerprint')} instead of {fingerprint}), it is rebuilt."
+            )
+            overwrite = True
+        if not overwrite:
+            logger.info(f"Loading the encoded dataset cache from {cache_dir}.")
+            return cache
+        shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    fields = None
+    shards = []
+    files = {}
+
+    def close_shard():
+        for f in files.values():
+            f.close()
+        files.clear()
+
+    try:
+        for batch in batches:
+            encoded = encode_fn(batch)
+            if fields is None:
+                fields = {
+                    name: {"dtype": str(tensor.dtype).replace("torch.", ""), "shape": list(tensor.shape[1:])}
+                    for name, tensor in encoded.items()
+                }
+            elif encoded.keys() != fields.keys():
+                raise ValueError(f"`encode_fn` has to always return the fields {list(fields)}, got {list(encoded)}.")
+
+            batch_size = len(next(iter(encoded.values())))
+            for name, tensor in encoded.items():
+                field = fields[name]
+                if list(tensor.shape[1:]) != field["shape"] or tensor.dtype != getattr(torch, field["dtype"]):
+                    raise ValueError(
+                        f"All samples of `{name}` need the same shape and dtype, expected {field} but got"
+                        f" {list(tensor.shape[1:])} and {tensor.dtype}."
+                    )
+                if len(tensor) != batch_size:
+                    raise ValueError(f"All fields need the same batch size, `{name}` has {len(tensor)}.")
+
+            start = 0
+            while start < batch_size:
+                if not shards or shards[-1] == shard_size:
+                    close_shard()
+                    shards.append(0)
+                    for name in fields:
+                        files[name] = open(os.path.join(cache_dir, f"{name}-{len(shards) - 1:05d}.bin"), "wb")
+
+                end = min(batch_size, start + shard_size - shards[-1])
+                for name, tensor in encoded.items():
+                    tensor = tensor[start:end].detach().cpu().contiguous()
+                    if tensor.dtype == torch.bfloat16:
+                        tensor = tensor.view(torch.int16)
+                    files[name].write(tensor.numpy().tobytes())
+                shards[-1] += end - start
+                start = end
+    finally:
+        close_shard()
+
+    if fields is None:
+        raise ValueError("`batches` is empty, there is nothing to encode.")
+
+    # the metadata is written last so that an interrupted build is never mistaken for a complete cache
+    with open(os.path.join(cache_dir, EncodedDatasetCache.metadata_name), "w") as f:
+        metadata = {"num_samples": sum(shards), "shards": shards, "fields": fields, "fingerprint": fingerprint}
+        json.dump(metadata, f, indent=2)
+
+    return EncodedDatasetCache(cache_dir)
+
+
 # Adapted from torch-ema https://github.com/fadel/pytorch_ema/blob/master/torch_ema/ema.py#L14
 class EMAModel:
     """
@@ -167,6 +386,9 @@ class EMAModel:
         power: Union[float, int] = 2 / 3,
         model_cls: Optional[Any] = None,
         model_config: Dict[str, Any] = None,
+        foreach: bool = False,
+        update_every: int = 1,
+        async_update: bool = False,
         **kwargs,
     ):
         """
@@ -179,6 +401,13 @@ class EMAModel:
             inv_gamma (float):
                 Inverse multiplicative factor of EMA warmup. Default: 1. Only used if `use_ema_warmup` is True.
             power (float): Exponential factor of EMA warmup. Default: 2/3. Only used if `use_ema_warmup` is True.
+            foreach (bool): Whether to update all the shadow params at once with multi-tensor `torch._foreach_lerp_`
+                instead of one temporary tensor per parameter.
+            update_every (int): Only update the EMA weights every `update_every` steps, with the decay of the skipped
+                steps compounded. Default: 1.
+            async_update (bool): Whether to update the EMA weights on a side CUDA stream, overlapping with the next
+                forward and backward passes. The next optimizer step waits for the update to have read the parameters.
+                Implies `foreach`.
             device (Optional[Union[str, torch.device]]): The device to store the EMA weights on. If None, the EMA
                         weights will be stored on CPU.
 
@@ -237,6 +466,14 @@ class EMAModel:
         self.model_cls = model_cls
         self.model_config = model_config
 
+        self.foreach = foreach or async_update
+        self.update_every = update_every
+        self.async_update = async_update
+        self._staging_params = None
+        self._streams = {}
+        self._pending_update = None
+        self._optimizer_step_hook = None
+
     @classmethod
     def from_pretrained(cls, path, model_cls) -> "EMAModel":
         _, ema_kwargs = model_cls.load_config(path, return_unused_kwargs=True)
@@ -248,6 +485,7 @@ class EMAModel:
         return ema_model
 
     def save_pretrained(self, path):
+        self._wait_for_update()
         if self.model_cls is None:
             raise ValueError("`save_pretrained` can only be used if `model_cls` was defined at __init__.")
 
@@ -299,15 +537,23 @@ class EMAModel:
         parameters = list(parameters)
 
         self.optimization_step += 1
+        if self.optimization_step % self.update_every != 0:
+            return
 
         # Compute the decay factor for the exponential moving average.
         decay = self.get_decay(self.optimization_step)
+        # compound the decay of the skipped steps, which is exact as long as the parameters did not change
+        for optimization_step in range(self.optimization_step - self.update_every + 1, self.optimization_step):
+            decay *= self.get_decay(optimization_step)
         self.cur_decay_value = decay
         one_minus_decay = 1 - decay
 
         context_manager = contextlib.nullcontext
         if is_transformers_available() and transformers.deepspeed.is_deepspeed_zero3_enabled():
             import deepspeed
+        elif self.foreach or any(s.device != p.device for s, p in zip(self.shadow_params, parameters)):
+            self._foreach_step(parameters, one_minus_decay)
+            return
 
         for s_param, param in zip(self.shadow_params, parameters):
             if is_transformers_available() and transformers.deepspeed.is_deepspeed_zero3_enabled():
@@ -319,6 +565,86 @@ class EMAModel:
                 else:
                     s_param.copy_(param)
 
+    def _foreach_step(self, parameters: List[torch.nn.Parameter], one_minus_decay: float):
+        self._wait_for_update()
+
+        cuda_device = next((p.device for p in parameters if p.device.type == "cuda"), None)
+        stream = None
+        if self.async_update and cuda_device is not None:
+            if cuda_device not in self._streams:
+                self._streams[cuda_device] = torch.cuda.Stream(cuda_device)
+            stream = self._streams[cuda_device]
+            stream.wait_stream(torch.cuda.current_stream(cuda_device))
+
+        if self._staging_params is None:
+            # parameters on another device or with another dtype than their shadow param are copied into a
+            # persistent buffer first, pinned when the shadow params live on the host
+            self._staging_params = [
+                None
+                if s_param.device == param.device and s_param.dtype == param.dtype
+                else torch.empty_like(s_param, pin_memory=s_param.device.type == "cpu" and param.device.type == "cuda")
+                for s_param, param in zip(self.shadow_params, parameters)
+            ]
+
+        s_params, staged_params = [], []
+        with torch.cuda.stream(stream) if stream is not None else contextlib.nullcontext():
+            for s_param, param, staging_param in zip(self.shadow_params, parameters, self._staging_params):
+                if not param.requires_grad:
+                    s_param.copy_(param, non_blocking=True)
+                    continue
+                if staging_param is not None:
+                    param = staging_param.copy_(param, non_blocking=True)
+                s_params.append(s_param)
+                staged_params.append(param)
+
+            on_host = len(s_params) > 0 and s_params[0].device.type == "cpu"
+            if not on_host:
+                torch._foreach_lerp_(s_params, staged_params, one_minus_decay)
+
+            if cuda_device is None:
+                update_done = None
+            else:
+                update_done = torch.cuda.Event()
+                update_done.record()
+
+        def finish_update():
+            if update_done is not None:
+                update_done.synchronize()
+            if on_host:
+                torch._foreach_lerp_(s_params, staged_params, one_minus_decay)
+
+        if stream is None:
+            if on_host:
+                finish_update()
+            return
+
+        # the parameters must not be modified by the next optimizer step before they have been read
+        self._pending_update = (cuda_device, update_done, finish_update)
+        if self._optimizer_step_hook is None:
+            from torch.optim.optimizer import register_optimizer_step_pre_hook
+
+            self_ref = weakref.ref(self)
+
+            def optimizer_step_pre_hook(optimizer, args, kwargs):
+                ema = self_ref()
+                if ema is not None and ema._pending_update is not None:
+                    device, event, _ = ema._pending_update
+                    torch.cuda.current_stream(device).wait_event(event)
+
+            self._optimizer_step_hook = register_optimizer_step_pre_hook(optimizer_step_pre_hook)
+
+    def _wait_for_update(self):
+        # waits for an asynchronous update to be complete, and finishes it on the host if the shadow params live there
+        if self._pending_update is None:
+            return
+        _, _, finish_update = self._pending_update
+        self._pending_update = None
+        finish_update()
+
+    def __del__(self):
+        if getattr(self, "_optimizer_step_hook", None) is not None:
+            self._optimizer_step_hook.remove()
+
     def copy_to(self, parameters: Iterable[torch.nn.Parameter]) -> None:
         """
         Copy current averaged parameters into given collection of parameters.
@@ -328,6 +654,7 @@ class EMAModel:
                 updated with the stored moving averages. If `None`, the parameters with which this
                 `ExponentialMovingAverage` was initialized will be used.
         """
+        self._wait_for_update()
         parameters = list(parameters)
         for s_param, param in zip(self.shadow_params, parameters):
             param.data.copy_(s_param.to(param.device).data)
@@ -338,17 +665,29 @@ class EMAModel:
         Args:
             device: like `device` argument to `torch.Tensor.to`
         """
+        self._wait_for_update()
         # .to() on the tensors handles None correctly
         self.shadow_params = [
             p.to(device=device, dtype=dtype) if p.is_floating_point() else p.to(device=device)
             for p in self.shadow_params
         ]
+        self._staging_params = None
+
+    def pin_memory(self) -> None:
+        r"""
+        Move the shadow params to pinned host memory to save device memory. At every step, the parameters are copied
+        to the host asynchronously and averaged on the CPU, which can be overlapped with training with `async_update`.
+        """
+        self._wait_for_update()
+        self.shadow_params = [p.detach().cpu().pin_memory() for p in self.shadow_params]
+        self._staging_params = None
 
     def state_dict(self) -> dict:
         r"""
         Returns the state of the ExponentialMovingAverage as a dict. This method is used by accelerate during
         checkpointing to save the ema state dict.
         """
+        self._wait_for_update()
         # Following PyTorch conventions, references to tensors are returned:
         # "returns a reference to the state and not its copy!" -
         # https://pytorch.org/tutorials/beginner/saving_loading_models.html#what-is-a-state-dict
@@ -431,6 +770,8 @@ class EMAModel:
 
         shadow_params = state_dict.get("shadow_params", None)
         if shadow_params is not None:
+            self._wait_for_update()
+            self._staging_params = None
             self.shadow_params = shadow_params
             if not isinstance(self.shadow_params, list):
                 raise ValueError("shadow_params must be a list")
@@ -1,21 +1,32 @@
 import io
+import os
 import random
+import shutil
 import struct
 import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import List, Union
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
 import numpy as np
 import PIL.Image
 import PIL.ImageOps
+from PIL import GifImagePlugin
 
 from .import_utils import (
     BACKENDS_MAPPING,
     is_opencv_available,
+    is_torch_available,
 )
 from .logging import get_logger
 
 
+if is_torch_available():
+    import torch
+
+
 global_rng = random.Random()
 
 logger = get_logger(__name__)
@@ -28,21 +39,233 @@ def buffered_writer(raw_f):
     f.flush()
 
 
-def export_to_gif(image: List[PIL.Image.Image], output_gif_path: str = None) -> str:
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+_Frames = Union[Iterable[np.ndarray], Iterable[PIL.Image.Image], Iterable["torch.Tensor"]]
+
+
+def _iter_video_frames(video_frames: _Frames) -> Iterator[Union[np.ndarray, PIL.Image.Image, "torch.Tensor"]]:
+    for frames in video_frames:
+        if not isinstance(frames, PIL.Image.Image) and frames.ndim == 4:
+            # a chunk of frames, e.g. yielded by `VaeImageProcessor.postprocess_stream`
+            yield from frames
+        else:
+            yield frames
+
+
+def _frame_to_numpy(frame: Union[np.ndarray, PIL.Image.Image, "torch.Tensor"]) -> np.ndarray:
+    if isinstance(frame, PIL.Image.Image):
+        return np.array(frame.convert("RGB"))
+    if is_torch_available() and isinstance(frame, torch.Tensor):
+        # torch frames are `C x H x W` like the ones returned with `output_type="pt"`
+        frame = frame.detach().permute(1, 2, 0).cpu()
+        # integer frames are already in `[0, 255]`, only floating point frames are scaled
+        frame = frame.numpy() if frame.dtype == torch.uint8 else frame.float().numpy()
+    if frame.dtype != np.uint8:
+        frame = (frame.clip(0, 1) * 255).round().astype(np.uint8)
+    if frame.ndim == 2:
+        frame = frame[..., None]
+    if frame.shape[-1] == 1:
+        frame = frame.repeat(3, axis=-1)
+    return frame[..., :3]
+
+
+def _map_ordered(fn: Callable[[_T], _R], iterable: Iterable[_T], num_workers: Optional[int]) -> Iterator[_R]:
+    # applies `fn` in a thread pool while keeping the order of `iterable`, at most `2 * num_workers` items are in
+    # flight so that memory does not grow with the length of `iterable`
+    num_workers = num_workers if num_workers is not None else os.cpu_count() or 1
+    if num_workers <= 1:
+        yield from map(fn, iterable)
+        return
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * num_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@contextmanager
+def _open_output(output: Union[str, BinaryIO]) -> Iterator[BinaryIO]:
+    if hasattr(output, "write"):
+        yield output
+    else:
+        with open(output, "wb") as f:
+            yield f
+
+
+def _encode_gif_frame(
+    frame: Union[np.ndarray, PIL.Image.Image, "torch.Tensor"], duration: int
+) -> Tuple[Tuple[int, int], List[bytes]]:
+    image = PIL.Image.fromarray(_frame_to_numpy(frame)).convert("P", palette=PIL.Image.Palette.ADAPTIVE)
+    # every frame gets its own color table so that frames can be quantized and encoded independently
+    return image.size, GifImagePlugin.getdata(image, duration=duration, include_color_table=True)
+
+
+def export_to_gif(
+    image: _Frames,
+    output_gif_path: Union[str, BinaryIO] = None,
+    fps: int = 10,
+    num_workers: Optional[int] = None,
+) -> Union[str, BinaryIO]:
+    """
+    Write frames to a looping GIF. The frames are consumed one at a time and quantized and encoded in a thread pool
+    ahead of the writer, so `image` can be a generator of any length and memory use does not grow with it.
+
+    Args:
+        image (`Iterable[PIL.Image.Image]`, `Iterable[np.ndarray]` or `Iterable[torch.Tensor]`):
+            The frames, either as PIL images, `H x W x C` arrays or `C x H x W` tensors, or chunks of frames with an
+            additional leading dimension. Float frames are expected to be in `[0, 1]`.
+        output_gif_path (`str` or file-like object, *optional*):
+            Where to write the GIF, either a path or a binary file-like object such as `io.BytesIO`. Defaults to a
+            temporary file.
+        fps (`int`, *optional*, defaults to 10):
+            The frame rate of the GIF.
+        num_workers (`int`, *optional*):
+            The number of threads encoding frames. Defaults to the number of CPUs.
+    """
     if output_gif_path is None:
         output_gif_path = tempfile.NamedTemporaryFile(suffix=".gif").name
 
-    image[0].save(
-        output_gif_path,
-        save_all=True,
-        append_images=image[1:],
-        optimize=False,
-        duration=100,
-        loop=0,
-    )
+    duration = 1000 // fps
+    with _open_output(output_gif_path) as f:
+        size = None
+        frames = _map_ordered(lambda frame: _encode_gif_frame(frame, duration), _iter_video_frames(image), num_workers)
+        for frame_size, data in frames:
+            if size is None:
+                size = frame_size
+                # logical screen descriptor without global color table, followed by an infinite loop extension
+                f.write(b"GIF89a" + struct.pack("<HHBBB", *size, 0, 0, 0))
+                f.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", 0) + b"\x00")
+            elif frame_size != size:
+                raise ValueError(f"All frames need the same size, expected {size} but got {frame_size}.")
+            f.write(b"".join(data))
+
+        if size is None:
+            raise ValueError("`image` is empty, there is nothing to export.")
+        f.write(b";")
+
     return output_gif_path
 
 
+def _band_to_hwc(band: np.ndarray) -> np.ndarray:
+    if band.ndim == 4:
+        if band.shape[0] != 1:
+            raise ValueError(f"Only bands of a single image can be exported, but got a band of shape {band.shape}.")
+        band = band[0]
+    if band.ndim == 2:
+        band = band[..., None]
+    if band.dtype != np.uint8:
+        raise ValueError(f"Bands have to be `uint8` arrays, but got {band.dtype}.")
+    return band
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def export_to_png_stream(bands: Iterable[np.ndarray], output_png_path: str = None, compress_level: int = 6) -> str:
+    """
+    Write an image to a PNG file one horizontal band at a time, e.g. the bands yielded by
+    [`~image_processor.VaeImageProcessor.postprocess_stream`]. Only the current band is held in memory, and the image
+    height is written to the header once the last band has been received.
+
+    Args:
+        bands (`Iterable[np.ndarray]`):
+            `uint8` arrays of shape `h x W x C` or `1 x h x W x C`, where `C` is 1 (grayscale), 3 (RGB) or 4 (RGBA).
+        output_png_path (`str`, *optional*):
+            Where to write the image. Defaults to a temporary file.
+        compress_level (`int`, *optional*, defaults to 6):
+            The zlib compression level, between 0 and 9.
+    """
+    if output_png_path is None:
+        output_png_path = tempfile.NamedTemporaryFile(suffix=".png").name
+
+    color_types = {1: 0, 3: 2, 4: 6}
+    compressor = zlib.compressobj(compress_level)
+    height = width = num_channels = None
+
+    with open(output_png_path, "wb") as f:
+        for band in bands:
+            band = _band_to_hwc(band)
+            if width is None:
+                height, width, num_channels = 0, band.shape[1], band.shape[2]
+                if num_channels not in color_types:
+                    raise ValueError(f"Bands need 1, 3 or 4 channels, but got {num_channels}.")
+                f.write(b"\x89PNG\r\n\x1a\n")
+                # the height is a placeholder until all bands have been written
+                ihdr = struct.pack(">IIBBBBB", width, 0, 8, color_types[num_channels], 0, 0, 0)
+                f.write(_png_chunk(b"IHDR", ihdr))
+            elif band.shape[1:] != (width, num_channels):
+                raise ValueError(
+                    f"All bands need the same width and number of channels, expected {(width, num_channels)} but"
+                    f" got {band.shape[1:]}."
+                )
+
+            # every scanline is prefixed by its filter type, 0 means no filtering
+            scanlines = np.zeros((band.shape[0], width * num_channels + 1), dtype=np.uint8)
+            scanlines[:, 1:] = band.reshape(band.shape[0], -1)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                f.write(_png_chunk(b"IDAT", data))
+            height += band.shape[0]
+
+        if width is None:
+            raise ValueError("`bands` is empty, there is nothing to export.")
+
+        f.write(_png_chunk(b"IDAT", compressor.flush()))
+        f.write(_png_chunk(b"IEND", b""))
+
+        f.seek(8)
+        f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_types[num_channels], 0, 0, 0)))
+
+    return output_png_path
+
+
+def export_to_memmap(bands: Iterable[np.ndarray], height: int, output_npy_path: Optional[str] = None) -> str:
+    """
+    Write horizontal image bands, e.g. the ones yielded by [`~image_processor.VaeImageProcessor.postprocess_stream`],
+    into a memory-mapped `.npy` file of shape `B x height x W x C` that can be opened with
+    `np.load(output_npy_path, mmap_mode="r")`.
+
+    Args:
+        bands (`Iterable[np.ndarray]`):
+            Arrays of shape `B x h x W x C`.
+        height (`int`):
+            The total height of the image. For latents decoded by a VAE this is the latent height multiplied by the
+            VAE scale factor.
+        output_npy_path (`str`, *optional*):
+            Where to write the array. Defaults to a temporary file.
+    """
+    if output_npy_path is None:
+        output_npy_path = tempfile.NamedTemporaryFile(suffix=".npy").name
+
+    array = None
+    offset = 0
+    for band in bands:
+        if array is None:
+            shape = (band.shape[0], height) + band.shape[2:]
+            array = np.lib.format.open_memmap(output_npy_path, mode="w+", dtype=band.dtype, shape=shape)
+        if offset + band.shape[1] > height:
+            raise ValueError(f"The bands are higher than the given `height` of {height}.")
+        array[:, offset : offset + band.shape[1]] = band
+        offset += band.shape[1]
+
+    if array is None:
+        raise ValueError("`bands` is empty, there is nothing to export.")
+    if offset != height:
+        raise ValueError(f"The bands have a total height of {offset}, but `height` is {height}.")
+
+    array.flush()
+    del array
+
+    return output_npy_path
+
+
 def export_to_ply(mesh, output_ply_path: str = None):
     """
     Write a PLY file for a mesh.
@@ -116,8 +339,29 @@ def export_to_obj(mesh, output_obj_path: str = None):
 
 
 def export_to_video(
-    video_frames: Union[List[np.ndarray], List[PIL.Image.Image]], output_video_path: str = None, fps: int = 8
-) -> str:
+    video_frames: _Frames,
+    output_video_path: Union[str, BinaryIO] = None,
+    fps: int = 8,
+    num_workers: Optional[int] = None,
+) -> Union[str, BinaryIO]:
+    """
+    Write frames to an MP4 video. The frames are consumed one at a time and converted to BGR in a thread pool ahead of
+    the writer, so `video_frames` can be a generator, e.g. of the chunks of frames yielded by
+    [`~image_processor.VaeImageProcessor.postprocess_stream`], in which case the video is never held in memory as a
+    whole.
+
+    Args:
+        video_frames (`Iterable[PIL.Image.Image]`, `Iterable[np.ndarray]` or `Iterable[torch.Tensor]`):
+            The RGB frames, either as PIL images, `H x W x 3` arrays or `3 x H x W` tensors, or chunks of frames with
+            an additional leading dimension. Float frames are expected to be in `[0, 1]`.
+        output_video_path (`str` or file-like object, *optional*):
+            Where to write the video, either a path or a binary file-like object such as `io.BytesIO`. Defaults to a
+            temporary file.
+        fps (`int`, *optional*, defaults to 8):
+            The frame rate of the video.
+        num_workers (`int`, *optional*):
+            The number of threads converting frames. Defaults to the number of CPUs.
+    """
     if is_opencv_available():
         import cv2
     else:
@@ -125,13 +369,26 @@ def export_to_video(
     if output_video_path is None:
         output_video_path = tempfile.NamedTemporaryFile(suffix=".mp4").name
 
-    if isinstance(video_frames[0], PIL.Image.Image):
-        video_frames = [np.array(frame) for frame in video_frames]
+    if hasattr(output_video_path, "write"):
+        # OpenCV can only write to paths, so the video goes through a temporary file
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            video_path = export_to_video(video_frames, os.path.join(tmpdirname, "video.mp4"), fps, num_workers)
+            with open(video_path, "rb") as f:
+                shutil.copyfileobj(f, output_video_path)
+        return output_video_path
+
+    def to_bgr(frame):
+        return cv2.cvtColor(_frame_to_numpy(frame), cv2.COLOR_RGB2BGR)
 
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    h, w, c = video_frames[0].shape
-    video_writer = cv2.VideoWriter(output_video_path, fourcc, fps=fps, frameSize=(w, h))
-    for i in range(len(video_frames)):
-        img = cv2.cvtColor(video_frames[i], cv2.COLOR_RGB2BGR)
-        video_writer.write(img)
+    video_writer = None
+    try:
+        for frame in _map_ordered(to_bgr, _iter_video_frames(video_frames), num_workers):
+            if video_writer is None:
+                h, w, c = frame.shape
+                video_writer = cv2.VideoWriter(output_video_path, fourcc, fps=fps, frameSize=(w, h))
+            video_writer.write(frame)
+    finally:
+        if video_writer is not None:
+            video_writer.release()
     return output_video_path
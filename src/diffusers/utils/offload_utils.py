@@ -0,0 +1,308 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import nullcontext
+from typing import Iterator, List, Optional
+
+import torch
+
+from .import_utils import is_accelerate_available
+
+
+if is_accelerate_available():
+    from accelerate.hooks import CpuOffload, ModelHook, add_hook_to_module, remove_hook_from_module
+    from accelerate.utils import send_to_device
+
+
+def _module_tensors(module: torch.nn.Module) -> Iterator[torch.Tensor]:
+    # parameters and buffers are looked up on every transfer because LoRA loading and similar operations can replace
+    # them between two calls of the pipeline
+    seen = set()
+    for submodule in module.modules():
+        for tensors in (submodule._parameters, submodule._buffers):
+            for tensor in tensors.values():
+                if tensor is not None and id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    yield tensor
+
+
+class PrefetchingCpuOffload(CpuOffload):
+    r"""
+    Offload hook used by [`ModelOffloadChain`]. Like Accelerate's `CpuOffload`, it moves the model to the execution
+    device when its `forward` is called, but it keeps a pinned host copy of every weight so that moving the model back
+    to the CPU doesn't copy anything and moving it to the device can run asynchronously.
+
+    Args:
+        chain (`ModelOffloadChain`):
+            The chain this hook belongs to.
+        index (`int`, *optional*):
+            Position of the model in the offload sequence, or `None` for models outside of the sequence. Those are only
+            offloaded by [`ModelOffloadChain.offload_all`].
+    """
+
+    def __init__(self, chain: "ModelOffloadChain", index: Optional[int] = None):
+        super().__init__(execution_device=chain.execution_device)
+        self.chain = chain
+        self.index = index
+        self.model = None
+        self.on_device = False
+        self._ready_event = None
+
+    def init_hook(self, module):
+        self.model = module
+        self.offload()
+        return module
+
+    def pre_forward(self, module, *args, **kwargs):
+        self.chain.activate(self)
+        return send_to_device(args, self.execution_device), send_to_device(kwargs, self.execution_device)
+
+    def _host_copy(self, tensor: torch.Tensor) -> torch.Tensor:
+        host = getattr(tensor, "_offload_host", None)
+        if tensor.device.type == "cpu":
+            # the tensor was replaced while offloaded
+            if host is None or host.data_ptr() != tensor.data_ptr():
+                host = tensor.data.pin_memory() if self.chain.pin_memory else tensor.data
+        else:
+            # weights changed on the device have to be copied back, unchanged ones can reuse the host copy
+            changed = getattr(tensor, "_offload_state", None) != (tensor.data_ptr(), tensor._version)
+            if host is None or changed:
+                host = tensor.data.to("cpu")
+                host = host.pin_memory() if self.chain.pin_memory else host
+        tensor._offload_host = host
+        return host
+
+    def onload(self, stream: Optional["torch.cuda.Stream"] = None):
+        r"""
+        Moves the model to the execution device. With a `stream`, the copies are enqueued on it and [`~wait`] has to be
+        called before the model runs.
+        """
+        if self.on_device:
+            return
+
+        device = self.execution_device
+        with torch.cuda.stream(stream) if stream is not None else nullcontext():
+            for tensor in _module_tensors(self.model):
+                if tensor.device == device:
+                    continue
+                host = self._host_copy(tensor)
+                tensor.data = host.to(device, non_blocking=self.chain.pin_memory)
+                tensor._offload_state = (tensor.data_ptr(), tensor._version)
+
+        if stream is not None:
+            self._ready_event = torch.cuda.Event()
+            self._ready_event.record(stream)
+        self.on_device = True
+
+    def wait(self):
+        r"""Makes the current stream wait for a pending asynchronous [`~onload`]."""
+        if self._ready_event is None:
+            return
+
+        current_stream = torch.cuda.current_stream(self.execution_device)
+        current_stream.wait_event(self._ready_event)
+        # the weights were allocated on the copy stream but are used on the current one, so the caching allocator
+        # must not reuse their memory before the current stream is done with them
+        for tensor in _module_tensors(self.model):
+            if tensor.device.type == "cuda":
+                tensor.data.record_stream(current_stream)
+        self._ready_event = None
+
+    def offload(self):
+        r"""Moves the model back to its host copy. Weights that were not modified on the device are not copied."""
+        for tensor in _module_tensors(self.model):
+            tensor.data = self._host_copy(tensor)
+            tensor._offload_state = None
+        self._ready_event = None
+        self.on_device = False
+
+    def remove(self):
+        r"""Offloads the model and removes the hook."""
+        self.offload()
+        remove_hook_from_module(self.model)
+
+
+class ModelOffloadChain:
+    r"""
+    Offloading that overlaps host-to-device copies with compute. The modules of the chain, whole models of
+    `model_cpu_offload_seq` or the blocks of a single model, are kept on the CPU in pinned memory and moved to the
+    execution device when their `forward` is called. While a module runs, the next `window_size` modules of the chain
+    are copied to the device on a separate CUDA stream, so that they are ready when they're called. The hooks stay
+    installed across calls, [`~offload_all`] only moves the modules back to the CPU.
+
+    At most `window_size + 1` modules of the chain, the running one and the prefetched ones, are on the device at the
+    same time.
+
+    Args:
+        execution_device (`torch.device`):
+            The device the modules run on.
+        prefetch (`bool`, *optional*, defaults to `True`):
+            Whether to copy the next modules of the chain while the current one runs. Prefetching requires a CUDA
+            device.
+        window_size (`int`, *optional*, defaults to 1):
+            Number of modules after the running one that are kept on the device.
+        cyclic (`bool`, *optional*, defaults to `False`):
+            Whether the first module of the chain runs again after the last one, like the blocks of a denoising model
+            that is called at every step.
+    """
+
+    def __init__(
+        self, execution_device: torch.device, prefetch: bool = True, window_size: int = 1, cyclic: bool = False
+    ):
+        if window_size < 0:
+            raise ValueError(f"`window_size` has to be a non-negative integer but is {window_size}.")
+
+        if execution_device.type == "cuda" and execution_device.index is None:
+            execution_device = torch.device("cuda", torch.cuda.current_device())
+
+        self.execution_device = execution_device
+        self.pin_memory = execution_device.type == "cuda"
+        self.copy_stream = torch.cuda.Stream(execution_device) if prefetch and self.pin_memory else None
+        self.window_size = window_size
+        self.cyclic = cyclic
+        self.hooks: List[PrefetchingCpuOffload] = []
+        self._sequence: List[PrefetchingCpuOffload] = []
+
+    def add(self, module: torch.nn.Module, in_sequence: bool = True) -> PrefetchingCpuOffload:
+        r"""Offloads `module` and installs its hook. Modules are added to the chain in the order of this call."""
+        hook = PrefetchingCpuOffload(self, index=len(self._sequence) if in_sequence else None)
+        add_hook_to_module(module, hook)
+        self.hooks.append(hook)
+        if in_sequence:
+            self._sequence.append(hook)
+        return hook
+
+    def _window(self, index: int) -> List[PrefetchingCpuOffload]:
+        num_hooks = len(self._sequence)
+        if self.cyclic:
+            indices = [(index + offset) % num_hooks for offset in range(min(self.window_size, num_hooks - 1) + 1)]
+        else:
+            indices = range(index, min(index + self.window_size + 1, num_hooks))
+        return [self._sequence[i] for i in indices]
+
+    def activate(self, hook: PrefetchingCpuOffload):
+        r"""Called before the `forward` of the module of `hook`, makes sure it's on the device and prefetches the next ones."""
+        if hook.index is None:
+            hook.onload()
+            hook.wait()
+            return
+
+        window = self._window(hook.index)
+        for other in self._sequence:
+            if other.on_device and all(other is not resident for resident in window):
+                other.offload()
+
+        hook.onload()
+        hook.wait()
+
+        if self.copy_stream is not None:
+            for next_hook in window[1:]:
+                if not next_hook.on_device:
+                    next_hook.onload(stream=self.copy_stream)
+
+    def offload_all(self):
+        r"""Moves all modules back to the CPU without removing the hooks."""
+        for hook in self.hooks:
+            if hook.on_device:
+                hook.offload()
+
+    def remove(self):
+        r"""Moves all modules back to the CPU and removes the hooks."""
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        self._sequence = []
+
+
+class BlockStreamingHook(ModelHook):
+    r"""
+    Hook installed on a model whose blocks are streamed by a [`ModelOffloadChain`]. It moves the inputs to the
+    execution device and exposes the device and the chain to the pipelines.
+    """
+
+    def __init__(self, chain: ModelOffloadChain):
+        self.chain = chain
+        self.execution_device = chain.execution_device
+
+    def pre_forward(self, module, *args, **kwargs):
+        return send_to_device(args, self.execution_device), send_to_device(kwargs, self.execution_device)
+
+    def detach_hook(self, module):
+        self.chain.remove()
+        return module
+
+
+def _tensors_nbytes(module: torch.nn.Module) -> int:
+    return sum(tensor.numel() * tensor.element_size() for tensor in _module_tensors(module))
+
+
+def get_streaming_window_size(
+    blocks: List[torch.nn.Module], resident_bytes: int, memory_budget: int, cyclic: bool = True
+) -> int:
+    r"""
+    Returns the largest window size for which the weights of any `window_size + 1` consecutive `blocks`, plus
+    `resident_bytes` of weights that are always on the device, fit in `memory_budget` bytes.
+    """
+    block_bytes = [_tensors_nbytes(block) for block in blocks]
+    num_blocks = len(block_bytes)
+    padded_bytes = block_bytes + block_bytes if cyclic else block_bytes
+
+    window_size = -1
+    while window_size + 1 < num_blocks:
+        size = window_size + 2
+        largest = max(sum(padded_bytes[i : i + size]) for i in range(num_blocks if cyclic else num_blocks - size + 1))
+        if resident_bytes + largest > memory_budget:
+            break
+        window_size += 1
+
+    if window_size < 0:
+        raise ValueError(
+            f"A `memory_budget` of {memory_budget} bytes is too small, at least {resident_bytes + max(block_bytes)} bytes"
+            " are needed to hold the largest block and the weights outside of the blocks."
+        )
+    return window_size
+
+
+def enable_block_streaming(
+    model: torch.nn.Module,
+    blocks: List[torch.nn.Module],
+    execution_device: torch.device,
+    window_size: Optional[int] = None,
+    memory_budget: Optional[int] = None,
+) -> ModelOffloadChain:
+    r"""
+    Streams the weights of `blocks`, the submodules of `model` in the order they're called, from the CPU to
+    `execution_device`. All the other weights of `model` stay on `execution_device`. The window size is derived from
+    `memory_budget` when it's not passed, and defaults to 1.
+    """
+    if isinstance(getattr(model, "_hf_hook", None), BlockStreamingHook):
+        remove_hook_from_module(model)
+
+    block_tensors = {id(tensor) for block in blocks for tensor in _module_tensors(block)}
+    resident_tensors = [tensor for tensor in _module_tensors(model) if id(tensor) not in block_tensors]
+
+    if window_size is None and memory_budget is not None:
+        resident_bytes = sum(tensor.numel() * tensor.element_size() for tensor in resident_tensors)
+        window_size = get_streaming_window_size(blocks, resident_bytes, memory_budget)
+    elif window_size is None:
+        window_size = 1
+
+    for tensor in resident_tensors:
+        tensor.data = tensor.data.to(execution_device)
+
+    chain = ModelOffloadChain(execution_device, window_size=window_size, cyclic=True)
+    for block in blocks:
+        chain.add(block)
+    add_hook_to_module(model, BlockStreamingHook(chain))
+    return chain
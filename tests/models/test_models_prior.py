@@ -16,6 +16,7 @@
 import gc
 import inspect
 import unittest
+from unittest import mock
 
 import torch
 from parameterized import parameterized
@@ -96,6 +97,32 @@ class PriorTransformerTests(ModelTesterMixin, unittest.TestCase):
         inputs_dict = self.dummy_input
         return init_dict, inputs_dict
 
+    def test_timestep_embedding_cache(self):
+        init_dict, inputs_dict = self.prepare_init_args_and_inputs_for_common()
+        model = self.model_class(**init_dict).to(torch_device)
+        model.eval()
+
+        inputs_dict.pop("timestep")
+        schedule = torch.tensor([999, 500, 10, 1], device=torch_device)
+
+        with torch.no_grad():
+            expected_outputs = [model(**inputs_dict, timestep=t).predicted_image_embedding for t in schedule]
+
+            model.enable_timestep_embedding_cache()
+            model.precompute_timestep_embeddings(schedule)
+
+            calls = []
+            model.time_embedding.register_forward_hook(lambda *args: calls.append("time"))
+            # elements of the schedule are looked up without reading the timesteps back to the host
+            with mock.patch.object(torch.Tensor, "tolist", side_effect=AssertionError("device sync")):
+                outputs = [model(**inputs_dict, timestep=t).predicted_image_embedding for t in schedule]
+
+        for output_cached, expected_output in zip(outputs, expected_outputs):
+            assert torch_all_close(output_cached, expected_output, atol=1e-5)
+        assert calls == []
+
+        model.disable_timestep_embedding_cache()
+
     def test_from_pretrained_hub(self):
         model, loading_info = PriorTransformer.from_pretrained(
             "hf-internal-testing/prior-dummy", output_loading_info=True
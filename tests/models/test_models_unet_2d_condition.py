@@ -743,6 +743,105 @@ class UNet2DConditionModelTests(ModelTesterMixin, UNetTesterMixin, unittest.Test
 
         assert (sample - sample_copy).abs().max() < 1e-4
 
+    def test_block_streaming(self):
+        init_dict, inputs_dict = self.prepare_init_args_and_inputs_for_common()
+        model = self.model_class(**init_dict)
+        model.eval()
+
+        with torch.no_grad():
+            expected_output = model.to(torch_device)(**inputs_dict).sample
+
+        model.to("cpu")
+        num_blocks = len(model.down_blocks) + 1 + len(model.up_blocks)
+        with self.assertRaises(ValueError):
+            model.enable_block_streaming(torch_device, memory_budget=1)
+
+        # all blocks fit in a budget of the model size
+        model_bytes = sum(param.numel() * param.element_size() for param in model.parameters())
+        model_bytes += sum(buffer.numel() * buffer.element_size() for buffer in model.buffers())
+        model.enable_block_streaming(torch_device, memory_budget=model_bytes)
+        assert model._hf_hook.chain.window_size == num_blocks - 1
+
+        model.enable_block_streaming(torch_device, window_size=1)
+        assert model._hf_hook.chain.window_size == 1
+        assert model.conv_in.weight.device.type == torch.device(torch_device).type
+
+        with torch.no_grad():
+            for _ in range(2):
+                output = model(**inputs_dict).sample
+                assert torch_all_close(output, expected_output, atol=1e-5)
+
+        # at most the last block and the prefetched first one stay on the device
+        on_device = [hook.on_device for hook in model._hf_hook.chain._sequence]
+        assert on_device[-1] and sum(on_device[1:-1]) == 0
+
+    def test_timestep_embedding_cache(self):
+        init_dict, inputs_dict = self.prepare_init_args_and_inputs_for_common()
+        init_dict["addition_embed_type"] = "text_time"
+        init_dict["addition_time_embed_dim"] = 8
+        init_dict["projection_class_embeddings_input_dim"] = 4 + 6 * 8
+        model = self.model_class(**init_dict).to(torch_device)
+        model.eval()
+
+        batch_size = inputs_dict["sample"].shape[0]
+        text_embeds = floats_tensor((batch_size, 4)).to(torch_device)
+        time_ids = torch.tensor([[32, 32, 0, 0, 32, 32]] * batch_size, dtype=torch.float32, device=torch_device)
+        inputs_dict["added_cond_kwargs"] = {"text_embeds": text_embeds, "time_ids": time_ids}
+        inputs_dict.pop("timestep")
+        schedule = torch.tensor([999, 500, 10, 1], device=torch_device)
+
+        with torch.no_grad():
+            expected_outputs = [model(**inputs_dict, timestep=t).sample for t in schedule]
+
+            model.enable_timestep_embedding_cache()
+            model.precompute_timestep_embeddings(schedule)
+
+            calls = []
+            model.time_embedding.register_forward_hook(lambda *args: calls.append("time"))
+            model.add_embedding.register_forward_hook(lambda *args: calls.append("add"))
+            outputs = [model(**inputs_dict, timestep=t).sample for t in schedule]
+            # timesteps that are not in the schedule are embedded as usual
+            output = model(**inputs_dict, timestep=torch.tensor([20], device=torch_device)).sample
+
+        for output_cached, expected_output in zip(outputs, expected_outputs):
+            assert torch_all_close(output_cached, expected_output, atol=1e-5)
+        assert calls == ["add", "time"]
+        assert output.shape == expected_outputs[0].shape
+
+        model.disable_timestep_embedding_cache()
+        with torch.no_grad():
+            model(**inputs_dict, timestep=schedule[0])
+        assert calls == ["add", "time", "time", "add"]
+
+    def test_from_pretrained_mmap(self):
+        init_dict, inputs_dict = self.prepare_init_args_and_inputs_for_common()
+        model = self.model_class(**init_dict)
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            model.save_pretrained(tmpdirname)
+            model_file = os.path.join(tmpdirname, "diffusion_pytorch_model.safetensors")
+
+            model_mmap = self.model_class.from_pretrained(tmpdirname, mmap=True)
+            # the weights are views into a single memory map of the checkpoint
+            assert model_mmap.conv_in.weight.untyped_storage().nbytes() == os.path.getsize(model_file)
+            for param, param_mmap in zip(model.state_dict().values(), model_mmap.state_dict().values()):
+                assert torch.equal(param, param_mmap)
+
+            model_mmap_fp16 = self.model_class.from_pretrained(tmpdirname, mmap=True, torch_dtype=torch.float16)
+            for param, param_mmap in zip(model.state_dict().values(), model_mmap_fp16.state_dict().values()):
+                assert torch.equal(param.half(), param_mmap)
+
+            # modifying the weights doesn't modify the checkpoint
+            with torch.no_grad():
+                model_mmap.conv_in.weight.add_(1.0)
+            model_reloaded = self.model_class.from_pretrained(tmpdirname, mmap=True)
+            assert torch.equal(model.conv_in.weight, model_reloaded.conv_in.weight)
+
+            with torch.no_grad():
+                output = model_reloaded.to(torch_device)(**inputs_dict).sample
+                expected_output = model.to(torch_device)(**inputs_dict).sample
+            assert torch.allclose(output, expected_output, atol=1e-6)
+
     def test_asymmetrical_unet(self):
         init_dict, inputs_dict = self.prepare_init_args_and_inputs_for_common()
         # Add asymmetry to configs
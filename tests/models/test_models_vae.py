@@ -14,9 +14,11 @@
 # limitations under the License.
 
 import gc
+import tempfile
 import unittest
 
 import numpy as np
+import PIL.Image
 import torch
 from parameterized import parameterized
 
@@ -28,6 +30,8 @@ from diffusers import (
     ConsistencyDecoderVAE,
     StableDiffusionPipeline,
 )
+from diffusers.image_processor import VaeImageProcessor
+from diffusers.utils import export_to_memmap, export_to_png_stream
 from diffusers.utils.import_utils import is_xformers_available
 from diffusers.utils.loading_utils import load_image
 from diffusers.utils.testing_utils import (
@@ -203,6 +207,69 @@ class AutoencoderKLTests(ModelTesterMixin, UNetTesterMixin, unittest.TestCase):
         for name, param in named_params.items():
             self.assertTrue(torch_all_close(param.grad.data, named_params_2[name].grad.data, atol=5e-5))
 
+    def test_batched_tiling_matches_tiling(self):
+        init_dict, _ = self.prepare_init_args_and_inputs_for_common()
+        model = self.model_class(**init_dict).to(torch_device).eval()
+        model.tile_sample_min_size = 16
+        model.tile_latent_min_size = 8
+
+        # image and latent sizes that are not a multiple of the tile stride give smaller tiles at the borders
+        image = floats_tensor((2, 3, 44, 40)).to(torch_device)
+        latents = floats_tensor((2, 4, 22, 20)).to(torch_device)
+
+        with torch.no_grad():
+            model.enable_tiling()
+            expected_moments = model.encode(image).latent_dist.parameters
+            expected_sample = model.decode(latents).sample
+
+            for tile_batch_size in [1, 3, 16]:
+                model.enable_batched_tiling(tile_batch_size=tile_batch_size)
+                moments = model.encode(image).latent_dist.parameters
+                sample = model.decode(latents).sample
+
+                self.assertEqual(moments.shape, expected_moments.shape)
+                self.assertEqual(sample.shape, expected_sample.shape)
+                self.assertTrue(torch_all_close(moments, expected_moments, atol=1e-5))
+                self.assertTrue(torch_all_close(sample, expected_sample, atol=1e-5))
+
+            model.disable_batched_tiling()
+            self.assertIsNone(model.tile_batch_size)
+            self.assertTrue(model.use_tiling)
+
+    def test_tiled_decode_stream(self):
+        init_dict, _ = self.prepare_init_args_and_inputs_for_common()
+        model = self.model_class(**init_dict).to(torch_device).eval()
+        model.tile_sample_min_size = 16
+        model.tile_latent_min_size = 8
+
+        latents = floats_tensor((1, 4, 22, 20)).to(torch_device)
+        image_processor = VaeImageProcessor(vae_scale_factor=2)
+
+        with torch.no_grad():
+            expected_sample = model.tiled_decode(latents).sample
+        expected_image = np.array(image_processor.postprocess(expected_sample, output_type="pil")[0])
+
+        for tile_batch_size in [None, 2]:
+            model.tile_batch_size = tile_batch_size
+            bands = list(model.tiled_decode_stream(latents))
+            self.assertGreater(len(bands), 1)
+            self.assertTrue(torch_all_close(torch.cat(bands, dim=2), expected_sample, atol=1e-5))
+
+        # the exported pixels are compared exactly, so decode them the same way as the reference
+        model.tile_batch_size = None
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            bands = image_processor.postprocess_stream(model.tiled_decode_stream(latents))
+            png_path = export_to_png_stream(bands, f"{tmpdirname}/image.png")
+            with PIL.Image.open(png_path) as image:
+                self.assertTrue(np.array_equal(np.array(image), expected_image))
+
+            bands = image_processor.postprocess_stream(model.tiled_decode_stream(latents))
+            npy_path = export_to_memmap(
+                bands, height=expected_image.shape[0], output_npy_path=f"{tmpdirname}/image.npy"
+            )
+            self.assertTrue(np.array_equal(np.load(npy_path, mmap_mode="r")[0], expected_image))
+
     def test_from_pretrained_hub(self):
         model, loading_info = AutoencoderKL.from_pretrained("fusing/autoencoder-kl-dummy", output_loading_info=True)
         self.assertIsNotNone(model)
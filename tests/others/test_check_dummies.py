@@ -62,7 +62,7 @@ class CheckDummiesTester(unittest.TestCase):
         self.assertIn("FlaxUNet2DConditionModel", objects["flax"])
         self.assertIn("StableDiffusionPipeline", objects["torch_and_transformers"])
         self.assertIn("FlaxStableDiffusionPipeline", objects["flax_and_transformers"])
-        self.assertIn("LMSDiscreteScheduler", objects["torch_and_scipy"])
+        self.assertIn("LMSDiscreteScheduler", objects["torch"])
         self.assertIn("OnnxStableDiffusionPipeline", objects["torch_and_transformers_and_onnx"])
 
     def test_create_dummy_object(self):
@@ -0,0 +1,169 @@
+# coding=utf-8
+# Copyright 2023 HuggingFace Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+import torch
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+from diffusers import (
+    AutoencoderKL,
+    DDIMScheduler,
+    EulerDiscreteScheduler,
+    StableDiffusionPipeline,
+    UNet2DConditionModel,
+)
+from diffusers.experimental import ContinuousBatchingEngine
+from diffusers.utils.testing_utils import enable_full_determinism, torch_device
+
+
+enable_full_determinism()
+
+
+class ContinuousBatchingEngineTests(unittest.TestCase):
+    def get_dummy_components(self):
+        torch.manual_seed(0)
+        unet = UNet2DConditionModel(
+            block_out_channels=(4, 8),
+            layers_per_block=1,
+            sample_size=32,
+            in_channels=4,
+            out_channels=4,
+            down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+            up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+            cross_attention_dim=32,
+            norm_num_groups=2,
+        )
+        scheduler = DDIMScheduler(
+            beta_start=0.00085,
+            beta_end=0.012,
+            beta_schedule="scaled_linear",
+            clip_sample=False,
+            set_alpha_to_one=False,
+        )
+        torch.manual_seed(0)
+        vae = AutoencoderKL(
+            block_out_channels=[4, 8],
+            in_channels=3,
+            out_channels=3,
+            down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+            up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+            latent_channels=4,
+            norm_num_groups=2,
+        )
+        torch.manual_seed(0)
+        text_encoder_config = CLIPTextConfig(
+            bos_token_id=0,
+            eos_token_id=2,
+            hidden_size=32,
+            intermediate_size=64,
+            layer_norm_eps=1e-05,
+            num_attention_heads=8,
+            num_hidden_layers=3,
+            pad_token_id=1,
+            vocab_size=1000,
+        )
+        text_encoder = CLIPTextModel(text_encoder_config)
+        tokenizer = CLIPTokenizer.from_pretrained("hf-internal-testing/tiny-random-clip")
+
+        components = {
+            "unet": unet,
+            "scheduler": scheduler,
+            "vae": vae,
+            "text_encoder": text_encoder,
+            "tokenizer": tokenizer,
+            "safety_checker": None,
+            "feature_extractor": None,
+            "image_encoder": None,
+        }
+        return components
+
+    def get_dummy_requests(self):
+        generator = torch.Generator(device="cpu").manual_seed(0)
+        latents = [torch.randn((1, 4, 32, 32), generator=generator) for _ in range(3)]
+        return [
+            {"prompt": "A painting of a squirrel", "num_inference_steps": 2, "guidance_scale": 6.0},
+            {"prompt": "An astronaut riding a horse", "num_inference_steps": 4, "guidance_scale": 1.0},
+            {"prompt": "A cat", "negative_prompt": "blurry", "num_inference_steps": 3, "guidance_scale": 3.0},
+        ], latents
+
+    def get_pipeline(self, scheduler_cls=DDIMScheduler):
+        pipe = StableDiffusionPipeline(**self.get_dummy_components())
+        pipe.scheduler = scheduler_cls.from_config(pipe.scheduler.config)
+        pipe = pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=True)
+        return pipe
+
+    def _check_matches_pipeline(self, scheduler_cls):
+        pipe = self.get_pipeline(scheduler_cls)
+        requests, latents = self.get_dummy_requests()
+
+        expected = [
+            pipe(**request, latents=latent.to(torch_device), output_type="np").images
+            for request, latent in zip(requests, latents)
+        ]
+
+        engine = ContinuousBatchingEngine(pipe, max_batch_size=8)
+        outputs = engine.generate(
+            [
+                dict(request, latents=latent.to(torch_device), output_type="np")
+                for request, latent in zip(requests, latents)
+            ]
+        )
+
+        self.assertEqual([output.request_id for output in outputs], ["0", "1", "2"])
+        for output, expected_images in zip(outputs, expected):
+            self.assertEqual(output.images.shape, (1, 64, 64, 3))
+            self.assertLess(np.abs(output.images - expected_images).max(), 1e-4)
+
+    def test_matches_pipeline_ddim(self):
+        self._check_matches_pipeline(DDIMScheduler)
+
+    def test_matches_pipeline_euler(self):
+        self._check_matches_pipeline(EulerDiscreteScheduler)
+
+    def test_requests_finish_independently(self):
+        pipe = self.get_pipeline()
+        requests, _ = self.get_dummy_requests()
+        engine = ContinuousBatchingEngine(pipe, max_batch_size=8)
+
+        short_id = engine.add_request(**requests[0], output_type="np")
+        long_id = engine.add_request(**requests[1], output_type="np")
+
+        self.assertEqual(engine.step(), [])
+        finished = engine.step()
+        self.assertEqual([output.request_id for output in finished], [short_id])
+        self.assertEqual(engine.num_running_requests, 1)
+
+        # a request admitted mid-flight shares the next batch with the running one
+        late_id = engine.add_request(**requests[2], output_type="np", request_id="late")
+        self.assertEqual(late_id, "late")
+        finished_ids = []
+        while engine.has_unfinished_requests():
+            finished_ids += [output.request_id for output in engine.step()]
+        self.assertEqual(finished_ids, [long_id, late_id])
+
+    def test_max_batch_size_limits_admission(self):
+        pipe = self.get_pipeline()
+        requests, _ = self.get_dummy_requests()
+        # the first request uses classifier free guidance and therefore fills two rows on its own
+        engine = ContinuousBatchingEngine(pipe, max_batch_size=2)
+
+        engine.add_request(**requests[0], output_type="np")
+        engine.add_request(**requests[1], output_type="np")
+        engine.step()
+        self.assertEqual(engine.num_running_requests, 1)
+        self.assertEqual(engine.num_waiting_requests, 1)
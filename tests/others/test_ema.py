@@ -20,7 +20,7 @@ import torch
 
 from diffusers import UNet2DConditionModel
 from diffusers.training_utils import EMAModel
-from diffusers.utils.testing_utils import enable_full_determinism, skip_mps, torch_device
+from diffusers.utils.testing_utils import enable_full_determinism, require_torch_gpu, skip_mps, torch_device
 
 
 enable_full_determinism()
@@ -157,3 +157,64 @@ class EMAModelTests(unittest.TestCase):
         output_loaded = loaded_unet(noisy_latents, timesteps, encoder_hidden_states).sample
 
         assert torch.allclose(output, output_loaded, atol=1e-4)
+
+
+class EMAModelForeachTests(unittest.TestCase):
+    def get_model(self):
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(8, 16), torch.nn.LayerNorm(16), torch.nn.Linear(16, 4))
+        model[1].requires_grad_(False)
+        return model.to(torch_device)
+
+    def run_steps(self, model, ema, num_steps=6):
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+        for _ in range(num_steps):
+            model(torch.randn(2, 8, device=torch_device)).sum().backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            ema.step(model.parameters())
+        return ema.state_dict()["shadow_params"]
+
+    def test_foreach_matches_loop(self):
+        model = self.get_model()
+        ema = EMAModel(model.parameters(), decay=0.9, update_after_step=1)
+        torch.manual_seed(1)
+        expected = self.run_steps(model, ema)
+
+        model = self.get_model()
+        ema = EMAModel(model.parameters(), decay=0.9, update_after_step=1, foreach=True)
+        torch.manual_seed(1)
+        shadow_params = self.run_steps(model, ema)
+
+        for param, expected_param in zip(shadow_params, expected):
+            self.assertTrue(torch.allclose(param, expected_param, atol=1e-6))
+
+    def test_update_every(self):
+        model = self.get_model()
+        ema = EMAModel(model.parameters(), decay=0.9, update_every=3, foreach=True)
+        initial_params = [param.clone() for param in ema.shadow_params]
+
+        self.run_steps(model, ema, num_steps=2)
+        for param, initial_param in zip(ema.shadow_params, initial_params):
+            self.assertTrue(torch.equal(param, initial_param))
+
+        self.run_steps(model, ema, num_steps=1)
+        self.assertEqual(ema.optimization_step, 3)
+        self.assertAlmostEqual(ema.cur_decay_value, ema.get_decay(1) * ema.get_decay(2) * ema.get_decay(3))
+
+    @require_torch_gpu
+    def test_pinned_async_update(self):
+        model = self.get_model()
+        ema = EMAModel(model.parameters(), decay=0.9, update_after_step=1)
+        torch.manual_seed(1)
+        expected = self.run_steps(model, ema)
+
+        model = self.get_model()
+        ema = EMAModel(model.parameters(), decay=0.9, update_after_step=1, async_update=True)
+        ema.pin_memory()
+        torch.manual_seed(1)
+        shadow_params = self.run_steps(model, ema)
+
+        for param, expected_param in zip(shadow_params, expected):
+            self.assertTrue(param.is_pinned())
+            self.assertTrue(torch.allclose(param.to(expected_param.device), expected_param, atol=1e-6))
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import unittest
 
 import numpy as np
@@ -97,6 +98,29 @@ class ImageProcessorTest(unittest.TestCase):
                     np.abs(in_np - out_np).max() < 1e-6
                 ), f"decoded output does not match input for output_type {output_type}"
 
+    def test_vae_image_processor_uint8(self):
+        image_processor = VaeImageProcessor(do_resize=False, do_normalize=True)
+
+        input_pt = torch.rand((2, 3, 8, 8))
+        expected = self.to_np(image_processor.postprocess(image_processor.preprocess(input_pt), output_type="pil"))
+
+        out = image_processor.postprocess(image_processor.preprocess(input_pt), output_type="uint8")
+        assert out.dtype == np.uint8
+        assert np.array_equal(out, expected)
+
+        out = image_processor.postprocess(image_processor.preprocess(input_pt), output_type="png")
+        assert len(out) == 2 and all(isinstance(o, bytes) for o in out)
+        decoded = np.stack([np.array(PIL.Image.open(io.BytesIO(o))) for o in out])
+        assert np.array_equal(decoded, expected)
+
+        out = image_processor.encode_images(expected, format="webp", lossless=True)
+        decoded = np.stack([np.array(PIL.Image.open(io.BytesIO(o))) for o in out])
+        assert np.array_equal(decoded, expected)
+
+        for output_type in ["jpeg", "webp"]:
+            out = image_processor.postprocess(image_processor.preprocess(input_pt), output_type=output_type)
+            assert all(PIL.Image.open(io.BytesIO(o)).format == output_type.upper() for o in out)
+
     def test_preprocess_input_3d(self):
         image_processor = VaeImageProcessor(do_resize=False, do_normalize=False)
 
@@ -308,3 +332,42 @@ class ImageProcessorTest(unittest.TestCase):
         assert (
             out_np.shape == exp_np_shape
         ), f"resized image output shape '{out_np.shape}' didn't match expected shape '{exp_np_shape}'."
+
+    def test_preprocess_batched_on_device(self):
+        image_processor = VaeImageProcessor(vae_scale_factor=8)
+        y, x = np.mgrid[0:48, 0:80]
+        image = np.stack([x / 80, y / 48, (x + y) / 128], axis=-1)
+        input_pil = [PIL.Image.fromarray((image * 255).astype(np.uint8))] * 2
+
+        for resize_mode in ["default", "fill", "crop"]:
+            out_pil = image_processor.preprocess(input_pil, height=32, width=96, resize_mode=resize_mode)
+            out_pt = image_processor.preprocess(input_pil, height=32, width=96, resize_mode=resize_mode, device="cpu")
+            assert out_pt.shape == out_pil.shape == (2, 3, 32, 96)
+            # PyTorch has no lanczos filter, bicubic interpolation gives close results
+            assert (out_pt - out_pil).abs().max() < 2e-2, f"batched output does not match for {resize_mode}"
+
+        # tensors support the same resize modes
+        out_pt = image_processor.resize(self.to_np(input_pil) / 255.0, height=32, width=96, resize_mode="fill")
+        assert out_pt.shape == (2, 32, 96, 3)
+
+        mask_processor = VaeImageProcessor(
+            vae_scale_factor=8, do_normalize=False, do_binarize=True, do_convert_grayscale=True
+        )
+        mask = np.zeros((48, 80), dtype=np.uint8)
+        mask[10:30, 20:50] = 255
+        input_mask = [PIL.Image.fromarray(mask)] * 2
+        out_mask_pil = mask_processor.preprocess(input_mask, height=48, width=80)
+        out_mask_pt = mask_processor.preprocess(input_mask, height=48, width=80, device="cpu")
+        assert out_mask_pt.shape == (2, 1, 48, 80)
+        assert torch.equal(out_mask_pt, out_mask_pil)
+
+    def test_get_crop_region(self):
+        mask = np.zeros((32, 64), dtype=np.uint8)
+        mask[4:12, 40:48] = 255
+
+        crop_region = VaeImageProcessor.get_crop_region(PIL.Image.fromarray(mask), width=64, height=64, pad=2)
+        assert crop_region == (38, 2, 50, 14)
+        assert VaeImageProcessor.get_crop_region(torch.from_numpy(mask), width=64, height=64, pad=2) == crop_region
+
+        crop_region = VaeImageProcessor.get_crop_region(PIL.Image.fromarray(mask), width=128, height=32)
+        assert crop_region == (28, 4, 60, 12)
@@ -13,12 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+import tempfile
 import unittest
 
 import torch
 
 from diffusers import DDIMScheduler, DDPMScheduler, UNet2DModel
-from diffusers.training_utils import set_seed
+from diffusers.training_utils import EncodedDatasetCache, build_encoded_dataset_cache, set_seed
 from diffusers.utils.testing_utils import slow
 
 
@@ -84,3 +86,61 @@ class TrainingTests(unittest.TestCase):
 
         self.assertTrue(torch.allclose(ddpm_noisy_images, ddim_noisy_images, atol=1e-5))
         self.assertTrue(torch.allclose(ddpm_noise_pred, ddim_noise_pred, atol=1e-5))
+
+
+class EncodedDatasetCacheTests(unittest.TestCase):
+    def test_build_and_read(self):
+        torch.manual_seed(0)
+        batches = [
+            {"latent_moments": torch.randn(3, 8, 4, 4), "prompt_embeds": torch.randn(3, 7, 16).to(torch.bfloat16)}
+            for _ in range(3)
+        ]
+        latent_moments = torch.cat([batch["latent_moments"] for batch in batches])
+        prompt_embeds = torch.cat([batch["prompt_embeds"] for batch in batches])
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            cache = build_encoded_dataset_cache(tmpdirname, batches, lambda batch: batch, shard_size=4)
+            self.assertEqual(len(cache), 9)
+            self.assertEqual(cache.metadata["shards"], [4, 4, 1])
+            self.assertEqual(cache.fields["prompt_embeds"], {"dtype": "bfloat16", "shape": [7, 16]})
+
+            for index in range(len(cache)):
+                sample = cache[index]
+                self.assertTrue(torch.equal(sample["latent_moments"], latent_moments[index]))
+                self.assertTrue(torch.equal(sample["prompt_embeds"], prompt_embeds[index]))
+
+            # writing to a sample never alters the cache
+            cache[-1]["latent_moments"].zero_()
+            self.assertTrue(torch.equal(EncodedDatasetCache(tmpdirname)[-1]["latent_moments"], latent_moments[-1]))
+
+            # the memory maps are reopened instead of being pickled
+            cache = pickle.loads(pickle.dumps(cache))
+            batch = next(iter(torch.utils.data.DataLoader(cache, batch_size=5)))
+            self.assertTrue(torch.equal(batch["latent_moments"], latent_moments[:5]))
+
+            # an existing cache is reused without encoding anything
+            cache = build_encoded_dataset_cache(tmpdirname, batches, lambda batch: None)
+            self.assertEqual(len(cache), 9)
+
+    def test_fingerprint(self):
+        batches = [{"latent_moments": torch.randn(3, 8, 4, 4)}]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            cache = build_encoded_dataset_cache(tmpdirname, batches, lambda batch: batch, fingerprint="512")
+            self.assertEqual(cache.metadata["fingerprint"], "512")
+
+            # the cache is reused with the same fingerprint and rebuilt with a different one
+            cache = build_encoded_dataset_cache(tmpdirname, batches, lambda batch: None, fingerprint="512")
+            self.assertEqual(len(cache), 3)
+
+            batches = [{"latent_moments": torch.randn(2, 8, 8, 8)}]
+            cache = build_encoded_dataset_cache(tmpdirname, batches, lambda batch: batch, fingerprint="1024")
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.metadata["fingerprint"], "1024")
+            self.assertEqual(cache.fields["latent_moments"]["shape"], [8, 8, 8])
+
+    def test_inconsistent_shapes(self):
+        batches = [{"prompt_embeds": torch.randn(2, 7, 16)}, {"prompt_embeds": torch.randn(2, 8, 16)}]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            with self.assertRaises(ValueError):
+                build_encoded_dataset_cache(tmpdirname, batches, lambda batch: batch)
+            self.assertFalse(EncodedDatasetCache.exists(tmpdirname))
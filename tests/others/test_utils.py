@@ -13,14 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
 import unittest
 from distutils.util import strtobool
 
+import numpy as np
+import PIL.Image
 import pytest
+import torch
 
 from diffusers import __version__
-from diffusers.utils import deprecate
+from diffusers.utils import deprecate, export_to_gif, export_to_video
+from diffusers.utils.import_utils import is_opencv_available
 
 
 # Used to test the hub
@@ -211,3 +216,61 @@ def is_staging_test(test_case):
         return unittest.skip("test is staging test")(test_case)
     else:
         return pytest.mark.is_staging_test()(test_case)
+
+
+class ExportTester(unittest.TestCase):
+    def get_frames(self):
+        rng = np.random.RandomState(0)
+        frames = rng.randint(0, 256, size=(6, 16, 24, 3), dtype=np.uint8)
+
+        def frame_iterator():
+            # single frames of every supported type, then a chunk of frames
+            yield frames[0]
+            yield PIL.Image.fromarray(frames[1])
+            yield torch.from_numpy(frames[2]).permute(2, 0, 1) / 255.0
+            yield frames[3:]
+
+        return frames, frame_iterator()
+
+    def test_export_to_gif_stream(self):
+        frames, frame_iterator = self.get_frames()
+
+        buffer = io.BytesIO()
+        export_to_gif(frame_iterator, buffer, fps=5, num_workers=2)
+
+        buffer.seek(0)
+        gif = PIL.Image.open(buffer)
+        self.assertEqual(gif.n_frames, len(frames))
+        self.assertEqual(gif.size, (24, 16))
+        self.assertEqual(gif.info["duration"], 200)
+        self.assertEqual(gif.info["loop"], 0)
+
+    def test_export_to_gif_uint8_tensor(self):
+        # integer torch frames are already in `[0, 255]` and must not be rescaled
+        frame = torch.tensor([200, 100, 50], dtype=torch.uint8)[:, None, None].expand(3, 16, 24)
+
+        buffer = io.BytesIO()
+        export_to_gif(iter([frame]), buffer)
+
+        buffer.seek(0)
+        gif = PIL.Image.open(buffer).convert("RGB")
+        self.assertEqual(gif.getpixel((0, 0)), (200, 100, 50))
+
+    def test_export_to_gif_empty(self):
+        with self.assertRaises(ValueError):
+            export_to_gif(iter([]), io.BytesIO())
+
+    @unittest.skipIf(not is_opencv_available(), "test requires OpenCV")
+    def test_export_to_video_stream(self):
+        import cv2
+
+        frames, frame_iterator = self.get_frames()
+
+        buffer = io.BytesIO()
+        export_to_video(frame_iterator, buffer, num_workers=2)
+        self.assertGreater(buffer.tell(), 0)
+
+        video_path = export_to_video(iter(frames))
+        video = cv2.VideoCapture(video_path)
+        self.assertEqual(int(video.get(cv2.CAP_PROP_FRAME_COUNT)), len(frames))
+        video.release()
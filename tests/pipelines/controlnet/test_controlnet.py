@@ -449,6 +449,101 @@ class StableDiffusionMultiControlNetPipelineFastTests(
     def test_inference_batch_single_identical(self):
         self._test_inference_batch_single_identical(expected_max_diff=2e-3)
 
+    @require_torch_2
+    def test_batched_forward(self):
+        components = self.get_dummy_components()
+        pipe = self.pipeline_class(**components)
+        pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=None)
+
+        # batching is opt-in
+        assert not pipe.controlnet._can_batch()
+        inputs = self.get_dummy_inputs(torch_device)
+        output = pipe(**inputs, control_guidance_end=[0.5, 1.0])[0]
+
+        weights = [controlnet.conv_in.weight for controlnet in pipe.controlnet.nets]
+        data_ptrs = [weight.data_ptr() for weight in weights]
+
+        pipe.controlnet.enable_batched_forward()
+        inputs = self.get_dummy_inputs(torch_device)
+        output_batched = pipe(**inputs, control_guidance_end=[0.5, 1.0])[0]
+        assert np.abs(output - output_batched).max() < 1e-4
+
+        # both ControlNets share an architecture and are stacked into a copy, their own weights are left untouched
+        assert len(pipe.controlnet._stacked_weights) == 1
+        for weight, data_ptr in zip(weights, data_ptrs):
+            assert weight.data_ptr() == data_ptr
+            assert weight.untyped_storage().nbytes() == weight.numel() * weight.element_size()
+
+        # ControlNets with different architectures run one by one
+        torch.manual_seed(0)
+        controlnet = ControlNetModel(
+            block_out_channels=(4, 8),
+            layers_per_block=2,
+            in_channels=4,
+            down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+            cross_attention_dim=32,
+            conditioning_embedding_out_channels=(8, 32),
+            norm_num_groups=1,
+        ).to(torch_device)
+        sample = torch.randn(1, 4, 32, 32, device=torch_device)
+        encoder_hidden_states = torch.randn(1, 7, 32, device=torch_device)
+        images = [torch.randn(1, 3, 64, 64, device=torch_device)] * 3
+        multi_controlnet = MultiControlNetModel([*pipe.controlnet.nets, controlnet])
+
+        with torch.no_grad():
+            multi_controlnet.disable_batched_forward()
+            down_samples, mid_sample = multi_controlnet(
+                sample, 1, encoder_hidden_states, images, [0.5, 1.0, 0.8], return_dict=False
+            )
+            multi_controlnet.enable_batched_forward()
+            down_samples_batched, mid_sample_batched = multi_controlnet(
+                sample, 1, encoder_hidden_states, images, [0.5, 1.0, 0.8], return_dict=False
+            )
+
+        for down_sample, down_sample_batched in zip(down_samples, down_samples_batched):
+            assert torch.allclose(down_sample, down_sample_batched, atol=1e-5)
+        assert torch.allclose(mid_sample, mid_sample_batched, atol=1e-5)
+
+    def test_residual_cache(self):
+        components = self.get_dummy_components()
+        pipe = self.pipeline_class(**components)
+        pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=None)
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output = pipe(**inputs)[0]
+
+        # computing the residuals at every step doesn't change the output
+        pipe.controlnet.enable_residual_cache(cache_interval=1)
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output_cached = pipe(**inputs)[0]
+        assert np.abs(output - output_cached).max() < 1e-4
+        assert pipe.controlnet.residual_cache_stats == {"hits": 0, "misses": 8}
+
+        pipe.controlnet.enable_residual_cache(cache_interval=2)
+        for _ in range(2):
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["num_inference_steps"] = 4
+            output_cached = pipe(**inputs)[0]
+        # the statistics add up over both calls, and every denoising loop starts by computing the residuals
+        assert pipe.controlnet.residual_cache_stats == {"hits": 8, "misses": 8}
+        assert np.abs(output - output_cached).max() > 1e-3
+
+        pipe.controlnet.enable_residual_cache(cache_interval=1, cache_window=(0, 1), extrapolate=True)
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        pipe(**inputs)
+        assert pipe.controlnet.residual_cache_stats == {"hits": 6, "misses": 2}
+
+        pipe.controlnet.disable_residual_cache()
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output_uncached = pipe(**inputs)[0]
+        assert np.abs(output - output_uncached).max() < 1e-4
+
     def test_save_pretrained_raise_not_implemented_exception(self):
         components = self.get_dummy_components()
         pipe = self.pipeline_class(**components)
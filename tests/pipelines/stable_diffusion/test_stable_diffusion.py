@@ -14,11 +14,14 @@
 # limitations under the License.
 
 
+import copy
 import gc
+import os
 import tempfile
 import time
 import traceback
 import unittest
+from unittest import mock
 
 import numpy as np
 import torch
@@ -27,10 +30,12 @@ from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
 
 from diffusers import (
     AutoencoderKL,
+    CompileManager,
     DDIMScheduler,
     DPMSolverMultistepScheduler,
     EulerAncestralDiscreteScheduler,
     EulerDiscreteScheduler,
+    GuidancePolicy,
     LCMScheduler,
     LMSDiscreteScheduler,
     PNDMScheduler,
@@ -661,6 +666,289 @@ class StableDiffusionPipelineFastTests(
             output[0, -3:, -3:, -1], output_no_freeu[0, -3:, -3:, -1]
         ), "Disabling of FreeU should lead to results similar to the default pipeline results."
 
+    def test_deep_cache_enabled(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        prompt = "hey"
+        output = sd_pipe(prompt, num_inference_steps=4, output_type="np", generator=torch.manual_seed(0)).images
+
+        num_mid_block_calls = []
+        sd_pipe.unet.mid_block.register_forward_hook(lambda *args: num_mid_block_calls.append(1))
+
+        sd_pipe.enable_deep_cache(cache_interval=1)
+        output_full = sd_pipe(prompt, num_inference_steps=4, output_type="np", generator=torch.manual_seed(0)).images
+        assert len(num_mid_block_calls) == 4
+
+        sd_pipe.enable_deep_cache(cache_interval=2)
+        output_deep_cache = sd_pipe(
+            prompt, num_inference_steps=4, output_type="np", generator=torch.manual_seed(0)
+        ).images
+        # the cache is reset at the start of the loop, so only steps 0 and 2 run the mid block
+        assert len(num_mid_block_calls) == 6
+
+        assert np.allclose(
+            output, output_full, atol=1e-6
+        ), "DeepCache with `cache_interval=1` should lead to results similar to the default pipeline results."
+        assert not np.allclose(
+            output[0, -3:, -3:, -1], output_deep_cache[0, -3:, -3:, -1]
+        ), "Enabling of DeepCache should lead to different results."
+
+    def test_deep_cache_disabled(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        prompt = "hey"
+        output = sd_pipe(prompt, num_inference_steps=3, output_type="np", generator=torch.manual_seed(0)).images
+
+        sd_pipe.enable_deep_cache(cache_interval=3)
+        sd_pipe(prompt, num_inference_steps=3, output_type="np", generator=torch.manual_seed(0))
+        sd_pipe.disable_deep_cache()
+        assert sd_pipe.unet.deep_cache_interval is None
+
+        output_no_deep_cache = sd_pipe(
+            prompt, num_inference_steps=3, output_type="np", generator=torch.manual_seed(0)
+        ).images
+
+        assert np.allclose(
+            output, output_no_deep_cache, atol=1e-6
+        ), "Disabling of DeepCache should lead to results similar to the default pipeline results."
+
+    def test_prompt_embeds_cache(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["negative_prompt"] = "blurry"
+        output = sd_pipe(**inputs).images
+
+        sd_pipe.enable_prompt_embeds_cache(max_size=2)
+        cache = sd_pipe.prompt_embeds_cache
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["negative_prompt"] = "blurry"
+        output_cache_miss = sd_pipe(**inputs).images
+        assert (cache.hits, cache.misses) == (0, 2)
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["negative_prompt"] = "blurry"
+        output_cache_hit = sd_pipe(**inputs).images
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        assert np.abs(output - output_cache_miss).max() < 1e-6
+        assert np.abs(output - output_cache_hit).max() < 1e-6
+
+        # a different `clip_skip` changes the prompt embeddings, the least recently used entry is evicted
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["negative_prompt"] = "blurry"
+        sd_pipe(**inputs, clip_skip=1)
+        assert (cache.hits, cache.misses) == (3, 3)
+        assert len(cache) == 2
+
+        # replacing the text encoder invalidates all entries
+        sd_pipe.text_encoder = copy.deepcopy(sd_pipe.text_encoder)
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["negative_prompt"] = "blurry"
+        sd_pipe(**inputs)
+        assert (cache.hits, cache.misses) == (3, 5)
+
+        sd_pipe.disable_prompt_embeds_cache()
+        assert sd_pipe.prompt_embeds_cache is None
+
+    def test_guidance_policy(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        unet_batch_sizes = []
+        sd_pipe.unet.register_forward_pre_hook(lambda module, args: unet_batch_sizes.append(args[0].shape[0]))
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output = sd_pipe(**inputs).images
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output_default_policy = sd_pipe(**inputs, guidance_policy=GuidancePolicy()).images
+        assert unet_batch_sizes == [2, 2, 2, 2] * 2
+        assert np.abs(output - output_default_policy).max() < 1e-6
+
+        unet_batch_sizes.clear()
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output_uncond_interval = sd_pipe(**inputs, guidance_policy=GuidancePolicy(uncond_interval=2)).images
+        assert unet_batch_sizes == [2, 1, 2, 1]
+
+        unet_batch_sizes.clear()
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output_guidance_end = sd_pipe(**inputs, guidance_policy=GuidancePolicy(guidance_end=0.5)).images
+        assert unet_batch_sizes == [2, 2, 1, 1]
+
+        assert output_uncond_interval.shape == output_guidance_end.shape == (1, 64, 64, 3)
+        assert np.abs(output - output_uncond_interval).max() > 1e-6
+        assert np.abs(output - output_guidance_end).max() > 1e-6
+
+    def test_static_loop(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        for scheduler in [
+            DDIMScheduler.from_config(sd_pipe.scheduler.config),
+            EulerDiscreteScheduler.from_config(sd_pipe.scheduler.config, prediction_type="v_prediction"),
+            DPMSolverMultistepScheduler.from_config(sd_pipe.scheduler.config, solver_order=3),
+        ]:
+            sd_pipe.scheduler = scheduler
+
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["num_inference_steps"] = 5
+            output = sd_pipe(**inputs, guidance_rescale=0.7).images
+
+            sd_pipe.enable_static_loop()
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["num_inference_steps"] = 5
+            output_static = sd_pipe(**inputs, guidance_rescale=0.7).images
+            sd_pipe.disable_static_loop()
+
+            assert np.abs(output - output_static).max() < 1e-5, scheduler.__class__.__name__
+
+        # steps are cached by shape and reused for later generations
+        sd_pipe.enable_static_loop()
+        loop = sd_pipe.static_loop
+        for height in [64, 64, 32]:
+            inputs = self.get_dummy_inputs(torch_device)
+            sd_pipe(**inputs, height=height, width=height)
+        assert len(loop) == 2
+
+        inputs = self.get_dummy_inputs(torch_device)
+        with self.assertRaises(ValueError):
+            sd_pipe(**inputs, guidance_policy=GuidancePolicy(uncond_interval=2))
+
+        sd_pipe.scheduler = PNDMScheduler(skip_prk_steps=True)
+        inputs = self.get_dummy_inputs(torch_device)
+        with self.assertRaises(ValueError):
+            sd_pipe(**inputs)
+
+        sd_pipe.disable_static_loop()
+        assert sd_pipe.static_loop is None
+
+        # the captured steps can't follow the weights of an offloaded UNet
+        sd_pipe.scheduler = components["scheduler"]
+        sd_pipe.enable_model_cpu_offload(device=torch_device)
+        sd_pipe.enable_static_loop()
+        inputs = self.get_dummy_inputs(torch_device)
+        with self.assertRaises(ValueError):
+            sd_pipe(**inputs)
+
+    @require_torch_2
+    @mock.patch.dict(os.environ)
+    def test_compile_manager(self):
+        # the manager sets `TORCHINDUCTOR_CACHE_DIR` and raises the recompile limit of dynamo for the whole process
+        config = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+        self.addCleanup(setattr, config, limit_name, getattr(config, limit_name))
+
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        inputs = self.get_dummy_inputs(torch_device)
+        output = sd_pipe(**inputs).images
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            manager = CompileManager(
+                resolutions=[(64, 64)], batch_sizes=[1, 2], cache_dir=tmpdirname, compile_kwargs={"backend": "eager"}
+            )
+            sd_pipe.enable_compile_manager(manager)
+            warm_up_times = manager.warm_up(sd_pipe)
+            assert set(warm_up_times) == {(64, 64, 1, True), (64, 64, 1, False), (64, 64, 2, True), (64, 64, 2, False)}
+            # UNet batch sizes 1, 2 and 4, VAE batch sizes 1 and 2
+            assert dict(manager.num_compilations) == {"unet": 3, "vae": 2}
+
+            inputs = self.get_dummy_inputs(torch_device)
+            output_compiled = sd_pipe(**inputs).images
+            assert np.abs(output - output_compiled).max() < 1e-5
+
+            # smaller requests are padded to the bucket and cropped without recompiling
+            inputs = self.get_dummy_inputs(torch_device)
+            output_padded = sd_pipe(**inputs, height=32, width=48).images
+            assert output_padded.shape == (1, 32, 48, 3)
+
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["output_type"] = "latent"
+            latents_padded = sd_pipe(**inputs, height=32, width=48).images
+            assert latents_padded.shape == (1, 4, 16, 24)
+            assert dict(manager.num_compilations) == {"unet": 3, "vae": 2}
+
+            sd_pipe.disable_compile_manager()
+            assert "forward" not in sd_pipe.unet.__dict__ and "decode" not in sd_pipe.vae.__dict__
+
+        # the images are cropped where the latents were placed, also when the latent padding is odd
+        latents = torch.randn(1, 4, 57, 57)
+        padded_latents = CompileManager.pad_latents(latents, torch.zeros(1, 4, 64, 64))
+        images = CompileManager.crop(padded_latents.repeat_interleave(8, -2).repeat_interleave(8, -1), 456, 456, 8)
+        assert torch.equal(images, latents.repeat_interleave(8, -2).repeat_interleave(8, -1))
+
+    def test_per_sample_guidance_scale(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        latents = torch.randn((2, 4, 32, 32), generator=torch.manual_seed(0)).to(torch_device)
+        prompts = ["A painting of a squirrel eating a burger", "An astronaut riding a horse"]
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["prompt"] = prompts
+        inputs["guidance_scale"] = [6.0, 1.0]
+        output = sd_pipe(**inputs, latents=latents).images
+
+        for i, guidance_scale in enumerate([6.0, 1.0]):
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["prompt"] = prompts[i]
+            inputs["guidance_scale"] = guidance_scale
+            expected = sd_pipe(**inputs, latents=latents[i : i + 1]).images
+            assert np.abs(output[i : i + 1] - expected).max() < 1e-4
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["prompt"] = prompts
+        inputs["guidance_scale"] = [6.0, 1.0, 3.0]
+        with self.assertRaises(ValueError):
+            sd_pipe(**inputs)
+
+    @require_torch_gpu
+    def test_model_cpu_offload_prefetch(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPipeline(**components)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        inputs = self.get_dummy_inputs("cpu")
+        image = sd_pipe.to(torch_device)(**inputs).images
+
+        sd_pipe.enable_model_cpu_offload(prefetch=True)
+        hooks = [sd_pipe.text_encoder._hf_hook, sd_pipe.unet._hf_hook, sd_pipe.vae._hf_hook]
+
+        for _ in range(2):
+            inputs = self.get_dummy_inputs("cpu")
+            image_offloaded = sd_pipe(**inputs).images
+            assert np.abs(image - image_offloaded).max() < 1e-4
+
+            # the hooks persist across calls and the models are back on the CPU, in pinned memory
+            assert hooks == [sd_pipe.text_encoder._hf_hook, sd_pipe.unet._hf_hook, sd_pipe.vae._hf_hook]
+            for module in sd_pipe.text_encoder, sd_pipe.unet, sd_pipe.vae:
+                assert module.device == torch.device("cpu")
+                assert all(param.is_pinned() for param in module.parameters())
+
     def test_fused_qkv_projections(self):
         device = "cpu"  # ensure determinism for the device-dependent torch.Generator
         components = self.get_dummy_components()
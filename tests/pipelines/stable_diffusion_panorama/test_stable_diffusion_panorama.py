@@ -29,6 +29,7 @@ from diffusers import (
     StableDiffusionPanoramaPipeline,
     UNet2DConditionModel,
 )
+from diffusers.pipelines.stable_diffusion_panorama.pipeline_stable_diffusion_panorama import MultiDiffusionViews
 from diffusers.utils.testing_utils import enable_full_determinism, nightly, require_torch_gpu, skip_mps, torch_device
 
 from ..pipeline_params import TEXT_TO_IMAGE_BATCH_PARAMS, TEXT_TO_IMAGE_IMAGE_PARAMS, TEXT_TO_IMAGE_PARAMS
@@ -207,6 +208,46 @@ class StableDiffusionPanoramaPipelineFastTests(PipelineLatentTesterMixin, Pipeli
 
         assert np.abs(image_slice.flatten() - expected_slice).max() < 1e-2
 
+    def test_stable_diffusion_panorama_wide_views_batch(self):
+        device = "cpu"  # ensure determinism for the device-dependent torch.Generator
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionPanoramaPipeline(**components)
+        sd_pipe = sd_pipe.to(device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        for circular_padding in [False, True]:
+            images = []
+            for view_batch_size in [1, 3]:
+                inputs = self.get_dummy_inputs(device)
+                inputs["width"] = 640
+                images.append(
+                    sd_pipe(**inputs, circular_padding=circular_padding, view_batch_size=view_batch_size).images
+                )
+
+            assert images[0].shape == (1, 64, 640, 3)
+            assert np.abs(images[0] - images[1]).max() < 1e-4
+
+    def test_multidiffusion_views(self):
+        latents = torch.randn(2, 4, 12, 20)
+        views = [(0, 8, 0, 8), (4, 12, 8, 16), (0, 8, 16, 24)]
+        multidiffusion_views = MultiDiffusionViews(views, 12, 20, window_size=8, circular_padding=True)
+
+        gathered = multidiffusion_views.gather(latents)
+        assert gathered.shape == (6, 4, 8, 8)
+        padded = torch.cat([latents, latents[..., :4]], dim=-1)
+        expected = torch.cat([padded[:, :, h_start:h_end, w_start:w_end] for h_start, h_end, w_start, w_end in views])
+        assert torch.equal(gathered, expected)
+
+        value = torch.zeros_like(padded)
+        count = torch.zeros_like(padded)
+        for view, (h_start, h_end, w_start, w_end) in zip(gathered.chunk(len(views)), views):
+            value[:, :, h_start:h_end, w_start:w_end] += view
+            count[:, :, h_start:h_end, w_start:w_end] += 1
+        value[..., :4] += value[..., 20:]
+        count[..., :4] += count[..., 20:]
+        expected = torch.where(count > 0, value / count, value)[..., :20]
+        assert torch.allclose(multidiffusion_views.scatter(gathered, latents), expected, atol=1e-6)
+
     def test_stable_diffusion_panorama_euler(self):
         device = "cpu"  # ensure determinism for the device-dependent torch.Generator
         components = self.get_dummy_components()
@@ -227,6 +268,36 @@ class StableDiffusionPanoramaPipelineFastTests(PipelineLatentTesterMixin, Pipeli
 
         assert np.abs(image_slice.flatten() - expected_slice).max() < 1e-2
 
+    def test_stable_diffusion_panorama_euler_generator_list(self):
+        device = "cpu"  # ensure determinism for the device-dependent torch.Generator
+        components = self.get_dummy_components()
+        components["scheduler"] = EulerAncestralDiscreteScheduler(
+            beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear"
+        )
+        sd_pipe = StableDiffusionPanoramaPipeline(**components)
+        sd_pipe = sd_pipe.to(device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        images = []
+        for view_batch_size in [1, 3]:
+            inputs = self.get_dummy_inputs(device)
+            inputs["prompt"] = [inputs["prompt"]] * 2
+            inputs["generator"] = [torch.Generator(device).manual_seed(i) for i in range(2)]
+            inputs["num_inference_steps"] = 2
+            inputs["width"] = 640
+            images.append(sd_pipe(**inputs, view_batch_size=view_batch_size).images)
+
+        assert images[0].shape == (2, 64, 640, 3)
+        assert np.abs(images[0] - images[1]).max() < 1e-4
+
+        # every image only draws its noise from its own generator
+        inputs = self.get_dummy_inputs(device)
+        inputs["generator"] = [torch.Generator(device).manual_seed(1)]
+        inputs["num_inference_steps"] = 2
+        inputs["width"] = 640
+        image = sd_pipe(**inputs).images
+        assert np.abs(images[0][1:] - image).max() < 5e-3
+
     def test_stable_diffusion_panorama_pndm(self):
         device = "cpu"  # ensure determinism for the device-dependent torch.Generator
         components = self.get_dummy_components()
@@ -24,9 +24,11 @@ from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProject
 
 from diffusers import (
     AutoencoderKL,
+    CompileManager,
     DDIMScheduler,
     DPMSolverMultistepScheduler,
     EulerDiscreteScheduler,
+    GuidancePolicy,
     HeunDiscreteScheduler,
     LCMScheduler,
     StableDiffusionXLImg2ImgPipeline,
@@ -38,6 +40,7 @@ from diffusers.utils.testing_utils import (
     enable_full_determinism,
     load_image,
     numpy_cosine_similarity_distance,
+    require_torch_2,
     require_torch_gpu,
     slow,
     torch_device,
@@ -281,6 +284,107 @@ class StableDiffusionXLPipelineFastTests(
         # make sure that it's equal
         assert np.abs(image_slice_1.flatten() - image_slice_2.flatten()).max() < 1e-4
 
+    def test_stable_diffusion_xl_prompt_embeds_cache(self):
+        components = self.get_dummy_components()
+        components["force_zeros_for_empty_prompt"] = False
+        sd_pipe = StableDiffusionXLPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        prompt = 2 * ["A painting of a squirrel eating a burger"]
+        expected_embeds = sd_pipe.encode_prompt(prompt, device=torch_device)
+
+        sd_pipe.enable_prompt_embeds_cache()
+        cache = sd_pipe.prompt_embeds_cache
+        for _ in range(2):
+            embeds = sd_pipe.encode_prompt(prompt, device=torch_device)
+            for embed, expected_embed in zip(embeds, expected_embeds):
+                assert torch.allclose(embed, expected_embed)
+
+        # one entry per text encoder for the prompt and for the negative prompt
+        assert (cache.hits, cache.misses) == (4, 4)
+        assert len(cache) == 4
+
+    def test_stable_diffusion_xl_guidance_policy(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionXLPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        unet_batch_sizes = []
+        sd_pipe.unet.register_forward_pre_hook(lambda module, args: unet_batch_sizes.append(args[0].shape[0]))
+
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        output = sd_pipe(**inputs).images
+        assert unet_batch_sizes == [2, 2, 2, 2]
+
+        unet_batch_sizes.clear()
+        inputs = self.get_dummy_inputs(torch_device)
+        inputs["num_inference_steps"] = 4
+        policy = GuidancePolicy(guidance_end=0.75, uncond_interval=2)
+        output_policy = sd_pipe(**inputs, guidance_policy=policy).images
+        assert unet_batch_sizes == [2, 1, 2, 1]
+
+        assert output_policy.shape == output.shape
+        assert np.abs(output - output_policy).max() > 1e-6
+
+    def test_stable_diffusion_xl_static_loop(self):
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionXLPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        for scheduler in [
+            EulerDiscreteScheduler.from_config(sd_pipe.scheduler.config),
+            DPMSolverMultistepScheduler.from_config(sd_pipe.scheduler.config),
+        ]:
+            sd_pipe.scheduler = scheduler
+
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["num_inference_steps"] = 4
+            output = sd_pipe(**inputs, denoising_end=0.8).images
+
+            sd_pipe.enable_static_loop()
+            inputs = self.get_dummy_inputs(torch_device)
+            inputs["num_inference_steps"] = 4
+            output_static = sd_pipe(**inputs, denoising_end=0.8).images
+            sd_pipe.disable_static_loop()
+
+            assert np.abs(output - output_static).max() < 1e-5, scheduler.__class__.__name__
+
+    @require_torch_2
+    def test_stable_diffusion_xl_compile_manager(self):
+        # the manager raises the recompile limit of dynamo for the whole process
+        config = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+        self.addCleanup(setattr, config, limit_name, getattr(config, limit_name))
+
+        components = self.get_dummy_components()
+        sd_pipe = StableDiffusionXLPipeline(**components)
+        sd_pipe = sd_pipe.to(torch_device)
+        sd_pipe.set_progress_bar_config(disable=None)
+
+        manager = CompileManager(resolutions=[(64, 64)], batch_sizes=[1], compile_kwargs={"backend": "eager"})
+        sd_pipe.enable_compile_manager(manager)
+
+        inputs = self.get_dummy_inputs(torch_device)
+        output = sd_pipe(**inputs).images
+        num_compilations = dict(manager.num_compilations)
+
+        time_ids = []
+        sd_pipe.unet.register_forward_pre_hook(
+            lambda module, args, kwargs: time_ids.append(kwargs["added_cond_kwargs"]["time_ids"]), with_kwargs=True
+        )
+        inputs = self.get_dummy_inputs(torch_device)
+        output_padded = sd_pipe(**inputs, height=48, width=32).images
+        assert output.shape == (1, 64, 64, 3)
+        assert output_padded.shape == (1, 48, 32, 3)
+        assert dict(manager.num_compilations) == num_compilations
+
+        # the micro-conditioning describes the bucket that is denoised
+        assert time_ids[0][0].tolist() == [64, 64, 0, 0, 64, 64]
+
     def test_attention_slicing_forward_pass(self):
         super().test_attention_slicing_forward_pass(expected_max_diff=3e-3)
 
@@ -202,6 +202,41 @@ class StableVideoDiffusionPipelineFastTests(PipelineTesterMixin, unittest.TestCa
         self.assertTrue(isinstance(output, np.ndarray))
         self.assertEqual(len(output.shape), 5)
 
+    def test_pil_output_type_streamed(self):
+        components = self.get_dummy_components()
+        pipe = self.pipeline_class(**components)
+        for component in pipe.components.values():
+            if hasattr(component, "set_default_attn_processor"):
+                component.set_default_attn_processor()
+
+        pipe.to(torch_device)
+        pipe.set_progress_bar_config(disable=None)
+
+        generator_device = "cpu"
+        inputs = self.get_dummy_inputs(generator_device)
+        inputs["output_type"] = "np"
+        inputs["decode_chunk_size"] = 1
+        expected = pipe(**inputs).frames
+
+        # the pil frames are decoded and converted one chunk at a time
+        inputs = self.get_dummy_inputs(generator_device)
+        inputs["output_type"] = "pil"
+        inputs["decode_chunk_size"] = 1
+        output = pipe(**inputs).frames
+
+        self.assertEqual(len(output), expected.shape[0])
+        self.assertEqual(len(output[0]), expected.shape[1])
+        output = np.stack([np.stack([np.array(frame) for frame in video]) for video in output])
+        max_diff = np.abs(output.astype(np.float32) - (expected * 255).round()).max()
+        self.assertLessEqual(max_diff, 1)
+
+        inputs = self.get_dummy_inputs(generator_device)
+        inputs["output_type"] = "latent"
+        latents = pipe(**inputs).frames
+        chunks = list(pipe.decode_latents_stream(latents, decode_chunk_size=1))
+        self.assertEqual(len(chunks), latents.shape[0] * latents.shape[1])
+        self.assertEqual(chunks[0].shape[0], 1)
+
     def test_dict_tuple_outputs_equivalent(self, expected_max_difference=1e-4):
         components = self.get_dummy_components()
         pipe = self.pipeline_class(**components)
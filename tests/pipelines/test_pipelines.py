@@ -1391,6 +1391,36 @@ class PipelineFastTests(unittest.TestCase):
 
         assert dict(ddim_config) == dict(ddim_config_2)
 
+    def test_load_components_in_parallel(self):
+        tokenizer = CLIPTokenizer.from_pretrained("hf-internal-testing/tiny-random-clip")
+        sd = StableDiffusionPipeline(
+            unet=self.dummy_cond_unet(),
+            scheduler=PNDMScheduler(skip_prk_steps=True),
+            vae=self.dummy_vae,
+            text_encoder=self.dummy_text_encoder,
+            tokenizer=tokenizer,
+            safety_checker=None,
+            feature_extractor=None,
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            sd.save_pretrained(tmpdirname)
+            sd = StableDiffusionPipeline.from_pretrained(tmpdirname)
+            sd_parallel = StableDiffusionPipeline.from_pretrained(tmpdirname, max_loading_workers=4)
+
+        expected_components = ["scheduler", "text_encoder", "tokenizer", "unet", "vae"]
+        assert sorted(sd_parallel.component_load_times.keys()) == expected_components
+        assert all(load_time >= 0 for load_time in sd_parallel.component_load_times.values())
+        assert list(sd_parallel.components.keys()) == list(sd.components.keys())
+
+        # the globally patched state of the meta device initialization must be restored
+        assert torch.nn.Linear(2, 2).weight.device.type == "cpu"
+
+        for name, component in sd.components.items():
+            if isinstance(component, torch.nn.Module):
+                for param, param_parallel in zip(component.parameters(), sd_parallel.components[name].parameters()):
+                    assert torch.equal(param, param_parallel), f"{name} was not loaded correctly"
+
     def test_save_safe_serialization(self):
         pipeline = StableDiffusionPipeline.from_pretrained("hf-internal-testing/tiny-stable-diffusion-torch")
         with tempfile.TemporaryDirectory() as tmpdirname:
@@ -209,6 +209,28 @@ class DEISMultistepSchedulerTest(SchedulerCommonTest):
         for num_inference_steps in [1, 2, 3, 5, 10, 50, 100, 999, 1000]:
             self.check_over_forward(num_inference_steps=num_inference_steps, time_step=0)
 
+    def test_coefficient_table(self):
+        model = self.dummy_model()
+        for solver_order in [1, 2, 3]:
+            for lower_order_final in [True, False]:
+                scheduler_config = self.get_scheduler_config(
+                    solver_order=solver_order, lower_order_final=lower_order_final
+                )
+                outputs = []
+                for use_coefficient_table in [True, False]:
+                    scheduler = self.scheduler_classes[0](**scheduler_config)
+                    scheduler.set_timesteps(10)
+                    if not use_coefficient_table:
+                        # fall back to the update methods
+                        scheduler._solver_coefficients = None
+
+                    sample = self.dummy_sample_deter
+                    for t in scheduler.timesteps[2:]:
+                        sample = scheduler.step(model(sample, t), t, sample).prev_sample
+                    outputs.append(sample)
+
+                assert torch.allclose(outputs[0], outputs[1], atol=1e-5)
+
     def test_full_loop_no_noise(self):
         sample = self.full_loop()
         result_mean = torch.mean(torch.abs(sample))
@@ -305,6 +305,99 @@ class DPMSolverMultistepSchedulerTest(SchedulerCommonTest):
 
         assert sample.dtype == torch.float16
 
+    def check_batched_step(self, **config):
+        scheduler_class = self.scheduler_classes[0]
+        scheduler_config = self.get_scheduler_config(**config)
+        num_inference_steps = 10
+        model = self.dummy_model()
+        sample = self.dummy_sample_deter
+        start_indices = [0, 3, 5, 0]
+
+        expected = []
+        for i, start_index in enumerate(start_indices):
+            scheduler = scheduler_class(**scheduler_config)
+            scheduler.set_timesteps(num_inference_steps)
+            output = sample[i : i + 1]
+            for t in scheduler.timesteps[start_index:]:
+                output = scheduler.step(model(output, t), t, output).prev_sample
+            expected.append(output)
+        expected = torch.cat(expected)
+
+        scheduler = scheduler_class(**scheduler_config)
+        scheduler.set_timesteps(num_inference_steps)
+        step_indices = torch.tensor(start_indices)
+        state = scheduler.create_state(sample)
+        output = sample.clone()
+        while (step_indices < num_inference_steps).any():
+            # only advance the samples that have not finished their trajectory yet
+            active = (step_indices < num_inference_steps).nonzero().flatten()
+            t = scheduler.timesteps[step_indices[active]]
+            step_output = scheduler.batched_step(
+                model(output[active], t), step_indices[active], output[active], state[active]
+            )
+            output[active] = step_output.prev_sample
+            state.model_outputs[active] = step_output.state.model_outputs
+            state.lower_order_nums[active] = step_output.state.lower_order_nums
+            step_indices[active] += 1
+
+        assert scheduler.step_index is None
+        assert torch.allclose(output, expected, atol=1e-5), "Batched outputs do not match sequential outputs"
+
+    def test_batched_step(self):
+        for solver_order in [1, 2, 3]:
+            for solver_type in ["midpoint", "heun"]:
+                for algorithm_type in ["dpmsolver", "dpmsolver++"]:
+                    self.check_batched_step(
+                        solver_order=solver_order, solver_type=solver_type, algorithm_type=algorithm_type
+                    )
+        self.check_batched_step(lower_order_final=True)
+        self.check_batched_step(euler_at_final=True, prediction_type="v_prediction")
+        self.check_batched_step(thresholding=True, prediction_type="sample", sample_max_value=0.5)
+
+    def check_coefficient_table(self, **config):
+        scheduler_class = self.scheduler_classes[0]
+        scheduler_config = self.get_scheduler_config(**config)
+        num_inference_steps = 10
+        model = self.dummy_model()
+
+        for start_index in [0, 3]:
+            outputs = []
+            for use_coefficient_table in [True, False]:
+                scheduler = scheduler_class(**scheduler_config)
+                scheduler.set_timesteps(num_inference_steps)
+                if not use_coefficient_table:
+                    # fall back to the update methods
+                    scheduler._solver_coefficients = None
+
+                sample = self.dummy_sample_deter
+                for t in scheduler.timesteps[start_index:]:
+                    generator = torch.manual_seed(int(t))
+                    sample = scheduler.step(model(sample, t), t, sample, generator=generator).prev_sample
+                outputs.append(sample)
+
+            assert torch.allclose(outputs[0], outputs[1], atol=1e-5), "Coefficient table does not match the updates"
+
+    def test_coefficient_table(self):
+        for solver_order in [1, 2, 3]:
+            for solver_type in ["midpoint", "heun"]:
+                for algorithm_type in ["dpmsolver", "dpmsolver++", "sde-dpmsolver++"]:
+                    if solver_order == 3 and algorithm_type == "sde-dpmsolver++":
+                        continue
+                    self.check_coefficient_table(
+                        solver_order=solver_order, solver_type=solver_type, algorithm_type=algorithm_type
+                    )
+        self.check_coefficient_table(lower_order_final=True, final_sigmas_type="zero")
+        self.check_coefficient_table(euler_at_final=True, prediction_type="v_prediction")
+
+    def test_batched_state_cat(self):
+        scheduler = self.scheduler_classes[0](**self.get_scheduler_config())
+        state = scheduler.create_state(self.dummy_sample)
+        assert state.model_outputs.shape == (4, 2, 3, 8, 8)
+
+        merged = type(state).cat([state[:1], state[1:]])
+        assert merged.model_outputs.shape == state.model_outputs.shape
+        assert merged.lower_order_nums.shape == (4,)
+
     def test_duplicated_timesteps(self, **config):
         for scheduler_class in self.scheduler_classes:
             scheduler_config = self.get_scheduler_config(**config)
@@ -189,3 +189,39 @@ class EulerDiscreteSchedulerTest(SchedulerCommonTest):
 
         assert abs(result_sum.item() - 57062.9297) < 1e-2, f" expected result sum 57062.9297, but get {result_sum}"
         assert abs(result_mean.item() - 74.3007) < 1e-3, f" expected result mean 74.3007, but get {result_mean}"
+
+    def test_batched_step(self):
+        scheduler_class = self.scheduler_classes[0]
+        model = self.dummy_model()
+        sample = self.dummy_sample_deter
+        start_indices = [0, 3, 5, 0]
+
+        for prediction_type in ["epsilon", "v_prediction"]:
+            scheduler_config = self.get_scheduler_config(prediction_type=prediction_type)
+
+            expected = []
+            for i, start_index in enumerate(start_indices):
+                scheduler = scheduler_class(**scheduler_config)
+                scheduler.set_timesteps(self.num_inference_steps)
+                output = sample[i : i + 1]
+                for t in scheduler.timesteps[start_index:]:
+                    model_input = scheduler.scale_model_input(output, t)
+                    output = scheduler.step(model(model_input, t), t, output).prev_sample
+                expected.append(output)
+            expected = torch.cat(expected)
+
+            scheduler = scheduler_class(**scheduler_config)
+            scheduler.set_timesteps(self.num_inference_steps)
+            step_indices = torch.tensor(start_indices)
+            output = sample.clone()
+            while (step_indices < self.num_inference_steps).any():
+                active = (step_indices < self.num_inference_steps).nonzero().flatten()
+                t = scheduler.timesteps[step_indices[active]]
+                model_input = scheduler.batched_scale_model_input(output[active], step_indices[active])
+                output[active] = scheduler.batched_step(
+                    model(model_input, t), step_indices[active], output[active]
+                ).prev_sample
+                step_indices[active] += 1
+
+            assert scheduler.step_index is None
+            assert torch.allclose(output, expected, atol=1e-5), "Batched outputs do not match sequential outputs"
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 from diffusers import LMSDiscreteScheduler
@@ -41,6 +42,25 @@ class LMSDiscreteSchedulerTest(SchedulerCommonTest):
         for t in [0, 500, 800]:
             self.check_over_forward(time_step=t)
 
+    def test_lms_coefficients(self):
+        scheduler = self.scheduler_classes[0](**self.get_scheduler_config(use_karras_sigmas=True))
+        scheduler.set_timesteps(self.num_inference_steps)
+        sigmas = scheduler.sigmas.numpy().astype(np.float64)
+
+        # Gauss-Legendre quadrature is exact for the polynomial integrands
+        points, weights = np.polynomial.legendre.leggauss(4)
+        for t in range(self.num_inference_steps):
+            order = min(t + 1, 4)
+            lower, upper = sigmas[t], sigmas[t + 1]
+            taus = (upper - lower) / 2 * points + (upper + lower) / 2
+            for current_order in range(order):
+                basis = np.ones_like(taus)
+                for k in range(order):
+                    if k != current_order:
+                        basis *= (taus - sigmas[t - k]) / (sigmas[t - current_order] - sigmas[t - k])
+                expected = (upper - lower) / 2 * np.sum(weights * basis)
+                assert abs(scheduler.get_lms_coefficient(order, t, current_order) - expected) < 1e-6
+
     def test_full_loop_no_noise(self):
         scheduler_class = self.scheduler_classes[0]
         scheduler_config = self.get_scheduler_config()
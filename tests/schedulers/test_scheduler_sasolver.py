@@ -74,6 +74,30 @@ class SASolverSchedulerTest(SchedulerCommonTest):
         for prediction_type in ["epsilon", "v_prediction"]:
             self.check_over_configs(prediction_type=prediction_type)
 
+    def test_coefficient_table(self):
+        model = self.dummy_model()
+        for predictor_order, corrector_order in [(1, 1), (2, 2), (3, 3), (3, 1)]:
+            for algorithm_type in ["data_prediction", "noise_prediction"]:
+                scheduler_config = self.get_scheduler_config(
+                    predictor_order=predictor_order, corrector_order=corrector_order, algorithm_type=algorithm_type
+                )
+                outputs = []
+                for use_coefficient_table in [True, False]:
+                    scheduler = self.scheduler_classes[0](**scheduler_config)
+                    scheduler.set_timesteps(self.num_inference_steps)
+                    if not use_coefficient_table:
+                        # fall back to the update methods
+                        scheduler._predictor_coefficients = None
+                        scheduler._corrector_coefficients = None
+
+                    sample = self.dummy_sample_deter
+                    for t in scheduler.timesteps[2:]:
+                        generator = torch.manual_seed(int(t))
+                        sample = scheduler.step(model(sample, t), t, sample, generator=generator).prev_sample
+                    outputs.append(sample)
+
+                assert torch.allclose(outputs[0], outputs[1], atol=1e-4)
+
     def test_full_loop_no_noise(self):
         scheduler_class = self.scheduler_classes[0]
         scheduler_config = self.get_scheduler_config()
@@ -203,6 +203,44 @@ class UniPCMultistepSchedulerTest(SchedulerCommonTest):
         for num_inference_steps in [1, 2, 3, 5, 10, 50, 100, 999, 1000]:
             self.check_over_forward(num_inference_steps=num_inference_steps, time_step=0)
 
+    def test_coefficient_table(self):
+        model = self.dummy_model()
+        for solver_order in [1, 2, 3]:
+            for predict_x0 in [True, False]:
+                for solver_type in ["bh1", "bh2"]:
+                    scheduler_config = self.get_scheduler_config(
+                        solver_order=solver_order, predict_x0=predict_x0, solver_type=solver_type
+                    )
+                    outputs = []
+                    for use_coefficient_table in [True, False]:
+                        scheduler = self.scheduler_classes[0](**scheduler_config)
+                        scheduler.set_timesteps(10)
+                        if not use_coefficient_table:
+                            # fall back to the update methods
+                            scheduler._predictor_coefficients = None
+                            scheduler._corrector_coefficients = None
+
+                        sample = self.dummy_sample_deter
+                        for t in scheduler.timesteps[2:]:
+                            sample = scheduler.step(model(sample, t), t, sample).prev_sample
+                        outputs.append(sample)
+
+                    assert torch.allclose(outputs[0], outputs[1], atol=1e-5)
+
+    def test_fewer_steps_than_solver_order(self):
+        model = self.dummy_model()
+        for solver_order in [2, 3]:
+            for num_inference_steps in range(1, solver_order):
+                scheduler = self.scheduler_classes[0](**self.get_scheduler_config(solver_order=solver_order))
+                scheduler.set_timesteps(num_inference_steps)
+
+                sample = self.dummy_sample_deter
+                for t in scheduler.timesteps:
+                    sample = scheduler.step(model(sample, t), t, sample).prev_sample
+
+                assert sample.shape == self.dummy_sample_deter.shape
+                assert not torch.isnan(sample).any()
+
     def test_full_loop_no_noise(self):
         sample = self.full_loop()
         result_mean = torch.mean(torch.abs(sample))